@@ -2,12 +2,17 @@ import os
 import pulumi
 
 from alb import Alb
+from app_image import AppImage
+from cache import Cache
+from cdn import Cdn
 from db import Db
+from lookups import AVAILABILITY_ZONES_TTL, LookupCache
+from monitoring import Monitoring
 from nat import Nat
 from sec_group import SecGroup
+from service import Service, validate_services
 from vpc import Vpc
-from web import Web
-import base64
+from web import Web, instance_architecture
 
 module_path = os.path.dirname(os.path.abspath(__file__))
 
@@ -15,20 +20,128 @@ config = pulumi.Config()
 project_name = config.require("projectName")
 aws_region = config.require("awsRegion")
 vpc_cidr = config.require("vpcCidr")
-pub_sub_nat1 = config.require("pubSubNat1")
-pub_sub_nat2 = config.require("pubSubNat2")
-priv_sub_web1 = config.require("privSubWeb1")
-priv_sub_web2 = config.require("privSubWeb2")
-priv_sub_db1 = config.require("privSubDb1")
-priv_sub_db2 = config.require("privSubDb2")
+az_count = config.get_int("azCount") or 2
+subnet_cidrs = config.get_object("subnetCidrs")
+single_nat = config.get_bool("singleNat") or False
+vpc_endpoints = config.get_bool("vpcEndpoints") or False
+ipv6 = config.get_bool("ipv6") or False
+vpc_interface_endpoints = config.get_object("vpcInterfaceEndpoints")
 db_username = config.require("dbUsername")
 db_password = config.require_secret("dbPassword")
 web_instance_type = config.require("webInstanceType")
 key_name = config.require("keyName")
+web_instance_types = config.get_object("webInstanceTypes") or []
+web_on_demand_base_capacity = config.get_int("webOnDemandBaseCapacity") or 0
+web_on_demand_percentage_above_base = config.get_int("webOnDemandPercentageAboveBase")
+if web_on_demand_percentage_above_base is None:
+    web_on_demand_percentage_above_base = 100
+web_spot_allocation_strategy = config.get("webSpotAllocationStrategy") or "capacity-optimized"
 web_min_size = config.get_float("webMinSize") or 2
 web_max_size = config.get_float("webMaxSize") or 4
 web_desired_capacity = config.get_float("webDesiredCapacity") or web_min_size
 web_cpu_target = config.get_float("webCpuTarget") or 50
+web_request_count_target = config.get_float("webRequestCountTarget")
+web_predictive_scaling_mode = config.get("webPredictiveScalingMode")
+web_predictive_scaling_target = config.get_float("webPredictiveScalingTarget")
+web_scheduled_actions = config.get_object("webScheduledActions") or []
+web_warm_pool_state = config.get("webWarmPoolState")
+web_warm_pool_min_size = config.get_float("webWarmPoolMinSize") or 0
+web_warm_pool_max_prepared_capacity = config.get_float("webWarmPoolMaxPreparedCapacity")
+web_refresh_min_healthy_percentage = config.get_int("webRefreshMinHealthyPercentage") or 90
+web_refresh_checkpoints = config.get_object("webRefreshCheckpoints")
+web_refresh_checkpoint_delay = config.get_int("webRefreshCheckpointDelay") or 300
+web_refresh_instance_warmup = config.get_int("webRefreshInstanceWarmup")
+web_instance_warmup = config.get_int("webInstanceWarmup")
+web_launch_hook_timeout = config.get_int("webLaunchHookTimeout")
+if web_launch_hook_timeout is None:
+    web_launch_hook_timeout = 600
+web_root_volume_size = config.get_int("webRootVolumeSize") or 8
+web_root_volume_iops = config.get_int("webRootVolumeIops") or 3000
+web_root_volume_throughput = config.get_int("webRootVolumeThroughput") or 125
+web_ebs_optimized = config.get_bool("webEbsOptimized")
+web_detailed_monitoring = config.get_bool("webDetailedMonitoring")
+if web_detailed_monitoring is None:
+    web_detailed_monitoring = True
+web_cpu_credits = config.get("webCpuCredits")
+web_metadata_hop_limit = config.get_int("webMetadataHopLimit") or 2
+alb_certificate_arn = config.get("albCertificateArn")
+alb_idle_timeout = config.get_int("albIdleTimeout") or 60
+alb_load_balancing_algorithm = config.get("albLoadBalancingAlgorithm") or "round_robin"
+alb_slow_start = config.get_int("albSlowStart") or 0
+alb_deregistration_delay = config.get_int("albDeregistrationDelay") or 300
+alb_health_check_path = config.get("albHealthCheckPath") or "/"
+alb_health_check_interval = config.get_int("albHealthCheckInterval") or 30
+alb_health_check_timeout = config.get_int("albHealthCheckTimeout") or 5
+alb_healthy_threshold = config.get_int("albHealthyThreshold") or 5
+alb_unhealthy_threshold = config.get_int("albUnhealthyThreshold") or 2
+alb_access_logs = config.get_bool("albAccessLogs") or False
+alb_access_logs_retention_days = config.get_int("albAccessLogsRetentionDays") or 30
+web_app_module = config.get("webAppModule") or "app:app"
+web_workers_per_cpu = config.get_int("webWorkersPerCpu") or 2
+web_worker_threads = config.get_int("webWorkerThreads") or 1
+web_worker_timeout = config.get_int("webWorkerTimeout") or 30
+# keep backend keepalive above the alb idle timeout to avoid 502s
+web_keepalive_timeout = config.get_int("webKeepaliveTimeout") or alb_idle_timeout + 15
+cdn_enabled = config.get_bool("cdnEnabled") or False
+cdn_price_class = config.get("cdnPriceClass") or "PriceClass_100"
+cdn_origin_shield_region = config.get("cdnOriginShieldRegion")
+cdn_cache_behaviors = config.get_object("cdnCacheBehaviors")
+cdn_static_dir = config.get("cdnStaticDir")
+cdn_alb_origin_protocol_policy = config.get("cdnAlbOriginProtocolPolicy")
+cdn_alb_origin_domain = config.get("cdnAlbOriginDomain")
+cdn_alb_origin_zone_id = config.get("cdnAlbOriginZoneId")
+service_registry = config.get_object("services") or []
+validate_services(service_registry)
+cache_node_type = config.get("cacheNodeType") or "cache.t3.micro"
+cache_shard_count = config.get_int("cacheShardCount") or 1
+cache_replica_count = config.get_int("cacheReplicaCount")
+if cache_replica_count is None:
+    cache_replica_count = 1
+db_replica_count = config.get_int("dbReplicaCount") or 0
+app_image_version = config.get("appImageVersion")
+db_proxy_enabled = config.get_bool("dbProxyEnabled") or False
+db_engine = config.get("dbEngine") or "mysql"
+db_instance_class = config.get("dbInstanceClass")
+db_storage_type = config.get("dbStorageType") or "gp3"
+db_allocated_storage = config.get_int("dbAllocatedStorage") or 20
+db_max_allocated_storage = config.get_int("dbMaxAllocatedStorage")
+db_iops = config.get_int("dbIops")
+db_storage_throughput = config.get_int("dbStorageThroughput")
+db_multi_az = config.get_bool("dbMultiAz") or False
+db_performance_insights = config.get_bool("dbPerformanceInsights") or False
+db_serverless_min_capacity = config.get_float("dbServerlessMinCapacity") or 0.5
+db_serverless_max_capacity = config.get_float("dbServerlessMaxCapacity") or 4
+db_parameters = config.get_object("dbParameters") or {}
+monitoring_alarm_email = config.get("monitoringAlarmEmail")
+monitoring_latency_p50_threshold = config.get_float("monitoringLatencyP50Threshold") or 0.3
+monitoring_latency_p99_threshold = config.get_float("monitoringLatencyP99Threshold") or 1.0
+monitoring_5xx_threshold = config.get_float("monitoring5xxThreshold") or 10
+monitoring_unhealthy_hosts_threshold = config.get_float("monitoringUnhealthyHostsThreshold") or 1
+monitoring_db_connections_threshold = config.get_float("monitoringDbConnectionsThreshold") or 0.8
+monitoring_cpu_credit_threshold = config.get_float("monitoringCpuCreditThreshold") or 20
+lookup_cache_ttl = config.get_int("lookupCacheTtl") or AVAILABILITY_ZONES_TTL
+availability_zones = config.get_object("availabilityZones")
+# amis pinned per architecture instead of the latest amazon linux 2
+web_ami_ids = {
+    "x86_64": config.get("webAmiId"),
+    "arm64": config.get("webArm64AmiId"),
+}
+
+# lookups are cached per stack next to the program; LOOKUP_CACHE_FILE moves
+# the cache (empty to disable it) and LOOKUP_REFRESH=ami,availability_zones
+# or LOOKUP_REFRESH=all looks them up again
+lookup_cache_file = os.environ.get("LOOKUP_CACHE_FILE",
+    os.path.join(module_path, f"Pulumi.{pulumi.get_stack()}.lookups.json"))
+lookup_cache = LookupCache(
+    lookup_cache_file or None,
+    aws_region,
+    ttl=lookup_cache_ttl,
+    refresh=os.environ.get("LOOKUP_REFRESH", ""),
+    pins={
+        "availability_zones": availability_zones,
+    },
+)
+
 
 vpc = Vpc(
     "vpc",
@@ -36,12 +149,10 @@ vpc = Vpc(
         "awsRegion": aws_region,
         "projectName": project_name,
         "vpcCidr": vpc_cidr,
-        "pubSubNat1": pub_sub_nat1,
-        "pubSubNat2": pub_sub_nat2,
-        "privSubWeb1": priv_sub_web1,
-        "privSubWeb2": priv_sub_web2,
-        "privSubDb1": priv_sub_db1,
-        "privSubDb2": priv_sub_db2,
+        "azCount": az_count,
+        "subnetCidrs": subnet_cidrs,
+        "ipv6": ipv6,
+        "lookupCache": lookup_cache,
     },
 )
 nat = Nat(
@@ -49,46 +160,177 @@ nat = Nat(
     {
         "igw": vpc.internetGateway,
         "vpcId": vpc.vpcId,
-        "pubSubNat1": vpc.pubSubNat1Id,
-        "pubSubNat2": vpc.pubSubNat2Id,
-        "privSubWeb1": vpc.privSubWeb1Id,
-        "privSubWeb2": vpc.privSubWeb2Id,
-        "privSubDb1": vpc.privSubDb1Id,
-        "privSubDb2": vpc.privSubDb2Id,
+        "pubSubNats": vpc.pubSubNatIds,
+        "privSubWebs": vpc.privSubWebIds,
+        "privSubDbs": vpc.privSubDbIds,
+        "singleNat": single_nat,
+        "awsRegion": vpc.awsRegion,
+        "vpcCidr": vpc_cidr,
+        "vpcEndpoints": vpc_endpoints,
+        "interfaceEndpoints": vpc_interface_endpoints,
+        "ipv6": vpc.ipv6,
     },
 )
-sec_group = SecGroup("secGroup", {"vpcId": vpc.vpcId})
+sec_group = SecGroup("secGroup", {"vpcId": vpc.vpcId, "ipv6": vpc.ipv6})
 alb = Alb(
     "alb",
     {
         "projectName": vpc.projectName,
         "vpcId": vpc.vpcId,
         "albSecGroupId": sec_group.albSecGroupId,
-        "pubSubNat1": vpc.pubSubNat1Id,
-        "pubSubNat2": vpc.pubSubNat2Id,
+        "ipv6": vpc.ipv6,
+        "pubSubNats": vpc.pubSubNatIds,
+        "certificateArn": alb_certificate_arn,
+        "idleTimeout": alb_idle_timeout,
+        "loadBalancingAlgorithm": alb_load_balancing_algorithm,
+        "slowStart": alb_slow_start,
+        "deregistrationDelay": alb_deregistration_delay,
+        "healthCheckPath": alb_health_check_path,
+        "healthCheckInterval": alb_health_check_interval,
+        "healthCheckTimeout": alb_health_check_timeout,
+        "healthyThreshold": alb_healthy_threshold,
+        "unhealthyThreshold": alb_unhealthy_threshold,
+        "awsRegion": vpc.awsRegion,
+        "accessLogs": alb_access_logs,
+        "accessLogsRetentionDays": alb_access_logs_retention_days,
+        "lookupCache": lookup_cache,
     },
 )
-
-user_data_file = os.path.join(module_path, "install_snakegame.sh")
-
-web = Web(
-    "web",
+cache = Cache(
+    "cache",
     {
         "projectName": vpc.projectName,
-        "webSecGroupId": sec_group.webSecGroupId,
-        "privSubWeb1": vpc.privSubWeb1Id,
-        "privSubWeb2": vpc.privSubWeb2Id,
-        "targetGroupArn": alb.targetGroupArn,
-        "instanceType": web_instance_type,
-        "keyName": key_name,
-        "userData": base64.b64encode(open(user_data_file, "rb").read()).decode(),
-        "minSize": web_min_size,
-        "maxSize": web_max_size,
-        "desiredCapacity": web_desired_capacity,
-        "cpuTarget": web_cpu_target,
+        "privSubDbs": vpc.privSubDbIds,
+        "cacheSecGroupId": sec_group.cacheSecGroupId,
+        "nodeType": cache_node_type,
+        "shardCount": cache_shard_count,
+        "replicaCount": cache_replica_count,
     },
-    pulumi.ResourceOptions(depends_on=[nat])
 )
+
+# with a pre-baked image the instances only configure and start the app,
+# otherwise they install it at boot on stock amazon linux first
+app_image = None
+bootstrap_scripts = [
+    os.path.join(module_path, "install_snakegame.sh"),
+    os.path.join(module_path, "start_snakegame.sh"),
+    os.path.join(module_path, "ready_snakegame.sh"),
+]
+if app_image_version:
+    # graviton types in the mixed instances group need an arm64 image too
+    arm64_types = [t["instanceType"] for t in web_instance_types
+                   if instance_architecture(t["instanceType"]) == "arm64"]
+    app_image = AppImage(
+        "appImage",
+        {
+            "projectName": vpc.projectName,
+            "awsRegion": vpc.awsRegion,
+            "version": app_image_version,
+            "subnetId": vpc.privSubWebIds[0],
+            "securityGroupId": sec_group.webSecGroupId,
+            "instanceType": web_instance_type,
+            "architectures": ["x86_64", "arm64"] if arm64_types else ["x86_64"],
+            "arm64InstanceType": arm64_types[0] if arm64_types else None,
+            "egressDependencies": nat.webEgress,
+            "lookupCache": lookup_cache,
+        },
+    )
+    bootstrap_scripts = bootstrap_scripts[1:]
+
+web_args = {
+    "projectName": vpc.projectName,
+    "webSecGroupId": sec_group.webSecGroupId,
+    "privSubWebs": vpc.privSubWebIds,
+    "targetGroupArn": alb.targetGroupArn,
+    "targetGroupArnSuffix": alb.targetGroupArnSuffix,
+    "albArnSuffix": alb.albArnSuffix,
+    "instanceType": web_instance_type,
+    "instanceTypes": web_instance_types,
+    "onDemandBaseCapacity": web_on_demand_base_capacity,
+    "onDemandPercentageAboveBase": web_on_demand_percentage_above_base,
+    "spotAllocationStrategy": web_spot_allocation_strategy,
+    "imageId": app_image.imageId if app_image else web_ami_ids["x86_64"],
+    "arm64ImageId": app_image.imageIds.get("arm64") if app_image else web_ami_ids["arm64"],
+    "keyName": key_name,
+    "rootVolumeSize": web_root_volume_size,
+    "rootVolumeIops": web_root_volume_iops,
+    "rootVolumeThroughput": web_root_volume_throughput,
+    "ebsOptimized": web_ebs_optimized,
+    "detailedMonitoring": web_detailed_monitoring,
+    "cpuCredits": web_cpu_credits,
+    "metadataHopLimit": web_metadata_hop_limit,
+    "bootstrapScripts": bootstrap_scripts,
+    "bootstrapEnv": {
+            "CACHE_PRIMARY_ENDPOINT": cache.cachePrimaryEndpoint,
+            "CACHE_READER_ENDPOINT": cache.cacheReaderEndpoint,
+        },
+    "appModule": web_app_module,
+    "workersPerCpu": web_workers_per_cpu,
+    "workerThreads": web_worker_threads,
+    "workerTimeout": web_worker_timeout,
+    "keepaliveTimeout": web_keepalive_timeout,
+    "minSize": web_min_size,
+    "maxSize": web_max_size,
+    "desiredCapacity": web_desired_capacity,
+    "cpuTarget": web_cpu_target,
+    "requestCountTarget": web_request_count_target,
+    "predictiveScalingMode": web_predictive_scaling_mode,
+    "predictiveScalingTarget": web_predictive_scaling_target,
+    "scheduledActions": web_scheduled_actions,
+    "warmPoolState": web_warm_pool_state,
+    "warmPoolMinSize": web_warm_pool_min_size,
+    "warmPoolMaxPreparedCapacity": web_warm_pool_max_prepared_capacity,
+    "refreshMinHealthyPercentage": web_refresh_min_healthy_percentage,
+    "refreshCheckpoints": web_refresh_checkpoints,
+    "refreshCheckpointDelay": web_refresh_checkpoint_delay,
+    "refreshInstanceWarmup": web_refresh_instance_warmup,
+    "instanceWarmup": web_instance_warmup,
+    "launchHookTimeout": web_launch_hook_timeout,
+    "egressDependencies": nat.webEgress,
+    "lookupCache": lookup_cache,
+}
+web = Web("web", web_args)
+
+# further services sharing the alb, each with its own target group, listener
+# rule and autoscaling group; the web tier settings above are the defaults,
+# scaling is set per service
+services = {}
+for service in service_registry:
+    services[service["name"]] = Service(
+        f"service-{service["name"]}",
+        {
+            "projectName": vpc.projectName,
+            "serviceName": service["name"],
+            "vpcId": vpc.vpcId,
+            "listenerArn": alb.listenerArn,
+            "albArnSuffix": alb.albArnSuffix,
+            "priority": service["priority"],
+            "hostHeaders": service.get("hostHeaders"),
+            "pathPatterns": service.get("pathPatterns"),
+            "loadBalancingAlgorithm": alb_load_balancing_algorithm,
+            "slowStart": alb_slow_start,
+            "deregistrationDelay": alb_deregistration_delay,
+            "healthCheckPath": service.get("healthCheckPath", alb_health_check_path),
+            "healthCheckInterval": alb_health_check_interval,
+            "healthCheckTimeout": alb_health_check_timeout,
+            "healthyThreshold": alb_healthy_threshold,
+            "unhealthyThreshold": alb_unhealthy_threshold,
+            "web": {
+                **web_args,
+                "instanceType": service.get("instanceType", web_instance_type),
+                "instanceTypes": [],
+                "appModule": service.get("appModule", web_app_module),
+                "minSize": service.get("minSize", 1),
+                "maxSize": service.get("maxSize", 2),
+                "desiredCapacity": service.get("desiredCapacity", service.get("minSize", 1)),
+                "cpuTarget": service.get("cpuTarget", web_cpu_target),
+                "requestCountTarget": service.get("requestCountTarget"),
+                "predictiveScalingMode": None,
+                "scheduledActions": [],
+                "warmPoolState": None,
+            },
+        },
+    )
 db = Db(
     "db",
     {
@@ -96,8 +338,83 @@ db = Db(
         "dbUsername": db_username,
         "dbPassword": db_password,
         "dbSecGroupId": sec_group.dbSecGroupId,
-        "privSubDb1": vpc.privSubDb1Id,
-        "privSubDb2": vpc.privSubDb2Id,
+        "privSubDbs": vpc.privSubDbIds,
+        "availabilityZones": vpc.availabilityZones,
+        "replicaCount": db_replica_count,
+        "proxyEnabled": db_proxy_enabled,
+        "engine": db_engine,
+        "instanceClass": db_instance_class,
+        "storageType": db_storage_type,
+        "allocatedStorage": db_allocated_storage,
+        "maxAllocatedStorage": db_max_allocated_storage,
+        "iops": db_iops,
+        "storageThroughput": db_storage_throughput,
+        "multiAz": db_multi_az,
+        "performanceInsights": db_performance_insights,
+        "serverlessMinCapacity": db_serverless_min_capacity,
+        "serverlessMaxCapacity": db_serverless_max_capacity,
+        "parameters": db_parameters,
+    },
+)
+monitoring = Monitoring(
+    "monitoring",
+    {
+        "projectName": vpc.projectName,
+        "awsRegion": vpc.awsRegion,
+        "albArnSuffix": alb.albArnSuffix,
+        "targetGroupArnSuffix": alb.targetGroupArnSuffix,
+        "autoscalingGroupName": web.autoscalingGroupName,
+        "webInstanceType": web_instance_type,
+        "dbIdentifier": db.dbIdentifier,
+        "dbEngine": db_engine,
+        "dbInstanceIdentifiers": db.dbInstanceIdentifiers,
+        "dbInstanceClass": db.dbInstanceClass,
+        "dbMaxConnections": db.dbMaxConnections,
+        "alarmEmail": monitoring_alarm_email,
+        "latencyP50Threshold": monitoring_latency_p50_threshold,
+        "latencyP99Threshold": monitoring_latency_p99_threshold,
+        "http5xxThreshold": monitoring_5xx_threshold,
+        "unhealthyHostsThreshold": monitoring_unhealthy_hosts_threshold,
+        "dbConnectionsThreshold": monitoring_db_connections_threshold,
+        "cpuCreditThreshold": monitoring_cpu_credit_threshold,
     },
 )
+if cdn_enabled:
+    cdn = Cdn(
+        "cdn",
+        {
+            "projectName": vpc.projectName,
+            "albDns": alb.albDns,
+            "albZoneId": alb.albZoneId,
+            "albCertificateArn": alb_certificate_arn,
+            "albOriginDomain": cdn_alb_origin_domain,
+            "albOriginZoneId": cdn_alb_origin_zone_id,
+            "albOriginProtocolPolicy": cdn_alb_origin_protocol_policy,
+            "staticDir": os.path.join(module_path, cdn_static_dir) if cdn_static_dir else None,
+            "priceClass": cdn_price_class,
+            "originShieldRegion": cdn_origin_shield_region,
+            "cacheBehaviors": cdn_cache_behaviors,
+        },
+    )
 pulumi.export("albDns", alb.albDns)
+pulumi.export("albUrl", pulumi.Output.concat("https://" if alb_certificate_arn else "http://", alb.albDns, "/"))
+pulumi.export("webAutoscalingGroupName", web.autoscalingGroupName)
+if alb_access_logs:
+    pulumi.export("albAccessLogsBucket", alb.accessLogsBucket)
+if cdn_enabled:
+    pulumi.export("cdnDomain", cdn.cdnDomain)
+    pulumi.export("staticBucketName", cdn.staticBucketName)
+if app_image:
+    pulumi.export("appImageId", app_image.imageId)
+pulumi.export("cachePrimaryEndpoint", cache.cachePrimaryEndpoint)
+pulumi.export("cacheReaderEndpoint", cache.cacheReaderEndpoint)
+pulumi.export("dbWriterEndpoint", db.dbWriterEndpoint)
+pulumi.export("dbReaderEndpoints", db.dbReaderEndpoints)
+pulumi.export("dbProxyEndpoint", db.dbProxyEndpoint)
+pulumi.export("dbProxyReaderEndpoint", db.dbProxyReaderEndpoint)
+if services:
+    pulumi.export("serviceAutoscalingGroups", {
+        service_name: service.autoscalingGroupName for service_name, service in services.items()
+    })
+pulumi.export("dashboardName", monitoring.dashboardName)
+pulumi.export("alarmTopicArn", monitoring.alarmTopicArn)
@@ -1,68 +1,198 @@
+import json
 import pulumi
 from pulumi import Input
-from typing import Optional, Dict, TypedDict, Any
+from typing import Optional, Dict, List, TypedDict, Any
 import pulumi_aws as aws
+from lookups import LookupCache
+
+# key prefix of the access logs in the log bucket
+ACCESS_LOGS_PREFIX = "alb"
+
+def validate_slow_start(algorithm: Input[str], slow_start: Input[int]) -> None:
+    """Elastic load balancing rejects slow start on target groups routing to
+    the least outstanding requests, fail before the target group is created."""
+    if algorithm == "least_outstanding_requests" and isinstance(slow_start, int) and slow_start > 0:
+        raise ValueError(f"slowStart {slow_start} cannot be combined with the least_outstanding_requests "
+                         "algorithm; set slowStart to 0 or use round_robin")
 
 class AlbArgs(TypedDict, total=False):
     projectName: Input[Any]
-    pubSubNat1: Input[Any]
-    pubSubNat2: Input[Any]
+    pubSubNats: List[Input[Any]]
     vpcId: Input[Any]
     albSecGroupId: Input[Any]
+    ipv6: bool
+    certificateArn: Input[str]
+    sslPolicy: Input[str]
+    idleTimeout: Input[int]
+    loadBalancingAlgorithm: Input[str]
+    slowStart: Input[int]
+    deregistrationDelay: Input[int]
+    healthCheckPath: Input[str]
+    healthCheckInterval: Input[int]
+    healthCheckTimeout: Input[int]
+    healthyThreshold: Input[int]
+    unhealthyThreshold: Input[int]
+    awsRegion: Input[Any]
+    accessLogs: bool
+    accessLogsRetentionDays: int
+    lookupCache: LookupCache
 
 class Alb(pulumi.ComponentResource):
     def __init__(self, name: str, args: AlbArgs, opts:Optional[pulumi.ResourceOptions] = None):
-        super().__init__("components:index:Alb", name, args, opts)
+        super().__init__("components:index:Alb", name, None, opts)
+
+        # access logs delivered every 5 minutes to a private bucket, kept for
+        # accessLogsRetentionDays; see tools/alb_logs.py to analyze them
+        access_logs = None
+        log_bucket = None
+        log_dependencies = []
+        if args.get("accessLogs"):
+            log_bucket = aws.s3.Bucket(f"{name}-log_bucket",
+                bucket_prefix="zavrsni-alb-logs-",
+                force_destroy=True,
+                tags={
+                    "Name": f"{args["projectName"]}-alb-logs",
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+
+            log_bucket_public_access = aws.s3.BucketPublicAccessBlock(f"{name}-log_bucket_public_access",
+                bucket=log_bucket.id,
+                block_public_acls=True,
+                block_public_policy=True,
+                ignore_public_acls=True,
+                restrict_public_buckets=True,
+                opts = pulumi.ResourceOptions(parent=self))
+
+            log_bucket_lifecycle = aws.s3.BucketLifecycleConfiguration(f"{name}-log_bucket_lifecycle",
+                bucket=log_bucket.id,
+                rules=[{
+                    "id": "expire-access-logs",
+                    "status": "Enabled",
+                    "filter": {"prefix": f"{ACCESS_LOGS_PREFIX}/"},
+                    "expiration": {"days": args.get("accessLogsRetentionDays", 30)},
+                }],
+                opts = pulumi.ResourceOptions(parent=self))
+
+            # the regional elb account delivers logs in older regions, the log
+            # delivery service in regions launched since august 2022
+            lookups = args.get("lookupCache") or LookupCache(None, args["awsRegion"])
+            elb_account = lookups.elb_service_account()
+            log_bucket_policy = aws.s3.BucketPolicy(f"{name}-log_bucket_policy",
+                bucket=log_bucket.id,
+                policy=log_bucket.arn.apply(lambda arn: json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [{
+                        "Effect": "Allow",
+                        "Principal": {
+                            "AWS": elb_account,
+                            "Service": "logdelivery.elasticloadbalancing.amazonaws.com",
+                        },
+                        "Action": "s3:PutObject",
+                        "Resource": f"{arn}/{ACCESS_LOGS_PREFIX}/AWSLogs/*",
+                    }],
+                })),
+                opts = pulumi.ResourceOptions(parent=self, depends_on=[log_bucket_public_access]))
+
+            access_logs = {
+                "bucket": log_bucket.id,
+                "prefix": ACCESS_LOGS_PREFIX,
+                "enabled": True,
+            }
+            # the alb writes a test object when logging is enabled
+            log_dependencies = [log_bucket_policy]
 
         # create application load balancer
         alb = aws.lb.LoadBalancer(f"{name}-alb",
             name=f"{args["projectName"]}-alb",
             internal=False,
             load_balancer_type="application",
+            ip_address_type="dualstack" if args.get("ipv6") else "ipv4",
             security_groups=[args["albSecGroupId"]],
-            subnets=[
-                args["pubSubNat1"],
-                args["pubSubNat2"],
-            ],
+            subnets=args["pubSubNats"],
+            enable_http2=True,
+            idle_timeout=args.get("idleTimeout", 60),
             enable_deletion_protection=False,
+            access_logs=access_logs,
             tags={
                 "Name": f"{args["projectName"]}-alb",
             },
-            opts = pulumi.ResourceOptions(parent=self))
+            opts = pulumi.ResourceOptions(parent=self, depends_on=log_dependencies))
 
         # create target group for load balancer
+        validate_slow_start(args.get("loadBalancingAlgorithm", "round_robin"), args.get("slowStart", 0))
         alb_target = aws.lb.TargetGroup(f"{name}-alb_target",
             name=f"{args["projectName"]}-tg",
             port=80,
             protocol="HTTP",
             vpc_id=args["vpcId"],
+            load_balancing_algorithm_type=args.get("loadBalancingAlgorithm", "round_robin"),
+            slow_start=args.get("slowStart", 0),
+            deregistration_delay=args.get("deregistrationDelay", 300),
             health_check={
-                "path": "/",
+                "path": args.get("healthCheckPath", "/"),
                 "protocol": "HTTP",
                 "matcher": "200-399",
-                "interval": 30,
-                "timeout": 5,
-                "healthy_threshold": 5,
-                "unhealthy_threshold": 2,
+                "interval": args.get("healthCheckInterval", 30),
+                "timeout": args.get("healthCheckTimeout", 5),
+                "healthy_threshold": args.get("healthyThreshold", 5),
+                "unhealthy_threshold": args.get("unhealthyThreshold", 2),
             },
             opts = pulumi.ResourceOptions(parent=self))
 
-        # create listener
-        alb_listener = aws.lb.Listener(f"{name}-alb_listener",
-            load_balancer_arn=alb.arn,
-            port=80,
-            protocol="HTTP",
-            default_actions=[{
-                "type": "forward",
-                "target_group_arn": alb_target.arn,
-            }],
-            opts = pulumi.ResourceOptions(parent=self))
+        forward_action = {
+            "type": "forward",
+            "target_group_arn": alb_target.arn,
+        }
+
+        if args.get("certificateArn"):
+            # create https listener, http/2 is negotiated over tls
+            alb_https_listener = aws.lb.Listener(f"{name}-alb_https_listener",
+                load_balancer_arn=alb.arn,
+                port=443,
+                protocol="HTTPS",
+                ssl_policy=args.get("sslPolicy", "ELBSecurityPolicy-TLS13-1-2-2021-06"),
+                certificate_arn=args["certificateArn"],
+                default_actions=[forward_action],
+                opts = pulumi.ResourceOptions(parent=self))
+
+            # create listener redirecting http to https
+            alb_listener = aws.lb.Listener(f"{name}-alb_listener",
+                load_balancer_arn=alb.arn,
+                port=80,
+                protocol="HTTP",
+                default_actions=[{
+                    "type": "redirect",
+                    "redirect": {
+                        "port": "443",
+                        "protocol": "HTTPS",
+                        "status_code": "HTTP_301",
+                    },
+                }],
+                opts = pulumi.ResourceOptions(parent=self))
+            forward_listener = alb_https_listener
+        else:
+            # create listener
+            alb_listener = aws.lb.Listener(f"{name}-alb_listener",
+                load_balancer_arn=alb.arn,
+                port=80,
+                protocol="HTTP",
+                default_actions=[forward_action],
+                opts = pulumi.ResourceOptions(parent=self))
+            forward_listener = alb_listener
 
         self.targetGroupArn = alb_target.arn
+        self.targetGroupArnSuffix = alb_target.arn_suffix
+        self.albArnSuffix = alb.arn_suffix
+        self.listenerArn = forward_listener.arn
         self.albDns = alb.dns_name
         self.albZoneId = alb.zone_id
+        self.accessLogsBucket = log_bucket.id if log_bucket else None
         self.register_outputs({
             'targetGroupArn': alb_target.arn, 
+            'targetGroupArnSuffix': alb_target.arn_suffix,
+            'albArnSuffix': alb.arn_suffix,
+            'listenerArn': forward_listener.arn,
             'albDns': alb.dns_name, 
-            'albZoneId': alb.zone_id
-        })
\ No newline at end of file
+            'albZoneId': alb.zone_id,
+            'accessLogsBucket': self.accessLogsBucket
+        })
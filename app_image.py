@@ -0,0 +1,159 @@
+import pulumi
+from pulumi import Input
+from typing import Optional, Dict, List, TypedDict, Any
+import pulumi_aws as aws
+from lookups import LookupCache
+
+# image builder component document installing the app and its dependencies
+# into the image, so instances only have to start it at boot
+APP_COMPONENT_DOCUMENT = """\
+name: SnakeGame
+description: Install SnakeGame and its Python dependencies
+schemaVersion: 1.0
+phases:
+  - name: build
+    steps:
+      - name: InstallPackages
+        action: ExecuteBash
+        inputs:
+          commands:
+            - yum update -y
+            - yum install -y git python3
+            - amazon-linux-extras install -y nginx1
+      - name: InstallApp
+        action: ExecuteBash
+        inputs:
+          commands:
+            - cd /home && git clone https://github.com/IvanVlhv/SnakeGame.git
+            - cd /home/SnakeGame && pip3 install -r requirements.txt
+            - pip3 install gunicorn
+  - name: validate
+    steps:
+      - name: CheckApp
+        action: ExecuteBash
+        inputs:
+          commands:
+            - test -f /home/SnakeGame/app.py
+            - command -v gunicorn && command -v nginx
+"""
+
+class AppImageArgs(TypedDict, total=False):
+    projectName: Input[Any]
+    awsRegion: Input[Any]
+    version: str
+    subnetId: Input[Any]
+    securityGroupId: Input[Any]
+    instanceType: Input[Any]
+    architectures: List[str]
+    arm64InstanceType: Input[Any]
+    egressDependencies: List[pulumi.Resource]
+    lookupCache: LookupCache
+
+class AppImage(pulumi.ComponentResource):
+    def __init__(self, name: str, args: AppImageArgs, opts:Optional[pulumi.ResourceOptions] = None):
+        super().__init__("components:index:AppImage", name, None, opts)
+
+        version = args["version"]
+
+        lookups = args.get("lookupCache") or LookupCache(None, "")
+        assume_role = lookups.policy_document([{
+            "effect": "Allow",
+            "actions": ["sts:AssumeRole"],
+            "principals": [{
+                "type": "Service",
+                "identifiers": ["ec2.amazonaws.com"],
+            }],
+        }])
+
+        # unique names, the account may build images in several regions
+        builder_role = aws.iam.Role(f"{name}-builder_role",
+            name_prefix=f"{args["projectName"]}-image-builder-",
+            assume_role_policy=assume_role,
+            opts = pulumi.ResourceOptions(parent=self))
+
+        builder_policies = [
+            aws.iam.RolePolicyAttachment(f"{name}-builder_{policy_name}",
+                role=builder_role.name,
+                policy_arn=f"arn:aws:iam::aws:policy/{policy}",
+                opts = pulumi.ResourceOptions(parent=self))
+            for policy_name, policy in (
+                ("image_builder", "EC2InstanceProfileForImageBuilder"),
+                ("ssm_core", "AmazonSSMManagedInstanceCore"),
+            )
+        ]
+
+        builder_instance_profile = aws.iam.InstanceProfile(f"{name}-builder_instance_profile",
+            name_prefix=f"{args["projectName"]}-image-builder-profile-",
+            role=builder_role.name,
+            opts = pulumi.ResourceOptions(parent=self))
+
+        app_component = aws.imagebuilder.Component(f"{name}-app_component",
+            name=f"{args["projectName"]}-snakegame",
+            platform="Linux",
+            version=version,
+            data=APP_COMPONENT_DOCUMENT,
+            opts = pulumi.ResourceOptions(parent=self))
+
+        # one image per cpu architecture, each built on an instance of that
+        # architecture; x86_64 keeps the unsuffixed names
+        image_ids = {}
+        image_arns = {}
+        for architecture in args.get("architectures") or ["x86_64"]:
+            suffix = "" if architecture == "x86_64" else f"_{architecture}"
+            physical_name = f"{args["projectName"]}-snakegame{suffix.replace("_", "-")}"
+            parent_image = "amazon-linux-2-x86" if architecture == "x86_64" else f"amazon-linux-2-{architecture}"
+            instance_type = args["instanceType"] if architecture == "x86_64" else args["arm64InstanceType"]
+
+            # amazon linux 2 managed by image builder, latest patch release
+            recipe = aws.imagebuilder.ImageRecipe(f"{name}-recipe{suffix}",
+                name=physical_name,
+                version=version,
+                parent_image=pulumi.Output.concat(
+                    "arn:aws:imagebuilder:", args["awsRegion"], f":aws:image/{parent_image}/x.x.x"),
+                components=[{
+                    "component_arn": app_component.arn,
+                }],
+                opts = pulumi.ResourceOptions(parent=self))
+
+            infrastructure = aws.imagebuilder.InfrastructureConfiguration(f"{name}-infrastructure{suffix}",
+                name=physical_name,
+                instance_profile_name=builder_instance_profile.name,
+                instance_types=[instance_type],
+                subnet_id=args["subnetId"],
+                security_group_ids=[args["securityGroupId"]],
+                terminate_instance_on_failure=True,
+                opts = pulumi.ResourceOptions(parent=self, depends_on=builder_policies))
+
+            distribution = aws.imagebuilder.DistributionConfiguration(f"{name}-distribution{suffix}",
+                name=physical_name,
+                distributions=[{
+                    "region": args["awsRegion"],
+                    "ami_distribution_configuration": {
+                        "name": f"{physical_name}-{version}-{{{{ imagebuilder:buildDate }}}}",
+                        "ami_tags": {
+                            "Name": f"{args["projectName"]}-snakegame",
+                            "Version": version,
+                        },
+                    },
+                }],
+                opts = pulumi.ResourceOptions(parent=self))
+
+            # build the ami; a new version in config builds a new image
+            image = aws.imagebuilder.Image(f"{name}-image{suffix}",
+                image_recipe_arn=recipe.arn,
+                infrastructure_configuration_arn=infrastructure.arn,
+                distribution_configuration_arn=distribution.arn,
+                # the build instance downloads packages through the nat
+                opts = pulumi.ResourceOptions(parent=self, depends_on=args.get("egressDependencies")))
+
+            image_ids[architecture] = image.output_resources.apply(lambda resources: resources[0].amis[0].image)
+            image_arns[architecture] = image.arn
+
+        self.imageId = image_ids.get("x86_64")
+        self.imageIds = image_ids
+        self.imageArn = image_arns.get("x86_64")
+        self.register_outputs({
+            'imageId': self.imageId,
+            'imageIds': image_ids,
+            'imageArn': self.imageArn
+        })
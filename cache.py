@@ -0,0 +1,63 @@
+import pulumi
+from pulumi import Input
+from typing import Optional, Dict, List, TypedDict, Any
+import pulumi_aws as aws
+
+class CacheArgs(TypedDict, total=False):
+    projectName: Input[Any]
+    privSubDbs: List[Input[Any]]
+    cacheSecGroupId: Input[Any]
+    nodeType: Input[str]
+    shardCount: int
+    replicaCount: int
+
+class Cache(pulumi.ComponentResource):
+    def __init__(self, name: str, args: CacheArgs, opts:Optional[pulumi.ResourceOptions] = None):
+        super().__init__("components:index:Cache", name, None, opts)
+
+        shard_count = args.get("shardCount", 1)
+        replica_count = args.get("replicaCount", 1)
+        cluster_mode = shard_count > 1
+
+        cache_subnet_group = aws.elasticache.SubnetGroup(f"{name}-cache_subnet_group",
+            name="cache-subnet-group",
+            subnet_ids=args["privSubDbs"],
+            opts = pulumi.ResourceOptions(parent=self))
+
+        # redis replication group, sharded (cluster mode) when more than one
+        # shard is requested
+        cache = aws.elasticache.ReplicationGroup(f"{name}-cache",
+            replication_group_id="zavrsni-cache",
+            description=f"{args["projectName"]} redis cache",
+            engine="redis",
+            engine_version="7.1",
+            node_type=args.get("nodeType", "cache.t3.micro"),
+            port=6379,
+            parameter_group_name="default.redis7.cluster.on" if cluster_mode else "default.redis7",
+            cluster_mode="enabled" if cluster_mode else "disabled",
+            num_node_groups=shard_count,
+            replicas_per_node_group=replica_count,
+            automatic_failover_enabled=cluster_mode or replica_count > 0,
+            multi_az_enabled=replica_count > 0,
+            subnet_group_name=cache_subnet_group.name,
+            security_group_ids=[args["cacheSecGroupId"]],
+            tags={
+                "Name": f"{args["projectName"]}-cache",
+            },
+            opts = pulumi.ResourceOptions(parent=self))
+
+        # cluster mode only has a configuration endpoint, which clients use
+        # for both reads and writes
+        if cluster_mode:
+            primary_endpoint = cache.configuration_endpoint_address
+            reader_endpoint = cache.configuration_endpoint_address
+        else:
+            primary_endpoint = cache.primary_endpoint_address
+            reader_endpoint = cache.reader_endpoint_address
+
+        self.cachePrimaryEndpoint = primary_endpoint
+        self.cacheReaderEndpoint = reader_endpoint
+        self.register_outputs({
+            'cachePrimaryEndpoint': primary_endpoint,
+            'cacheReaderEndpoint': reader_endpoint
+        })
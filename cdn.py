@@ -0,0 +1,239 @@
+import json
+import mimetypes
+import os
+import re
+import pulumi
+from pulumi import Input
+from typing import Optional, Dict, List, Tuple, TypedDict, Any
+import pulumi_aws as aws
+
+# aws managed policies for dynamic traffic to the alb
+CACHING_DISABLED_POLICY_ID = "4135ea2d-6df8-44a3-9df3-4b5a84be39ad"
+ALL_VIEWER_ORIGIN_REQUEST_POLICY_ID = "216adef6-5c7f-47e4-b989-5492eafa07d3"
+ALL_VIEWER_EXCEPT_HOST_HEADER_ORIGIN_REQUEST_POLICY_ID = "b689b0a8-53d0-40ab-baf2-68738e2966ac"
+
+# key prefix of the uploaded static assets, served under /static/*
+STATIC_PREFIX = "static"
+
+# served from the static assets bucket when staticDir is set, unless
+# cacheBehaviors says otherwise
+DEFAULT_CACHE_BEHAVIORS = [{
+    "pathPattern": f"/{STATIC_PREFIX}/*",
+    "origin": "static",
+    "minTtl": 0,
+    "defaultTtl": 86400,
+    "maxTtl": 31536000,
+}]
+
+def alb_origin(alb_dns: Input[str], certificate_arn: Optional[str], origin_domain: Optional[str],
+               protocol_policy: Optional[str]) -> Tuple[Input[str], str]:
+    """Domain name and protocol policy of the alb origin. With a certificate
+    the alb redirects http to https, so cloudfront has to connect over tls to
+    a name the certificate covers, never the alb's own elb.amazonaws.com name."""
+    if not certificate_arn:
+        return alb_dns, protocol_policy or "http-only"
+    if not origin_domain:
+        raise ValueError("albCertificateArn needs cdnAlbOriginDomain, a name the certificate covers "
+                         "pointing at the alb; cloudfront cannot verify the alb dns name")
+    if protocol_policy == "http-only":
+        raise ValueError("cdnAlbOriginProtocolPolicy http-only loops on the alb redirect to https; "
+                         "use https-only or match-viewer")
+    return origin_domain, protocol_policy or "https-only"
+
+class CdnArgs(TypedDict, total=False):
+    projectName: Input[Any]
+    albDns: Input[Any]
+    albZoneId: Input[Any]
+    albCertificateArn: Input[str]
+    albOriginDomain: str
+    albOriginZoneId: Input[str]
+    albOriginProtocolPolicy: Input[str]
+    staticDir: str
+    priceClass: Input[str]
+    originShieldRegion: Input[str]
+    cacheBehaviors: List[Dict[str, Any]]
+
+class Cdn(pulumi.ComponentResource):
+    def __init__(self, name: str, args: CdnArgs, opts:Optional[pulumi.ResourceOptions] = None):
+        super().__init__("components:index:Cdn", name, None, opts)
+
+        # cloudfront names are global to the account, one set per stack
+        physical_name = f"{args["projectName"]}-{pulumi.get_stack()}"
+
+        alb_domain, alb_protocol_policy = alb_origin(args["albDns"], args.get("albCertificateArn"),
+            args.get("albOriginDomain"), args.get("albOriginProtocolPolicy"))
+        # over tls cloudfront checks the certificate against the host header
+        # it sends, so the viewer's cloudfront host must not be forwarded
+        alb_origin_request_policy_id = ALL_VIEWER_ORIGIN_REQUEST_POLICY_ID if alb_protocol_policy == "http-only" \
+            else ALL_VIEWER_EXCEPT_HOST_HEADER_ORIGIN_REQUEST_POLICY_ID
+
+        # alias record of the origin domain when its hosted zone is managed here
+        if args.get("albOriginDomain") and args.get("albOriginZoneId"):
+            aws.route53.Record(f"{name}-alb_origin_record",
+                zone_id=args["albOriginZoneId"],
+                name=args["albOriginDomain"],
+                type="A",
+                aliases=[{
+                    "name": args["albDns"],
+                    "zone_id": args["albZoneId"],
+                    "evaluate_target_health": True,
+                }],
+                opts = pulumi.ResourceOptions(parent=self))
+
+        origin_shield = None
+        if args.get("originShieldRegion"):
+            origin_shield = {
+                "enabled": True,
+                "origin_shield_region": args["originShieldRegion"],
+            }
+
+        # private bucket for static assets, readable only through cloudfront
+        static_bucket = aws.s3.Bucket(f"{name}-static_bucket",
+            bucket_prefix="zavrsni-static-",
+            force_destroy=True,
+            tags={
+                "Name": f"{args["projectName"]}-static",
+            },
+            opts = pulumi.ResourceOptions(parent=self))
+
+        # assets of staticDir uploaded under static/, anything else has to be
+        # synced to staticBucketName by the app's own deployment
+        static_dir = args.get("staticDir")
+        if static_dir:
+            if not os.path.isdir(static_dir):
+                raise ValueError(f"staticDir {static_dir} is not a directory")
+            for root, _, files in os.walk(static_dir):
+                for file in sorted(files):
+                    path = os.path.join(root, file)
+                    key = "/".join([STATIC_PREFIX, *os.path.relpath(path, static_dir).split(os.sep)])
+                    slug = re.sub(r"[^A-Za-z0-9]+", "_", key)
+                    aws.s3.BucketObjectv2(f"{name}-static_{slug}",
+                        bucket=static_bucket.id,
+                        key=key,
+                        source=pulumi.FileAsset(path),
+                        content_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                        opts = pulumi.ResourceOptions(parent=self))
+
+        static_bucket_public_access = aws.s3.BucketPublicAccessBlock(f"{name}-static_bucket_public_access",
+            bucket=static_bucket.id,
+            block_public_acls=True,
+            block_public_policy=True,
+            ignore_public_acls=True,
+            restrict_public_buckets=True,
+            opts = pulumi.ResourceOptions(parent=self))
+
+        static_oac = aws.cloudfront.OriginAccessControl(f"{name}-static_oac",
+            name=f"{physical_name}-static-oac",
+            origin_access_control_origin_type="s3",
+            signing_behavior="always",
+            signing_protocol="sigv4",
+            opts = pulumi.ResourceOptions(parent=self))
+
+        # one cache policy per path pattern
+        cache_behaviors = args.get("cacheBehaviors")
+        if cache_behaviors is None:
+            cache_behaviors = DEFAULT_CACHE_BEHAVIORS if static_dir else []
+        ordered_cache_behaviors = []
+        for behavior in cache_behaviors:
+            static = behavior.get("origin", "static") == "static"
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", behavior["pathPattern"]).strip("_")
+            cache_policy = aws.cloudfront.CachePolicy(f"{name}-cache_policy_{slug}",
+                name=f"{physical_name}-{slug.replace("_", "-")}",
+                min_ttl=behavior.get("minTtl", 0),
+                default_ttl=behavior.get("defaultTtl", 86400 if static else 0),
+                max_ttl=behavior.get("maxTtl", 31536000 if static else 3600),
+                parameters_in_cache_key_and_forwarded_to_origin={
+                    "enable_accept_encoding_gzip": True,
+                    "enable_accept_encoding_brotli": True,
+                    "cookies_config": {"cookie_behavior": "none"},
+                    "headers_config": {"header_behavior": "none"},
+                    "query_strings_config": {"query_string_behavior": "none" if static else "all"},
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+            ordered_cache_behaviors.append({
+                "path_pattern": behavior["pathPattern"],
+                "target_origin_id": "static" if static else "alb",
+                "allowed_methods": ["GET", "HEAD", "OPTIONS"],
+                "cached_methods": ["GET", "HEAD"],
+                "viewer_protocol_policy": "redirect-to-https",
+                "compress": True,
+                "cache_policy_id": cache_policy.id,
+                "origin_request_policy_id": None if static else alb_origin_request_policy_id,
+            })
+
+        distribution = aws.cloudfront.Distribution(f"{name}-distribution",
+            enabled=True,
+            comment=f"{args["projectName"]} edge cache",
+            http_version="http2and3",
+            is_ipv6_enabled=True,
+            price_class=args.get("priceClass", "PriceClass_100"),
+            # do not block the update on global propagation
+            wait_for_deployment=False,
+            origins=[
+                {
+                    "origin_id": "alb",
+                    "domain_name": alb_domain,
+                    "custom_origin_config": {
+                        "http_port": 80,
+                        "https_port": 443,
+                        "origin_protocol_policy": alb_protocol_policy,
+                        "origin_ssl_protocols": ["TLSv1.2"],
+                        "origin_keepalive_timeout": 60,
+                    },
+                    "origin_shield": origin_shield,
+                },
+                {
+                    "origin_id": "static",
+                    "domain_name": static_bucket.bucket_regional_domain_name,
+                    "origin_access_control_id": static_oac.id,
+                    "origin_shield": origin_shield,
+                },
+            ],
+            # dynamic requests go to the alb and are only cached when the
+            # app sends cache headers
+            default_cache_behavior={
+                "target_origin_id": "alb",
+                "allowed_methods": ["GET", "HEAD", "OPTIONS", "PUT", "POST", "PATCH", "DELETE"],
+                "cached_methods": ["GET", "HEAD"],
+                "viewer_protocol_policy": "redirect-to-https",
+                "compress": True,
+                "cache_policy_id": CACHING_DISABLED_POLICY_ID,
+                "origin_request_policy_id": alb_origin_request_policy_id,
+            },
+            ordered_cache_behaviors=ordered_cache_behaviors,
+            restrictions={
+                "geo_restriction": {
+                    "restriction_type": "none",
+                },
+            },
+            viewer_certificate={
+                "cloudfront_default_certificate": True,
+            },
+            tags={
+                "Name": f"{args["projectName"]}-cdn",
+            },
+            opts = pulumi.ResourceOptions(parent=self))
+
+        static_bucket_policy = aws.s3.BucketPolicy(f"{name}-static_bucket_policy",
+            bucket=static_bucket.id,
+            policy=pulumi.Output.all(static_bucket.arn, distribution.arn).apply(
+                lambda arns: json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [{
+                        "Effect": "Allow",
+                        "Principal": {"Service": "cloudfront.amazonaws.com"},
+                        "Action": "s3:GetObject",
+                        "Resource": f"{arns[0]}/*",
+                        "Condition": {"StringEquals": {"AWS:SourceArn": arns[1]}},
+                    }],
+                })),
+            opts = pulumi.ResourceOptions(parent=self, depends_on=[static_bucket_public_access]))
+
+        self.cdnDomain = distribution.domain_name
+        self.distributionId = distribution.id
+        self.staticBucketName = static_bucket.bucket
+        self.register_outputs({
+            'cdnDomain': distribution.domain_name,
+            'distributionId': distribution.id,
+            'staticBucketName': static_bucket.bucket
+        })
@@ -1,42 +1,340 @@
+import json
+import math
 import pulumi
 from pulumi import Input
-from typing import Optional, Dict, TypedDict, Any
+from typing import Optional, Dict, List, TypedDict, Any
 import pulumi_aws as aws
 
+# parameters changed from the rds defaults, overridable through the
+# parameters arg: innodb flushes at the 3000 iops gp3 baseline instead of the
+# 200 / 2000 iops sized for spinning disks, and connections left idle by
+# terminated web instances are closed after 5 minutes instead of 8 hours
+# so they do not pile up against max_connections
+MYSQL_PARAMETERS = {
+    "innodb_io_capacity": "2000",
+    "innodb_io_capacity_max": "3000",
+    "wait_timeout": "300",
+}
+AURORA_MYSQL_PARAMETERS = {
+    "wait_timeout": "300",
+    "interactive_timeout": "300",
+}
+
+# rds mysql default max_connections
+MYSQL_MAX_CONNECTIONS = "{DBInstanceClassMemory/12582880}"
+
+# parameters that only take effect after a reboot
+STATIC_PARAMETERS = {
+    "innodb_buffer_pool_instances",
+    "innodb_read_io_threads",
+    "innodb_write_io_threads",
+    "performance_schema",
+}
+
+DEFAULT_INSTANCE_CLASS = "db.t3.micro"
+
+# memory of the burstable and general purpose classes by size; memory
+# optimized classes have twice the general purpose memory
+BURSTABLE_MEMORY_GIB = {"micro": 1, "small": 2, "medium": 4, "large": 8, "xlarge": 16, "2xlarge": 32}
+GENERAL_PURPOSE_MEMORY_GIB = {
+    "large": 8, "xlarge": 16, "2xlarge": 32, "4xlarge": 64,
+    "8xlarge": 128, "12xlarge": 192, "16xlarge": 256, "24xlarge": 384,
+}
+
+# memory of an aurora capacity unit; serverless v2 sizes max_connections by
+# the memory of its maximum capacity
+ACU_MEMORY_GIB = 2
+
+# share of the class memory taken as DBInstanceClassMemory, what rds leaves
+# the engine on the small classes; larger classes get more, so max_connections
+# is underestimated there and alarms fire early rather than late
+ENGINE_MEMORY_SHARE = 0.75
+
+def instance_class_memory(instance_class: str, serverless_max_capacity: Optional[float] = None) -> Optional[int]:
+    """Estimated DBInstanceClassMemory of an instance class in bytes, None for
+    classes not listed above."""
+    _, family, size = (instance_class.split(".") + ["", ""])[:3]
+    gib = None
+    if family == "serverless":
+        if isinstance(serverless_max_capacity, (int, float)):
+            gib = serverless_max_capacity * ACU_MEMORY_GIB
+    elif family.startswith("t"):
+        gib = BURSTABLE_MEMORY_GIB.get(size)
+    elif family.startswith("m") and size in GENERAL_PURPOSE_MEMORY_GIB:
+        gib = GENERAL_PURPOSE_MEMORY_GIB[size]
+    elif family.startswith("r") and size in GENERAL_PURPOSE_MEMORY_GIB:
+        gib = 2 * GENERAL_PURPOSE_MEMORY_GIB[size]
+    return None if gib is None else int(gib * 2**30 * ENGINE_MEMORY_SHARE)
+
+def max_connections(instance_class: Input[str], engine: str, parameters: Dict[str, str],
+                    serverless_max_capacity: Optional[float] = None) -> Optional[int]:
+    """max_connections of one instance of the class, None when it cannot be
+    known before the instance exists."""
+    value = parameters.get("max_connections")
+    if value is not None and str(value).isdigit():
+        return int(value)
+    memory = None
+    if isinstance(instance_class, str):
+        memory = instance_class_memory(instance_class, serverless_max_capacity)
+    if memory is None:
+        return None
+    if engine == "mysql" and value in (None, MYSQL_MAX_CONNECTIONS):
+        return memory // 12582880
+    if value is None and engine.startswith("aurora-mysql"):
+        # aurora mysql default, greatest of log2(memory / 768MiB) * 45 and
+        # log2(memory / 7.625GiB) * 1000
+        connections = int(max(math.log2(memory / 805306368) * 45, math.log2(memory / 8187281408) * 1000))
+        return connections if connections > 0 else None
+    return None
+
 class DbArgs(TypedDict, total=False):
     projectName: Input[Any]
-    privSubDb1: Input[Any]
-    privSubDb2: Input[Any]
+    privSubDbs: List[Input[Any]]
+    availabilityZones: List[Input[str]]
     dbUsername: Input[Any]
     dbPassword: Input[Any]
     dbSecGroupId: Input[Any]
+    replicaCount: int
+    proxyEnabled: bool
+    proxyMaxConnectionsPercent: Input[float]
+    engine: str
+    engineVersion: str
+    instanceClass: Input[str]
+    storageType: Input[str]
+    allocatedStorage: Input[int]
+    maxAllocatedStorage: Input[int]
+    iops: Input[int]
+    storageThroughput: Input[int]
+    multiAz: Input[bool]
+    performanceInsights: Input[bool]
+    serverlessMinCapacity: Input[float]
+    serverlessMaxCapacity: Input[float]
+    parameters: Dict[str, str]
 
 class Db(pulumi.ComponentResource):
     def __init__(self, name: str, args: DbArgs, opts:Optional[pulumi.ResourceOptions] = None):
-        super().__init__("components:index:Db", name, args, opts)
+        super().__init__("components:index:Db", name, None, opts)
+
+        # engine is mysql, aurora-mysql (provisioned) or
+        # aurora-mysql-serverless (serverless v2)
+        engine = args.get("engine", "mysql")
+        aurora = engine.startswith("aurora-mysql")
+        serverless = engine == "aurora-mysql-serverless"
+        replica_count = args.get("replicaCount", 0)
+        zones = args.get("availabilityZones", [])
+        instance_class = args.get("instanceClass") or DEFAULT_INSTANCE_CLASS
+        if serverless:
+            instance_class = "db.serverless"
+        performance_insights = args.get("performanceInsights", False)
 
         db_subnet_group = aws.rds.SubnetGroup(f"{name}-db_subnet_group",
             name="db-subnet-group",
-            subnet_ids=[
-                args["privSubDb1"],
-                args["privSubDb2"],
-            ],
+            subnet_ids=args["privSubDbs"],
             opts = pulumi.ResourceOptions(parent=self))
 
-        db = aws.rds.Instance(f"{name}-db",
-            identifier="zavrsni-db",
-            engine="mysql",
-            engine_version="8.0",
-            instance_class=aws.rds.InstanceType.T3_MICRO,
-            allocated_storage=20,
-            username=args["dbUsername"],
-            password=args["dbPassword"],
-            db_subnet_group_name=db_subnet_group.name,
-            vpc_security_group_ids=[args["dbSecGroupId"]],
-            skip_final_snapshot=True,
-            opts = pulumi.ResourceOptions(parent=self))
+        parameters = {
+            **(AURORA_MYSQL_PARAMETERS if aurora else MYSQL_PARAMETERS),
+            **(args.get("parameters") or {}),
+        }
+        parameter_list = [{
+            "name": key,
+            "value": value,
+            "apply_method": "pending-reboot" if key in STATIC_PARAMETERS else "immediate",
+        } for key, value in sorted(parameters.items())]
+
+        if aurora:
+            db_parameter_group = aws.rds.ClusterParameterGroup(f"{name}-db_parameter_group",
+                name_prefix="zavrsni-db-",
+                family="aurora-mysql8.0",
+                parameters=parameter_list,
+                opts = pulumi.ResourceOptions(parent=self))
+
+            db = aws.rds.Cluster(f"{name}-db",
+                cluster_identifier="zavrsni-db",
+                engine="aurora-mysql",
+                engine_version=args.get("engineVersion", "8.0.mysql_aurora.3.08.0"),
+                master_username=args["dbUsername"],
+                master_password=args["dbPassword"],
+                db_subnet_group_name=db_subnet_group.name,
+                db_cluster_parameter_group_name=db_parameter_group.name,
+                vpc_security_group_ids=[args["dbSecGroupId"]],
+                serverlessv2_scaling_configuration={
+                    "min_capacity": args.get("serverlessMinCapacity", 0.5),
+                    "max_capacity": args.get("serverlessMaxCapacity", 4),
+                } if serverless else None,
+                storage_encrypted=True,
+                skip_final_snapshot=True,
+                opts = pulumi.ResourceOptions(parent=self))
+
+            # writer and readers; aurora balances readers behind one endpoint
+            cluster_instances = []
+            for i in range(replica_count + 1):
+                identifier = "zavrsni-db-writer" if i == 0 else f"zavrsni-db-replica-{i}"
+                cluster_instance = aws.rds.ClusterInstance(
+                    f"{name}-db_writer" if i == 0 else f"{name}-db_replica_{i}",
+                    identifier=identifier,
+                    cluster_identifier=db.id,
+                    engine=db.engine,
+                    engine_version=db.engine_version,
+                    instance_class=instance_class,
+                    availability_zone=zones[i % len(zones)] if zones else None,
+                    performance_insights_enabled=performance_insights,
+                    opts = pulumi.ResourceOptions(parent=self))
+                cluster_instances.append(cluster_instance)
+
+            writer_endpoint = pulumi.Output.concat(db.endpoint, ":", db.port.apply(str))
+            reader_endpoints = [pulumi.Output.concat(db.reader_endpoint, ":", db.port.apply(str))] if replica_count else []
+            db_identifier = db.cluster_identifier
+            instance_identifiers = [instance.identifier for instance in cluster_instances]
+        else:
+            db_parameter_group = aws.rds.ParameterGroup(f"{name}-db_parameter_group",
+                name_prefix="zavrsni-db-",
+                family="mysql8.0",
+                parameters=parameter_list,
+                opts = pulumi.ResourceOptions(parent=self))
+
+            db = aws.rds.Instance(f"{name}-db",
+                identifier="zavrsni-db",
+                engine="mysql",
+                engine_version=args.get("engineVersion", "8.0"),
+                instance_class=instance_class,
+                storage_type=args.get("storageType", "gp3"),
+                allocated_storage=args.get("allocatedStorage", 20),
+                max_allocated_storage=args.get("maxAllocatedStorage"),
+                # gp3 iops and throughput can only be provisioned from 400 GiB,
+                # below that the 3000 iops / 125 MiBps baseline applies
+                iops=args.get("iops"),
+                storage_throughput=args.get("storageThroughput"),
+                multi_az=args.get("multiAz", False),
+                performance_insights_enabled=performance_insights,
+                parameter_group_name=db_parameter_group.name,
+                username=args["dbUsername"],
+                password=args["dbPassword"],
+                db_subnet_group_name=db_subnet_group.name,
+                vpc_security_group_ids=[args["dbSecGroupId"]],
+                # read replicas need automated backups on the source
+                backup_retention_period=1 if replica_count else None,
+                skip_final_snapshot=True,
+                opts = pulumi.ResourceOptions(parent=self))
+
+            # read replicas, spread over the db subnet zones starting with the
+            # zone after the writer's
+            replicas = []
+            for i in range(replica_count):
+                replica = aws.rds.Instance(f"{name}-db_replica_{i + 1}",
+                    identifier=f"zavrsni-db-replica-{i + 1}",
+                    replicate_source_db=db.identifier,
+                    instance_class=instance_class,
+                    parameter_group_name=db_parameter_group.name,
+                    performance_insights_enabled=performance_insights,
+                    availability_zone=zones[(i + 1) % len(zones)] if zones else None,
+                    vpc_security_group_ids=[args["dbSecGroupId"]],
+                    skip_final_snapshot=True,
+                    opts = pulumi.ResourceOptions(parent=self))
+                replicas.append(replica)
+
+            writer_endpoint = db.endpoint
+            reader_endpoints = [replica.endpoint for replica in replicas]
+            db_identifier = db.identifier
+            instance_identifiers = [db.identifier] + [replica.identifier for replica in replicas]
+
+        # rds proxy pooling connections to the writer, and for aurora also a
+        # read-only endpoint to the readers
+        proxy_endpoint = None
+        proxy_reader_endpoint = None
+        if args.get("proxyEnabled", False):
+            db_secret = aws.secretsmanager.Secret(f"{name}-db_secret",
+                name_prefix=f"{args["projectName"]}-db-credentials",
+                opts = pulumi.ResourceOptions(parent=self))
+
+            db_secret_version = aws.secretsmanager.SecretVersion(f"{name}-db_secret_version",
+                secret_id=db_secret.id,
+                secret_string=pulumi.Output.json_dumps({
+                    "username": args["dbUsername"],
+                    "password": args["dbPassword"],
+                }),
+                opts = pulumi.ResourceOptions(parent=self))
+
+            proxy_role = aws.iam.Role(f"{name}-proxy_role",
+                name_prefix=f"{args["projectName"]}-db-proxy-",
+                assume_role_policy=json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [{
+                        "Effect": "Allow",
+                        "Action": "sts:AssumeRole",
+                        "Principal": {"Service": "rds.amazonaws.com"},
+                    }],
+                }),
+                opts = pulumi.ResourceOptions(parent=self))
+
+            proxy_secret_access = aws.iam.RolePolicy(f"{name}-proxy_secret_access",
+                role=proxy_role.id,
+                policy=db_secret.arn.apply(lambda arn: json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [{
+                        "Effect": "Allow",
+                        "Action": ["secretsmanager:GetSecretValue"],
+                        "Resource": arn,
+                    }],
+                })),
+                opts = pulumi.ResourceOptions(parent=self))
+
+            proxy = aws.rds.Proxy(f"{name}-proxy",
+                name="zavrsni-db-proxy",
+                engine_family="MYSQL",
+                role_arn=proxy_role.arn,
+                vpc_subnet_ids=args["privSubDbs"],
+                vpc_security_group_ids=[args["dbSecGroupId"]],
+                require_tls=False,
+                auths=[{
+                    "auth_scheme": "SECRETS",
+                    "iam_auth": "DISABLED",
+                    "secret_arn": db_secret.arn,
+                }],
+                opts = pulumi.ResourceOptions(parent=self,
+                    depends_on=[db_secret_version, proxy_secret_access]))
+
+            proxy_target_group = aws.rds.ProxyDefaultTargetGroup(f"{name}-proxy_target_group",
+                db_proxy_name=proxy.name,
+                connection_pool_config={
+                    "max_connections_percent": args.get("proxyMaxConnectionsPercent", 90),
+                    "connection_borrow_timeout": 120,
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+
+            proxy_target = aws.rds.ProxyTarget(f"{name}-proxy_target",
+                db_proxy_name=proxy.name,
+                target_group_name=proxy_target_group.name,
+                db_cluster_identifier=db.cluster_identifier if aurora else None,
+                db_instance_identifier=None if aurora else db.identifier,
+                opts = pulumi.ResourceOptions(parent=self))
+
+            proxy_endpoint = proxy.endpoint
+
+            if aurora and replica_count:
+                proxy_reader = aws.rds.ProxyEndpoint(f"{name}-proxy_reader",
+                    db_proxy_name=proxy.name,
+                    db_proxy_endpoint_name="zavrsni-db-proxy-reader",
+                    vpc_subnet_ids=args["privSubDbs"],
+                    vpc_security_group_ids=[args["dbSecGroupId"]],
+                    target_role="READ_ONLY",
+                    opts = pulumi.ResourceOptions(parent=self, depends_on=[proxy_target]))
+                proxy_reader_endpoint = proxy_reader.endpoint
 
-        self.dbEndpoint = db.endpoint
+        self.dbIdentifier = db_identifier
+        self.dbInstanceIdentifiers = instance_identifiers
+        self.dbInstanceClass = instance_class
+        self.dbMaxConnections = max_connections(instance_class, engine, parameters,
+            args.get("serverlessMaxCapacity", 4) if serverless else None)
+        self.dbWriterEndpoint = writer_endpoint
+        self.dbReaderEndpoints = reader_endpoints
+        self.dbProxyEndpoint = proxy_endpoint
+        self.dbProxyReaderEndpoint = proxy_reader_endpoint
         self.register_outputs({
-            'dbEndpoint': db.endpoint
-        })
\ No newline at end of file
+            'dbIdentifier': db_identifier,
+            'dbInstanceIdentifiers': instance_identifiers,
+            'dbWriterEndpoint': writer_endpoint,
+            'dbReaderEndpoints': reader_endpoints,
+            'dbProxyEndpoint': proxy_endpoint,
+            'dbProxyReaderEndpoint': proxy_reader_endpoint
+        })
@@ -0,0 +1,9 @@
+"""Instance type facts shared by the components and the policy pack, which
+only has pulumi-policy installed and cannot import the components."""
+
+# instance families with cpu credits
+BURSTABLE_FAMILIES = ("t2", "t3", "t3a", "t4g")
+
+def is_burstable(instance_type: str) -> bool:
+    """Whether an ec2 instance type or rds instance class runs on cpu credits."""
+    return instance_type.removeprefix("db.").split(".")[0] in BURSTABLE_FAMILIES
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import pulumi_aws as aws
+
+# seconds a cached lookup stays fresh; None keeps it until it is refreshed
+AVAILABILITY_ZONES_TTL = 24 * 3600
+
+# lookup kinds, as named in LOOKUP_REFRESH
+LOOKUP_KINDS = ("availability_zones", "ami", "policy", "elb_account")
+
+class LookupCache:
+    """Data source lookups resolved once and kept in a local json file.
+
+    Availability zones expire after ``ttl`` seconds. AMI ids never expire,
+    so a new image release only reaches the launch template when the ami
+    lookup is refreshed on purpose. Policy documents only depend on their
+    statements and never expire either, nor does the regional elastic load
+    balancing account. ``refresh`` names the kinds to look
+    up again on this run ("all" for every kind), and ``pins`` fixes values
+    from stack config so they are never looked up at all. Without a ``path``
+    every lookup is an invoke, as before.
+    """
+
+    def __init__(self, path: Optional[str], region: str, ttl: Optional[int] = AVAILABILITY_ZONES_TTL,
+                 refresh: str = "", pins: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.region = region
+        self.ttl = ttl
+        self.refresh = set(LOOKUP_KINDS) if refresh.strip() == "all" else \
+            {kind.strip() for kind in refresh.split(",") if kind.strip()}
+        self.pins = {kind: value for kind, value in (pins or {}).items() if value}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def _lookup(self, kind: str, key: str, resolve: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+        if kind in self.pins:
+            return self.pins[kind]
+        key = f"{kind}/{key}"
+        entry = self.entries.get(key)
+        if entry is not None and kind not in self.refresh:
+            age = time.time() - datetime.fromisoformat(entry["resolvedAt"]).timestamp()
+            if ttl is None or age < ttl:
+                return entry["value"]
+
+        value = resolve()
+        if self.path:
+            self.entries[key] = {
+                "value": value,
+                "resolvedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            with open(self.path, "w") as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+                f.write("\n")
+        return value
+
+    def availability_zones(self) -> List[str]:
+        return self._lookup("availability_zones", self.region,
+            lambda: list(aws.get_availability_zones().names),
+            self.ttl)
+
+    def ami(self, owners: List[str], name_pattern: str) -> str:
+        """Id of the most recent image matching ``name_pattern``."""
+        return self._lookup("ami", f"{self.region}/{','.join(owners)}/{name_pattern}",
+            lambda: aws.ec2.get_ami(most_recent=True,
+                owners=owners,
+                filters=[{
+                    "name": "name",
+                    "values": [name_pattern],
+                }]).id)
+
+    def elb_service_account(self) -> str:
+        """Arn of the account delivering load balancer access logs."""
+        return self._lookup("elb_account", self.region,
+            lambda: aws.elb.get_service_account(region=self.region).arn)
+
+    def policy_document(self, statements: List[Dict[str, Any]]) -> str:
+        digest = hashlib.sha256(json.dumps(statements, sort_keys=True).encode()).hexdigest()[:16]
+        return self._lookup("policy", digest,
+            lambda: aws.iam.get_policy_document(statements=statements).json)
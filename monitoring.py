@@ -0,0 +1,204 @@
+import json
+import pulumi
+from pulumi import Input
+from typing import Optional, Dict, List, TypedDict, Any
+import pulumi_aws as aws
+from instance_types import is_burstable
+from web import BOOT_METRICS_NAMESPACE
+
+class MonitoringArgs(TypedDict, total=False):
+    projectName: Input[Any]
+    awsRegion: Input[Any]
+    albArnSuffix: Input[Any]
+    targetGroupArnSuffix: Input[Any]
+    autoscalingGroupName: Input[Any]
+    webInstanceType: str
+    dbIdentifier: Input[Any]
+    dbInstanceIdentifiers: List[Input[Any]]
+    dbEngine: str
+    dbInstanceClass: Input[str]
+    dbMaxConnections: int
+    alarmEmail: str
+    latencyP50Threshold: float
+    latencyP99Threshold: float
+    http5xxThreshold: float
+    unhealthyHostsThreshold: float
+    dbConnectionsThreshold: float
+    cpuCreditThreshold: float
+
+class Monitoring(pulumi.ComponentResource):
+    def __init__(self, name: str, args: MonitoringArgs, opts:Optional[pulumi.ResourceOptions] = None):
+        super().__init__("components:index:Monitoring", name, None, opts)
+
+        prefix = f"{args["projectName"]}-{pulumi.get_stack()}"
+        db_dimension = "DBClusterIdentifier" if args.get("dbEngine", "mysql").startswith("aurora") else "DBInstanceIdentifier"
+        # cpu credits only exist on burstable t instance classes
+        web_burstable = is_burstable(args.get("webInstanceType", ""))
+        db_instance_class = args.get("dbInstanceClass")
+        db_burstable = isinstance(db_instance_class, str) and is_burstable(db_instance_class)
+        connections_threshold = args.get("dbConnectionsThreshold", 0.8)
+        if not 0 < connections_threshold <= 1:
+            raise ValueError(f"dbConnectionsThreshold is a fraction of max_connections, got {connections_threshold}")
+
+        alarm_topic = aws.sns.Topic(f"{name}-alarm_topic",
+            name=f"{prefix}-alarms",
+            opts = pulumi.ResourceOptions(parent=self))
+
+        if args.get("alarmEmail"):
+            alarm_email = aws.sns.TopicSubscription(f"{name}-alarm_email",
+                topic=alarm_topic.arn,
+                protocol="email",
+                endpoint=args["alarmEmail"],
+                opts = pulumi.ResourceOptions(parent=self))
+
+        alb_dimensions = {"LoadBalancer": args["albArnSuffix"]}
+        target_dimensions = {
+            "LoadBalancer": args["albArnSuffix"],
+            "TargetGroup": args["targetGroupArnSuffix"],
+        }
+        asg_dimensions = {"AutoScalingGroupName": args["autoscalingGroupName"]}
+        # connections and credits are per instance, also in an aurora cluster
+        db_instances = [
+            ("" if i == 0 else f"_replica_{i}", {"DBInstanceIdentifier": identifier})
+            for i, identifier in enumerate(args.get("dbInstanceIdentifiers") or [])
+        ]
+
+        def alarm(alarm_name: str, description: str, namespace: str, metric_name: str,
+                  dimensions: Dict[str, Input[Any]], threshold: float, comparison: str,
+                  statistic: Optional[str] = None, extended_statistic: Optional[str] = None,
+                  evaluation_periods: int = 3, period: int = 60) -> aws.cloudwatch.MetricAlarm:
+            return aws.cloudwatch.MetricAlarm(f"{name}-{alarm_name}",
+                name=f"{prefix}-{alarm_name.replace("_", "-")}",
+                alarm_description=description,
+                namespace=namespace,
+                metric_name=metric_name,
+                dimensions=dimensions,
+                statistic=statistic,
+                extended_statistic=extended_statistic,
+                period=period,
+                evaluation_periods=evaluation_periods,
+                datapoints_to_alarm=evaluation_periods,
+                threshold=threshold,
+                comparison_operator=comparison,
+                treat_missing_data="notBreaching",
+                alarm_actions=[alarm_topic.arn],
+                ok_actions=[alarm_topic.arn],
+                opts = pulumi.ResourceOptions(parent=self))
+
+        # latency percentiles of the app behind the alb, in seconds
+        alarm("latency_p50", "Median target response time is high",
+            "AWS/ApplicationELB", "TargetResponseTime", alb_dimensions,
+            args.get("latencyP50Threshold", 0.3), "GreaterThanThreshold", extended_statistic="p50")
+        alarm("latency_p99", "p99 target response time is high",
+            "AWS/ApplicationELB", "TargetResponseTime", alb_dimensions,
+            args.get("latencyP99Threshold", 1.0), "GreaterThanThreshold", extended_statistic="p99")
+        alarm("target_5xx", "Targets return 5xx responses",
+            "AWS/ApplicationELB", "HTTPCode_Target_5XX_Count", alb_dimensions,
+            args.get("http5xxThreshold", 10), "GreaterThanThreshold", statistic="Sum")
+        alarm("unhealthy_hosts", "Targets fail the alb health check",
+            "AWS/ApplicationELB", "UnHealthyHostCount", target_dimensions,
+            args.get("unhealthyHostsThreshold", 1), "GreaterThanOrEqualToThreshold", statistic="Maximum",
+            evaluation_periods=2)
+        # connection saturation, a share of max_connections of the instance
+        # class; unknown for serverless and unlisted classes
+        if args.get("dbMaxConnections"):
+            for suffix, dimensions in db_instances:
+                alarm(f"db_connections{suffix}", "Database connections close to max_connections",
+                    "AWS/RDS", "DatabaseConnections", dimensions,
+                    int(args["dbMaxConnections"] * connections_threshold), "GreaterThanThreshold",
+                    statistic="Maximum", evaluation_periods=5)
+        # burst credit depletion throttles t instances to their baseline
+        if web_burstable:
+            alarm("web_cpu_credits", "Web instances are running out of cpu credits",
+                "AWS/EC2", "CPUCreditBalance", asg_dimensions,
+                args.get("cpuCreditThreshold", 20), "LessThanThreshold", statistic="Minimum",
+                evaluation_periods=3, period=300)
+        if db_burstable:
+            for suffix, dimensions in db_instances:
+                alarm(f"db_cpu_credits{suffix}", "Database is running out of cpu credits",
+                    "AWS/RDS", "CPUCreditBalance", dimensions,
+                    args.get("cpuCreditThreshold", 20), "LessThanThreshold", statistic="Minimum",
+                    evaluation_periods=3, period=300)
+
+        def dashboard_body(values: List[Any]) -> str:
+            region, alb_suffix, target_suffix, asg_name, db_identifier = values
+
+            def widget(title: str, metrics: List[List[Any]], stat: str = "Average",
+                       x: int = 0, y: int = 0, unit_label: str = "") -> Dict[str, Any]:
+                return {
+                    "type": "metric",
+                    "x": x,
+                    "y": y,
+                    "width": 12,
+                    "height": 6,
+                    "properties": {
+                        "title": title,
+                        "region": region,
+                        "metrics": metrics,
+                        "stat": stat,
+                        "period": 60,
+                        "view": "timeSeries",
+                        "yAxis": {"left": {"min": 0, "label": unit_label}},
+                    },
+                }
+
+            alb = ["LoadBalancer", alb_suffix]
+            target = ["TargetGroup", target_suffix, "LoadBalancer", alb_suffix]
+            asg = ["AutoScalingGroupName", asg_name]
+            db = [db_dimension, db_identifier]
+            widgets = [
+                widget("Target response time", [
+                    ["AWS/ApplicationELB", "TargetResponseTime", *alb, {"stat": "p50", "label": "p50"}],
+                    ["...", {"stat": "p90", "label": "p90"}],
+                    ["...", {"stat": "p99", "label": "p99"}],
+                ], x=0, y=0, unit_label="seconds"),
+                widget("Requests", [
+                    ["AWS/ApplicationELB", "RequestCount", *alb, {"label": "requests"}],
+                    ["AWS/ApplicationELB", "RequestCountPerTarget", *target, {"label": "per target"}],
+                ], stat="Sum", x=12, y=0),
+                widget("Errors", [
+                    ["AWS/ApplicationELB", "HTTPCode_Target_5XX_Count", *alb, {"label": "target 5xx"}],
+                    ["AWS/ApplicationELB", "HTTPCode_ELB_5XX_Count", *alb, {"label": "alb 5xx"}],
+                    ["AWS/ApplicationELB", "RejectedConnectionCount", *alb, {"label": "rejected connections"}],
+                ], stat="Sum", x=0, y=6),
+                widget("Targets", [
+                    ["AWS/ApplicationELB", "HealthyHostCount", *target, {"label": "healthy"}],
+                    ["AWS/ApplicationELB", "UnHealthyHostCount", *target, {"label": "unhealthy"}],
+                    ["AWS/AutoScaling", "GroupDesiredCapacity", *asg, {"label": "desired"}],
+                    ["AWS/AutoScaling", "GroupInServiceInstances", *asg, {"label": "in service"}],
+                ], stat="Maximum", x=12, y=6),
+                widget("Web cpu", [
+                    ["AWS/EC2", "CPUUtilization", *asg, {"label": "cpu %"}],
+                    ["AWS/EC2", "CPUCreditBalance", *asg, {"label": "credit balance", "yAxis": "right"}],
+                ], x=0, y=12),
+                widget("Database", [
+                    ["AWS/RDS", "DatabaseConnections", *db, {"label": "connections"}],
+                    ["AWS/RDS", "CPUUtilization", *db, {"label": "cpu %"}],
+                    ["AWS/RDS", "CPUCreditBalance", *db, {"label": "credit balance", "yAxis": "right"}],
+                ], x=12, y=12),
+                widget("Web boot phases", [
+                    [{"expression": f"SEARCH('{{{BOOT_METRICS_NAMESPACE},AutoScalingGroupName,Phase}} "
+                                    f"MetricName=\"BootPhaseSeconds\" AutoScalingGroupName=\"{asg_name}\"', 'Average', 300)",
+                      "id": "phases"}],
+                    [BOOT_METRICS_NAMESPACE, "BootSeconds", *asg, {"stat": "Maximum", "label": "launch to ready"}],
+                ], x=0, y=18, unit_label="seconds"),
+            ]
+            return json.dumps({"widgets": widgets})
+
+        dashboard = aws.cloudwatch.Dashboard(f"{name}-dashboard",
+            dashboard_name=prefix,
+            dashboard_body=pulumi.Output.all(
+                args["awsRegion"],
+                args["albArnSuffix"],
+                args["targetGroupArnSuffix"],
+                args["autoscalingGroupName"],
+                args["dbIdentifier"],
+            ).apply(dashboard_body),
+            opts = pulumi.ResourceOptions(parent=self))
+
+        self.alarmTopicArn = alarm_topic.arn
+        self.dashboardName = dashboard.dashboard_name
+        self.register_outputs({
+            'alarmTopicArn': alarm_topic.arn,
+            'dashboardName': dashboard.dashboard_name
+        })
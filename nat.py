@@ -1,111 +1,163 @@
 import pulumi
 from pulumi import Input
-from typing import Optional, Dict, TypedDict, Any
+from typing import Optional, Dict, List, TypedDict, Any
 import pulumi_aws as aws
 
+# aws apis reached from the web instances (ssm agent, cloudwatch agent)
+DEFAULT_INTERFACE_ENDPOINTS = ["ssm", "ssmmessages", "ec2messages", "logs", "monitoring"]
+
 class NatArgs(TypedDict, total=False):
     igw: pulumi.Resource
     vpcId: Input[Any]
-    pubSubNat1: Input[Any]
-    pubSubNat2: Input[Any]
-    privSubWeb1: Input[Any]
-    privSubWeb2: Input[Any]
-    privSubDb1: Input[Any]
-    privSubDb2: Input[Any]
+    pubSubNats: List[Input[Any]]
+    privSubWebs: List[Input[Any]]
+    privSubDbs: List[Input[Any]]
+    singleNat: bool
+    awsRegion: Input[Any]
+    vpcCidr: Input[Any]
+    vpcEndpoints: bool
+    ipv6: bool
+    interfaceEndpoints: List[str]
 
 class Nat(pulumi.ComponentResource):
     def __init__(self, name: str, args: NatArgs, opts:Optional[pulumi.ResourceOptions] = None):
-        super().__init__("components:index:Nat", name, args, opts)
-
-        # eip-nat in public subnet 1
-        eip_nat1 = aws.ec2.Eip(f"{name}-eip_nat_1", tags={
-            "Name": "eip_nat_1",
-        },
-        opts = pulumi.ResourceOptions(parent=self))
-
-        # eip-nat in public subnet 2
-        eip_nat2 = aws.ec2.Eip(f"{name}-eip_nat_2", tags={
-            "Name": "eip_nat_2",
-        },
-        opts = pulumi.ResourceOptions(parent=self))
-
-        # nat gateway in public subnet 1
-        nat1 = aws.ec2.NatGateway(f"{name}-nat_1",
-            allocation_id=eip_nat1.id,
-            subnet_id=args["pubSubNat1"],
-            tags={
-                "Name": "nat-1",
-            },
-            opts=pulumi.ResourceOptions(parent=self, depends_on=[args["igw"]]))
-
-        # nat gateway in public subnet 2
-        nat2 = aws.ec2.NatGateway(f"{name}-nat_2",
-            allocation_id=eip_nat2.id,
-            subnet_id=args["pubSubNat2"],
-            tags={
-                "Name": "nat-2",
-            },
-            opts=pulumi.ResourceOptions(parent=self, depends_on=[args["igw"]]))
+        super().__init__("components:index:Nat", name, None, opts)
 
-        # private route table 1
-        private_rt1 = aws.ec2.RouteTable(f"{name}-private_rt_1",
-            vpc_id=args["vpcId"],
-            routes=[{
-                "cidr_block": "0.0.0.0/0",
-                "nat_gateway_id": nat1.id,
-            }],
-            tags={
-                "Name": "private_rt_1",
+        # one nat gateway per availability zone, or only the first one in
+        # single nat (cost) mode for dev stacks
+        single_nat = args.get("singleNat", False)
+        pub_subnets = args["pubSubNats"]
+        nat_subnets = pub_subnets[:1] if single_nat else pub_subnets
+
+        eips = []
+        nats = []
+        for i, subnet_id in enumerate(nat_subnets):
+            # eip-nat in public subnet
+            eip_nat = aws.ec2.Eip(f"{name}-eip_nat_{i + 1}", tags={
+                "Name": f"eip_nat_{i + 1}",
             },
             opts = pulumi.ResourceOptions(parent=self))
 
-        # private network for priv_sub_web_1 with route table 1
-        priv_sub_web1_rt = aws.ec2.RouteTableAssociation(f"{name}-priv_sub_web_1_rt",
-            subnet_id=args["privSubWeb1"],
-            route_table_id=private_rt1.id,
-            opts = pulumi.ResourceOptions(parent=self))
+            # nat gateway in public subnet
+            nat = aws.ec2.NatGateway(f"{name}-nat_{i + 1}",
+                allocation_id=eip_nat.id,
+                subnet_id=subnet_id,
+                tags={
+                    "Name": f"nat-{i + 1}",
+                },
+                opts=pulumi.ResourceOptions(parent=self, depends_on=[args["igw"]]))
 
-        # private network for priv_sub_web_2 with route table 1
-        priv_sub_web2_rt = aws.ec2.RouteTableAssociation(f"{name}-priv_sub_web_2_rt",
-            subnet_id=args["privSubWeb2"],
-            route_table_id=private_rt1.id,
-            opts = pulumi.ResourceOptions(parent=self))
+            eips.append(eip_nat)
+            nats.append(nat)
+
+        # ipv6 egress skips the nat gateways, and their per destination
+        # connection limits and per gb charge, through an egress only gateway
+        egress_only_gateway = None
+        if args.get("ipv6"):
+            egress_only_gateway = aws.ec2.EgressOnlyInternetGateway(f"{name}-egress_only_igw",
+                vpc_id=args["vpcId"],
+                tags={
+                    "Name": "egress_only_igw",
+                },
+                opts = pulumi.ResourceOptions(parent=self))
 
-        # private route table 2
-        private_rt2 = aws.ec2.RouteTable(f"{name}-private_rt_2",
-            vpc_id=args["vpcId"],
-            routes=[{
+        # private route table per availability zone, routed through the nat
+        # gateway in the same zone so egress never crosses zones
+        route_tables = []
+        for i in range(len(pub_subnets)):
+            nat = nats[0] if single_nat else nats[i]
+            routes = [{
                 "cidr_block": "0.0.0.0/0",
-                "nat_gateway_id": nat2.id,
-            }],
-            tags={
-                "Name": "private_rt_2",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
+                "nat_gateway_id": nat.id,
+            }]
+            if egress_only_gateway:
+                routes.append({
+                    "ipv6_cidr_block": "::/0",
+                    "egress_only_gateway_id": egress_only_gateway.id,
+                })
+            private_rt = aws.ec2.RouteTable(f"{name}-private_rt_{i + 1}",
+                vpc_id=args["vpcId"],
+                routes=routes,
+                tags={
+                    "Name": f"private_rt_{i + 1}",
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+            route_tables.append(private_rt)
 
-        # private network for priv_sub_db_1 with route table 2
-        priv_sub_db1_rt = aws.ec2.RouteTableAssociation(f"{name}-priv_sub_db_1_rt",
-            subnet_id=args["privSubDb1"],
-            route_table_id=private_rt2.id,
-            opts = pulumi.ResourceOptions(parent=self))
+        # private networks for web subnets with the route table of their zone
+        web_associations = []
+        for i, subnet_id in enumerate(args["privSubWebs"]):
+            web_rt = aws.ec2.RouteTableAssociation(f"{name}-priv_sub_web_{i + 1}_rt",
+                subnet_id=subnet_id,
+                route_table_id=route_tables[i].id,
+                opts = pulumi.ResourceOptions(parent=self))
+            web_associations.append(web_rt)
 
-        # private network for priv_sub_db_2 with route table 2
-        priv_sub_db2_rt = aws.ec2.RouteTableAssociation(f"{name}-priv_sub_db_2_rt",
-            subnet_id=args["privSubDb2"],
-            route_table_id=private_rt2.id,
-            opts = pulumi.ResourceOptions(parent=self))
+        # private networks for db subnets with the route table of their zone
+        for i, subnet_id in enumerate(args["privSubDbs"]):
+            aws.ec2.RouteTableAssociation(f"{name}-priv_sub_db_{i + 1}_rt",
+                subnet_id=subnet_id,
+                route_table_id=route_tables[i].id,
+                opts = pulumi.ResourceOptions(parent=self))
+
+        # endpoints keep s3 and aws api traffic off the nat gateways
+        endpoint_ids = []
+        if args.get("vpcEndpoints"):
+            s3_endpoint = aws.ec2.VpcEndpoint(f"{name}-s3_endpoint",
+                vpc_id=args["vpcId"],
+                service_name=pulumi.Output.concat("com.amazonaws.", args["awsRegion"], ".s3"),
+                vpc_endpoint_type="Gateway",
+                route_table_ids=[rt.id for rt in route_tables],
+                tags={
+                    "Name": "s3_endpoint",
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+            endpoint_ids.append(s3_endpoint.id)
+
+            interface_endpoints = args.get("interfaceEndpoints")
+            if interface_endpoints is None:
+                interface_endpoints = DEFAULT_INTERFACE_ENDPOINTS
+            if interface_endpoints:
+                endpoint_sec_group = aws.ec2.SecurityGroup(f"{name}-endpoint_sec_group",
+                    name="endpoint_security_group",
+                    vpc_id=args["vpcId"],
+                    opts = pulumi.ResourceOptions(parent=self))
+
+                endpoint_https = aws.vpc.SecurityGroupIngressRule(f"{name}-endpoint_https",
+                    security_group_id=endpoint_sec_group.id,
+                    from_port=443,
+                    to_port=443,
+                    ip_protocol="tcp",
+                    cidr_ipv4=args["vpcCidr"],
+                    description="Allow HTTPS from VPC to interface endpoints",
+                    opts = pulumi.ResourceOptions(parent=self))
+
+                for service in interface_endpoints:
+                    endpoint = aws.ec2.VpcEndpoint(f"{name}-{service}_endpoint",
+                        vpc_id=args["vpcId"],
+                        service_name=pulumi.Output.concat("com.amazonaws.", args["awsRegion"], f".{service}"),
+                        vpc_endpoint_type="Interface",
+                        subnet_ids=args["privSubWebs"],
+                        security_group_ids=[endpoint_sec_group.id],
+                        private_dns_enabled=True,
+                        tags={
+                            "Name": f"{service}_endpoint",
+                        },
+                        opts = pulumi.ResourceOptions(parent=self))
+                    endpoint_ids.append(endpoint.id)
 
-        self.eipNat1Id = eip_nat1.id
-        self.eipNat2Id = eip_nat2.id
-        self.nat1Id = nat1.id
-        self.nat2Id = nat2.id
-        self.privateRt1Id = private_rt1.id
-        self.privateRt2Id = private_rt2.id
+        self.eipNatIds = [eip.id for eip in eips]
+        self.natIds = [nat.id for nat in nats]
+        self.privateRtIds = [rt.id for rt in route_tables]
+        self.vpcEndpointIds = endpoint_ids
+        self.egressOnlyGatewayId = egress_only_gateway.id if egress_only_gateway else None
+        # what web subnet egress needs, for dependents that should not wait
+        # on the whole component
+        self.webEgress = nats + route_tables + web_associations
         self.register_outputs({
-            "eipNat1Id": eip_nat1.id,
-            "eipNat2Id": eip_nat2.id,
-            "nat1Id": nat1.id,
-            "nat2Id": nat2.id,
-            "privateRt1Id": private_rt1.id,
-            "privateRt2Id": private_rt2.id,
-        })
\ No newline at end of file
+            "eipNatIds": self.eipNatIds,
+            "natIds": self.natIds,
+            "privateRtIds": self.privateRtIds,
+            "vpcEndpointIds": self.vpcEndpointIds,
+            "egressOnlyGatewayId": self.egressOnlyGatewayId,
+        })
@@ -0,0 +1,67 @@
+"""Performance policy pack, run with a preview or an update:
+
+    pulumi preview --policy-pack policy
+    PERF_POLICY_ENFORCE=high pulumi up --policy-pack policy
+
+Every rule of ``rules.py`` is a stack validation policy. Violations are
+advisory unless ``PERF_POLICY_ENFORCE`` names a severity, in which case the
+rules of that severity and above are mandatory and block the deployment.
+"""
+import os
+import sys
+
+from pulumi_policy import (
+    EnforcementLevel,
+    PolicyPack,
+    PolicyResource,
+    ReportViolation,
+    Severity,
+    StackValidationArgs,
+    StackValidationPolicy,
+)
+
+# rules.py shares instance_types.py with the program in the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import RULES, SEVERITIES, Graph, Resource, Rule, is_enforced
+
+min_severity = os.environ.get("PERF_POLICY_ENFORCE") or None
+if min_severity is not None and min_severity not in SEVERITIES:
+    raise ValueError(f"PERF_POLICY_ENFORCE must be one of {', '.join(SEVERITIES)}, got {min_severity}")
+
+
+def to_resource(resource: PolicyResource) -> Resource:
+    dependencies = {dependency.urn for dependency in resource.dependencies}
+    for property_dependencies in resource.property_dependencies.values():
+        dependencies.update(dependency.urn for dependency in property_dependencies)
+    return Resource(
+        urn=resource.urn,
+        type=resource.resource_type,
+        name=resource.name,
+        props=resource.props,
+        parent=resource.parent.urn if resource.parent else None,
+        dependencies=sorted(dependencies),
+    )
+
+
+def stack_policy(rule: Rule) -> StackValidationPolicy:
+    def validate(args: StackValidationArgs, report_violation: ReportViolation) -> None:
+        graph = Graph(to_resource(resource) for resource in args.resources)
+        for resource, message in rule.check(graph):
+            report_violation(message, resource.urn)
+
+    return StackValidationPolicy(
+        name=rule.name,
+        description=rule.description,
+        validate=validate,
+        severity=Severity(rule.severity),
+        enforcement_level=EnforcementLevel.MANDATORY if is_enforced(rule.severity, min_severity)
+        else EnforcementLevel.ADVISORY,
+    )
+
+
+PolicyPack(
+    name="snakegame-performance",
+    enforcement_level=EnforcementLevel.ADVISORY,
+    policies=[stack_policy(rule) for rule in RULES],
+)
@@ -0,0 +1,208 @@
+"""Performance rules of the policy pack, independent of where the resources
+come from: ``policy/__main__.py`` runs them as a Pulumi policy pack during
+preview and update, ``tools.perf_policy`` runs them on the program under
+mocks. Rules only see resource properties that are known, so unknown values
+during a preview never produce a violation.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from instance_types import is_burstable
+
+SEVERITIES = ("low", "medium", "high")
+
+COMPONENT_PREFIX = "components:index:"
+
+# smallest component a depends_on on all of its resources is reported for
+MIN_COMPONENT_RESOURCES = 4
+
+# longest acceptable time for a new target to pass the health check
+MAX_TIME_TO_HEALTHY_S = 60
+
+
+@dataclass
+class Resource:
+    urn: str
+    type: str
+    name: str
+    props: Dict[str, Any]
+    parent: Optional[str] = None
+    dependencies: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Violation:
+    rule: str
+    severity: str
+    urn: str
+    name: str
+    message: str
+
+
+@dataclass
+class Rule:
+    name: str
+    severity: str
+    description: str
+    check: Callable[["Graph"], Iterable[Tuple[Resource, str]]]
+
+
+class Graph:
+    """Resources by urn with the lookups the rules share."""
+
+    def __init__(self, resources: Iterable[Resource]):
+        self.resources = {resource.urn: resource for resource in resources}
+
+    def of_type(self, typ: str) -> Iterator[Resource]:
+        return (r for r in self.resources.values() if r.type == typ)
+
+    def dependencies(self, resource: Resource, typ: Optional[str] = None) -> List[Resource]:
+        found = [self.resources[urn] for urn in resource.dependencies if urn in self.resources]
+        return [r for r in found if typ is None or r.type == typ]
+
+    def dependents(self, resource: Resource, typ: Optional[str] = None) -> List[Resource]:
+        return [r for r in self.resources.values()
+                if resource.urn in r.dependencies and (typ is None or r.type == typ)]
+
+    def ancestors(self, resource: Resource) -> List[str]:
+        urns = []
+        while resource.parent and resource.parent in self.resources:
+            urns.append(resource.parent)
+            resource = self.resources[resource.parent]
+        return urns
+
+    def custom_descendants(self, component: Resource) -> List[Resource]:
+        return [r for r in self.resources.values()
+                if not r.type.startswith(COMPONENT_PREFIX) and component.urn in self.ancestors(r)]
+
+
+def _burstable_without_credit_control(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    for template in graph.of_type("aws:ec2/launchTemplate:LaunchTemplate"):
+        instance_type = template.props.get("instanceType")
+        if isinstance(instance_type, str) and is_burstable(instance_type) \
+                and not template.props.get("creditSpecification"):
+            yield template, (f"{instance_type} instances are throttled to their baseline once their cpu "
+                             "credits run out; set creditSpecification (webCpuCredits)")
+
+    alarmed = {
+        (alarm.props.get("dimensions") or {}).get("DBInstanceIdentifier")
+        for alarm in graph.of_type("aws:cloudwatch/metricAlarm:MetricAlarm")
+        if alarm.props.get("metricName") == "CPUCreditBalance" and alarm.props.get("namespace") == "AWS/RDS"
+    }
+    for typ in ("aws:rds/instance:Instance", "aws:rds/clusterInstance:ClusterInstance"):
+        for db in graph.of_type(typ):
+            instance_class = db.props.get("instanceClass")
+            if isinstance(instance_class, str) and is_burstable(instance_class) \
+                    and db.props.get("identifier", db.name) not in alarmed:
+                yield db, (f"{instance_class} has no credit mode to set and nothing alarms on its "
+                           "CPUCreditBalance; use a non burstable class or enable Monitoring")
+
+
+def _slow_health_check(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    for target_group in graph.of_type("aws:lb/targetGroup:TargetGroup"):
+        health_check = target_group.props.get("healthCheck") or {}
+        interval = health_check.get("interval", 30)
+        healthy_threshold = health_check.get("healthyThreshold", 5)
+        if isinstance(interval, (int, float)) and isinstance(healthy_threshold, (int, float)) \
+                and interval * healthy_threshold > MAX_TIME_TO_HEALTHY_S:
+            yield target_group, (f"new targets need {interval:.0f}s x {healthy_threshold:.0f} = "
+                                 f"{interval * healthy_threshold:.0f}s of health checks before they get traffic")
+
+
+def _cross_az_nat(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    def zones(resources: Iterable[Resource]) -> set:
+        return {r.props.get("availabilityZone") for r in resources if r.props.get("availabilityZone")}
+
+    for association in graph.of_type("aws:ec2/routeTableAssociation:RouteTableAssociation"):
+        subnet_zones = zones(graph.dependencies(association, "aws:ec2/subnet:Subnet"))
+        for route_table in graph.dependencies(association, "aws:ec2/routeTable:RouteTable"):
+            for nat in graph.dependencies(route_table, "aws:ec2/natGateway:NatGateway"):
+                nat_zones = zones(graph.dependencies(nat, "aws:ec2/subnet:Subnet"))
+                if subnet_zones and nat_zones and not subnet_zones & nat_zones:
+                    yield association, (f"egress from {', '.join(sorted(subnet_zones))} goes through "
+                                        f"{nat.name} in {', '.join(sorted(nat_zones))}, paying cross-az "
+                                        "latency and transfer; use a nat gateway per zone (singleNat false)")
+
+
+def _component_wide_depends_on(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    components = [r for r in graph.resources.values() if r.type.startswith(COMPONENT_PREFIX)]
+    children = {c.urn: {r.urn for r in graph.custom_descendants(c)} for c in components}
+    for resource in graph.resources.values():
+        if resource.type.startswith(COMPONENT_PREFIX):
+            continue
+        dependencies = set(resource.dependencies)
+        ancestors = graph.ancestors(resource)
+        for component in components:
+            urns = children[component.urn]
+            if component.urn not in ancestors and len(urns) >= MIN_COMPONENT_RESOURCES and urns <= dependencies:
+                yield resource, (f"waits for all {len(urns)} resources of {component.name}; depend on the "
+                                 "resources it needs only (see Nat.webEgress)")
+
+
+def _latest_launch_template_without_refresh(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    for group in graph.of_type("aws:autoscaling/group:Group"):
+        specifications = [group.props.get("launchTemplate") or {}]
+        mixed = (group.props.get("mixedInstancesPolicy") or {}).get("launchTemplate") or {}
+        specifications.append(mixed.get("launchTemplateSpecification") or {})
+        if any(spec.get("version") == "$Latest" for spec in specifications) \
+                and not group.props.get("instanceRefresh"):
+            yield group, ("launch template version $Latest without instanceRefresh leaves running "
+                          "instances on the old template until they are replaced")
+
+
+def _gp2_storage(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    for template in graph.of_type("aws:ec2/launchTemplate:LaunchTemplate"):
+        if "blockDeviceMappings" in template.props and not any(
+                (mapping.get("ebs") or {}).get("volumeType") == "gp3"
+                for mapping in template.props.get("blockDeviceMappings") or []):
+            yield template, "root volume keeps the gp2 type of the ami; map it as gp3 (webRootVolume*)"
+    for db in graph.of_type("aws:rds/instance:Instance"):
+        if db.props.get("storageType") == "gp2":
+            yield db, "gp2 storage ties iops to volume size; use gp3 (dbStorageType)"
+
+
+def _coarse_scaling_metrics(graph: Graph) -> Iterator[Tuple[Resource, str]]:
+    for group in graph.of_type("aws:autoscaling/group:Group"):
+        tracking = [p for p in graph.dependents(group, "aws:autoscaling/policy:Policy")
+                    if p.props.get("policyType") == "TargetTrackingScaling"]
+        if not tracking:
+            continue
+        for template in graph.dependencies(group, "aws:ec2/launchTemplate:LaunchTemplate"):
+            monitoring = template.props.get("monitoring")
+            if "monitoring" in template.props and not (monitoring or {}).get("enabled"):
+                yield template, ("target tracking scales on 5 minute metrics without detailed "
+                                 "monitoring (webDetailedMonitoring)")
+
+
+RULES: List[Rule] = [
+    Rule("burstable-without-credit-control", "medium",
+         "Burstable web and database instances without credit control", _burstable_without_credit_control),
+    Rule("slow-health-check", "medium",
+         "Target groups taking more than a minute to mark a new target healthy", _slow_health_check),
+    Rule("cross-az-nat", "high",
+         "Private subnets routed through a nat gateway in another availability zone", _cross_az_nat),
+    Rule("component-wide-depends-on", "medium",
+         "Resources depending on every resource of another component", _component_wide_depends_on),
+    Rule("latest-launch-template-without-refresh", "medium",
+         "Autoscaling groups on launch template $Latest without instance refresh",
+         _latest_launch_template_without_refresh),
+    Rule("gp2-storage", "low",
+         "Instance and database volumes left on gp2", _gp2_storage),
+    Rule("coarse-scaling-metrics", "low",
+         "Target tracking on instances without detailed monitoring", _coarse_scaling_metrics),
+]
+
+
+def is_enforced(severity: str, min_severity: Optional[str]) -> bool:
+    """Whether violations of ``severity`` block a deployment in enforce mode
+    from ``min_severity`` up; None enforces nothing."""
+    return min_severity is not None and SEVERITIES.index(severity) >= SEVERITIES.index(min_severity)
+
+
+def evaluate(resources: Iterable[Resource], rules: Optional[List[Rule]] = None) -> List[Violation]:
+    graph = Graph(resources)
+    violations = []
+    for rule in rules or RULES:
+        for resource, message in rule.check(graph):
+            violations.append(Violation(rule.name, rule.severity, resource.urn, resource.name, message))
+    return violations
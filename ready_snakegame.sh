@@ -0,0 +1,96 @@
+#!/bin/bash
+set -e
+exec >> /var/log/user-data.log 2>&1
+PHASES_FILE=${BOOT_PHASES_FILE:-/var/log/snakegame-boot-phases}
+
+# imdsv2 session token for every metadata read
+imds() {
+  local token
+  token=$(curl -sf -X PUT http://169.254.169.254/latest/api/token \
+    -H "X-aws-ec2-metadata-token-ttl-seconds: 60")
+  curl -sf -H "X-aws-ec2-metadata-token: $token" "http://169.254.169.254/latest/$1"
+}
+
+# wait until the app answers through nginx
+for i in $(seq 300); do
+  curl -sf -o /dev/null http://127.0.0.1/ && break
+  sleep 1
+done
+boot_phase ready
+
+# seconds spent in every phase, from the uptime at the start of each one;
+# os_boot is everything before the first bootstrap script
+INSTANCE_ID=$(imds meta-data/instance-id)
+export AWS_DEFAULT_REGION=$(imds meta-data/placement/region)
+ASG_NAME=$(aws autoscaling describe-auto-scaling-instances --instance-ids "$INSTANCE_ID" \
+  --query 'AutoScalingInstances[0].AutoScalingGroupName' --output text || true)
+METRIC_DATA=$(awk -v asg="$ASG_NAME" '
+  function metric(name, phase, value) {
+    printf "%s{\"MetricName\":\"%s\",\"Unit\":\"Seconds\",\"Value\":%.3f,\"Dimensions\":[{\"Name\":\"AutoScalingGroupName\",\"Value\":\"%s\"}", n++ ? "," : "", name, value, asg
+    if (phase != "") printf ",{\"Name\":\"Phase\",\"Value\":\"%s\"}", phase
+    printf "]}"
+  }
+  BEGIN { printf "[" }
+  NR == 1 { metric("BootPhaseSeconds", "os_boot", $2) }
+  NR > 1 { metric("BootPhaseSeconds", phase, $2 - at) }
+  { phase = $1; at = $2 }
+  END { metric("BootSeconds", "", at); printf "]" }
+' "$PHASES_FILE")
+if [ -n "$ASG_NAME" ] && [ "$ASG_NAME" != "None" ]; then
+  aws cloudwatch put-metric-data --namespace "${BOOT_METRICS_NAMESPACE:-SnakeGame/Boot}" \
+    --metric-data "$METRIC_DATA" || echo "could not publish boot phase metrics"
+fi
+
+[ -n "$LAUNCH_HOOK_NAME" ] || exit 0
+
+# completes the launch lifecycle hook whenever the group moves the instance
+# towards service or the warm pool and the app answers, also after a warmed
+# instance is started again
+cat > /usr/local/bin/snakegame-lifecycle <<'AGENT'
+#!/bin/bash
+imds() {
+  local token
+  token=$(curl -sf -X PUT http://169.254.169.254/latest/api/token \
+    -H "X-aws-ec2-metadata-token-ttl-seconds: 60")
+  curl -sf -H "X-aws-ec2-metadata-token: $token" "http://169.254.169.254/latest/$1"
+}
+INSTANCE_ID=$(imds meta-data/instance-id)
+export AWS_DEFAULT_REGION=$(imds meta-data/placement/region)
+completed=""
+while true; do
+  state=$(imds meta-data/autoscaling/target-lifecycle-state || true)
+  case "$state" in
+    InService|Warmed:*)
+      if [ "$state" != "$completed" ] && curl -sf -o /dev/null http://127.0.0.1/; then
+        asg=$(aws autoscaling describe-auto-scaling-instances --instance-ids "$INSTANCE_ID" \
+          --query 'AutoScalingInstances[0].AutoScalingGroupName' --output text)
+        # fails once there is no pending action, e.g. after a restart
+        aws autoscaling complete-lifecycle-action --lifecycle-hook-name "$LAUNCH_HOOK_NAME" \
+          --auto-scaling-group-name "$asg" --instance-id "$INSTANCE_ID" \
+          --lifecycle-action-result CONTINUE || true
+        completed=$state
+      fi
+      ;;
+  esac
+  sleep 5
+done
+AGENT
+chmod +x /usr/local/bin/snakegame-lifecycle
+
+cat > /etc/systemd/system/snakegame-lifecycle.service <<UNIT
+[Unit]
+Description=SnakeGame launch lifecycle hook agent
+After=nginx.service snakegame.service
+
+[Service]
+EnvironmentFile=/etc/snakegame.env
+ExecStart=/usr/local/bin/snakegame-lifecycle
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+UNIT
+
+systemctl daemon-reload
+systemctl enable --now snakegame-lifecycle
@@ -5,10 +5,11 @@ import pulumi_aws as aws
 
 class SecGroupArgs(TypedDict, total=False):
     vpcId: Input[Any]
+    ipv6: bool
 
 class SecGroup(pulumi.ComponentResource):
     def __init__(self, name: str, args: SecGroupArgs, opts:Optional[pulumi.ResourceOptions] = None):
-        super().__init__("components:index:SecGroup", name, args, opts)
+        super().__init__("components:index:SecGroup", name, None, opts)
 
         #sec groups
         alb_sec_group = aws.ec2.SecurityGroup(f"{name}-alb_sec_group",
@@ -26,6 +27,11 @@ class SecGroup(pulumi.ComponentResource):
             vpc_id=args["vpcId"],
             opts = pulumi.ResourceOptions(parent=self))
 
+        cache_sec_group = aws.ec2.SecurityGroup(f"{name}-cache_sec_group",
+            name="cache_security_group",
+            vpc_id=args["vpcId"],
+            opts = pulumi.ResourceOptions(parent=self))
+
         alb_http = aws.vpc.SecurityGroupIngressRule(f"{name}-alb_http",
             security_group_id=alb_sec_group.id,
             from_port=80,
@@ -44,6 +50,17 @@ class SecGroup(pulumi.ComponentResource):
             description="Allow HTTPS from Internet to ALB",
             opts = pulumi.ResourceOptions(parent=self))
 
+        if args.get("ipv6"):
+            for port, protocol in ((80, "http"), (443, "https")):
+                aws.vpc.SecurityGroupIngressRule(f"{name}-alb_{protocol}_ipv6",
+                    security_group_id=alb_sec_group.id,
+                    from_port=port,
+                    to_port=port,
+                    ip_protocol="tcp",
+                    cidr_ipv6="::/0",
+                    description=f"Allow {protocol.upper()} over IPv6 from Internet to ALB",
+                    opts = pulumi.ResourceOptions(parent=self))
+
         web_http = aws.vpc.SecurityGroupIngressRule(f"{name}-web_http",
             security_group_id=web_sec_group.id,
             from_port=80,
@@ -62,6 +79,24 @@ class SecGroup(pulumi.ComponentResource):
             description="Allow MySQL from Web Servers to DB",
             opts = pulumi.ResourceOptions(parent=self))
 
+        db_mysql_proxy = aws.vpc.SecurityGroupIngressRule(f"{name}-db_mysql_proxy",
+            security_group_id=db_sec_group.id,
+            from_port=3306,
+            to_port=3306,
+            ip_protocol="tcp",
+            referenced_security_group_id=db_sec_group.id,
+            description="Allow MySQL from RDS Proxy to DB",
+            opts = pulumi.ResourceOptions(parent=self))
+
+        cache_redis = aws.vpc.SecurityGroupIngressRule(f"{name}-cache_redis",
+            security_group_id=cache_sec_group.id,
+            from_port=6379,
+            to_port=6379,
+            ip_protocol="tcp",
+            referenced_security_group_id=web_sec_group.id,
+            description="Allow Redis from Web Servers to Cache",
+            opts = pulumi.ResourceOptions(parent=self))
+
         # Egress rules using aws_vpc_security_group_egress_rule:
         alb_egress = aws.vpc.SecurityGroupEgressRule(f"{name}-alb_egress",
             security_group_id=alb_sec_group.id,
@@ -81,6 +116,14 @@ class SecGroup(pulumi.ComponentResource):
             description="Allow all outbound from Web Servers",
             opts = pulumi.ResourceOptions(parent=self))
 
+        if args.get("ipv6"):
+            web_egress_ipv6 = aws.vpc.SecurityGroupEgressRule(f"{name}-web_egress_ipv6",
+                security_group_id=web_sec_group.id,
+                ip_protocol="-1",
+                cidr_ipv6="::/0",
+                description="Allow all outbound over IPv6 from Web Servers",
+                opts = pulumi.ResourceOptions(parent=self))
+
         db_egress = aws.vpc.SecurityGroupEgressRule(f"{name}-db_egress",
             security_group_id=db_sec_group.id,
             from_port=0,
@@ -93,8 +136,10 @@ class SecGroup(pulumi.ComponentResource):
         self.albSecGroupId = alb_sec_group.id
         self.webSecGroupId = web_sec_group.id
         self.dbSecGroupId = db_sec_group.id
+        self.cacheSecGroupId = cache_sec_group.id
         self.register_outputs({
             'albSecGroupId': alb_sec_group.id, 
             'webSecGroupId': web_sec_group.id, 
-            'dbSecGroupId': db_sec_group.id
+            'dbSecGroupId': db_sec_group.id,
+            'cacheSecGroupId': cache_sec_group.id
         })
\ No newline at end of file
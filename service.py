@@ -0,0 +1,129 @@
+import pulumi
+from pulumi import Input
+from typing import Optional, Dict, List, TypedDict, Any
+import pulumi_aws as aws
+from alb import validate_slow_start
+from web import Web, WebArgs
+
+# listener rule priorities allowed by elastic load balancing
+MIN_PRIORITY = 1
+MAX_PRIORITY = 50000
+
+# longest target group name
+MAX_TARGET_GROUP_NAME = 32
+
+def validate_services(services: List[Dict[str, Any]]) -> None:
+    """Check the service registry from stack config before anything is
+    created: unique names and priorities, and at least one host or path
+    condition per service."""
+    names = set()
+    priorities = set()
+    for service in services:
+        name = service.get("name")
+        if not name:
+            raise ValueError(f"service without a name: {service}")
+        if name in names:
+            raise ValueError(f"service {name} is registered twice")
+        names.add(name)
+
+        priority = service.get("priority")
+        if not isinstance(priority, int) or not MIN_PRIORITY <= priority <= MAX_PRIORITY:
+            raise ValueError(f"service {name} needs a priority between {MIN_PRIORITY} and {MAX_PRIORITY}")
+        if priority in priorities:
+            raise ValueError(f"service {name} reuses listener rule priority {priority}")
+        priorities.add(priority)
+
+        if not service.get("hostHeaders") and not service.get("pathPatterns"):
+            raise ValueError(f"service {name} needs hostHeaders or pathPatterns")
+
+class ServiceArgs(TypedDict, total=False):
+    projectName: Input[Any]
+    serviceName: str
+    vpcId: Input[Any]
+    listenerArn: Input[Any]
+    albArnSuffix: Input[Any]
+    priority: int
+    hostHeaders: List[str]
+    pathPatterns: List[str]
+    loadBalancingAlgorithm: Input[str]
+    slowStart: Input[int]
+    deregistrationDelay: Input[int]
+    healthCheckPath: Input[str]
+    healthCheckInterval: Input[int]
+    healthCheckTimeout: Input[int]
+    healthyThreshold: Input[int]
+    unhealthyThreshold: Input[int]
+    web: WebArgs
+
+# a workload behind the shared alb: its own target group, a listener rule
+# routing its hosts and paths there, and a web tier scaling on its own
+class Service(pulumi.ComponentResource):
+    def __init__(self, name: str, args: ServiceArgs, opts:Optional[pulumi.ResourceOptions] = None):
+        super().__init__("components:index:Service", name, None, opts)
+
+        service_name = args["serviceName"]
+        physical_name = f"{args["projectName"]}-{service_name}"
+        if isinstance(physical_name, str) and len(f"{physical_name}-tg") > MAX_TARGET_GROUP_NAME:
+            raise ValueError(f"target group name {physical_name}-tg is longer than {MAX_TARGET_GROUP_NAME} characters")
+        validate_slow_start(args.get("loadBalancingAlgorithm", "round_robin"), args.get("slowStart", 0))
+
+        service_target = aws.lb.TargetGroup(f"{name}-target",
+            name=f"{physical_name}-tg",
+            port=80,
+            protocol="HTTP",
+            vpc_id=args["vpcId"],
+            load_balancing_algorithm_type=args.get("loadBalancingAlgorithm", "round_robin"),
+            slow_start=args.get("slowStart", 0),
+            deregistration_delay=args.get("deregistrationDelay", 300),
+            health_check={
+                "path": args.get("healthCheckPath", "/"),
+                "protocol": "HTTP",
+                "matcher": "200-399",
+                "interval": args.get("healthCheckInterval", 30),
+                "timeout": args.get("healthCheckTimeout", 5),
+                "healthy_threshold": args.get("healthyThreshold", 5),
+                "unhealthy_threshold": args.get("unhealthyThreshold", 2),
+            },
+            opts = pulumi.ResourceOptions(parent=self))
+
+        # all conditions of a rule have to match
+        conditions = []
+        if args.get("hostHeaders"):
+            conditions.append({
+                "host_header": {"values": args["hostHeaders"]},
+            })
+        if args.get("pathPatterns"):
+            conditions.append({
+                "path_pattern": {"values": args["pathPatterns"]},
+            })
+
+        service_rule = aws.lb.ListenerRule(f"{name}-rule",
+            listener_arn=args["listenerArn"],
+            priority=args["priority"],
+            conditions=conditions,
+            actions=[{
+                "type": "forward",
+                "target_group_arn": service_target.arn,
+            }],
+            tags={
+                "Name": f"{physical_name}-rule",
+            },
+            opts = pulumi.ResourceOptions(parent=self))
+
+        web = Web(f"{name}-web", {
+            **args["web"],
+            "projectName": physical_name,
+            "targetGroupArn": service_target.arn,
+            "targetGroupArnSuffix": service_target.arn_suffix,
+            "albArnSuffix": args["albArnSuffix"],
+        }, opts = pulumi.ResourceOptions(parent=self))
+
+        self.targetGroupArn = service_target.arn
+        self.targetGroupArnSuffix = service_target.arn_suffix
+        self.autoscalingGroupName = web.autoscalingGroupName
+        self.register_outputs({
+            'targetGroupArn': service_target.arn,
+            'targetGroupArnSuffix': service_target.arn_suffix,
+            'listenerRuleArn': service_rule.arn,
+            'autoscalingGroupName': web.autoscalingGroupName
+        })
@@ -0,0 +1,69 @@
+#!/bin/bash
+set -e
+exec >> /var/log/user-data.log 2>&1
+APP_DIR=/home/SnakeGame
+WORKERS=$(( $(nproc) * ${WORKERS_PER_CPU:-2} + 1 ))
+
+# gunicorn app server, supervised and restarted by systemd
+cat > /etc/systemd/system/snakegame.service <<UNIT
+[Unit]
+Description=SnakeGame gunicorn app server
+After=network.target
+
+[Service]
+WorkingDirectory=$APP_DIR
+EnvironmentFile=/etc/snakegame.env
+ExecStart=$(command -v gunicorn || echo /usr/local/bin/gunicorn) \\
+  --bind 127.0.0.1:8000 \\
+  --workers $WORKERS \\
+  --threads ${WORKER_THREADS:-1} \\
+  --timeout ${WORKER_TIMEOUT:-30} \\
+  --keep-alive ${KEEPALIVE_TIMEOUT:-75} \\
+  ${APP_MODULE:-app:app}
+Restart=always
+RestartSec=2
+
+[Install]
+WantedBy=multi-user.target
+UNIT
+
+# nginx in front: keepalive to the alb and to gunicorn, gzip, static files
+cat > /etc/nginx/conf.d/snakegame.conf <<CONF
+upstream snakegame {
+    server 127.0.0.1:8000;
+    keepalive 32;
+}
+
+server {
+    listen 80 default_server;
+    keepalive_timeout ${KEEPALIVE_TIMEOUT:-75}s;
+    keepalive_requests 10000;
+
+    gzip on;
+    gzip_comp_level 5;
+    gzip_min_length 1024;
+    gzip_types text/css application/javascript application/json image/svg+xml;
+
+    location /static/ {
+        alias $APP_DIR/static/;
+        expires 7d;
+        access_log off;
+    }
+
+    location / {
+        proxy_pass http://snakegame;
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host \$host;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$http_x_forwarded_proto;
+    }
+}
+CONF
+# drop the stock default server so ours owns port 80
+sed -i '/^    server {/,/^    }/d' /etc/nginx/nginx.conf
+
+systemctl daemon-reload
+systemctl enable --now snakegame
+systemctl enable nginx
+systemctl restart nginx
@@ -0,0 +1,24 @@
+import pytest
+
+from alb import validate_slow_start
+
+
+@pytest.mark.parametrize("algorithm, slow_start", [
+    ("round_robin", 30),
+    ("least_outstanding_requests", 0),
+    ("weighted_random", 30),
+])
+def test_slow_start_is_accepted(algorithm, slow_start):
+    validate_slow_start(algorithm, slow_start)
+
+
+def test_slow_start_with_least_outstanding_requests_is_rejected():
+    with pytest.raises(ValueError, match="least_outstanding_requests"):
+        validate_slow_start("least_outstanding_requests", 30)
+
+
+def test_program_rejects_slow_start_with_least_outstanding_requests():
+    from tools.mock_program import run_program
+
+    with pytest.raises(ValueError, match="slowStart 30 cannot be combined"):
+        run_program(overrides={"albSlowStart": 30})
@@ -0,0 +1,115 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from tools.alb_logs import (
+    BUCKET_GROWTH,
+    OTHER_PATHS,
+    Histogram,
+    analyze,
+    lines_of,
+    normalize_path,
+    parse_line,
+    report_to_dict,
+)
+
+LOG = os.path.join(os.path.dirname(__file__), "fixtures", "alb_access.log")
+
+
+@pytest.fixture
+def lines():
+    with open(LOG) as f:
+        return f.readlines()
+
+
+def test_parse_forwarded_request(lines):
+    entry = parse_line(lines[0])
+
+    assert (entry.target, entry.method, entry.path) == ("10.10.2.15", "GET", "/api/scores/{id}")
+    assert (entry.elb_status, entry.target_status) == (200, 200)
+    assert entry.times == {"request": 0.001, "target": 0.045, "response": 0.0}
+
+
+def test_parse_unreached_target(lines):
+    failed, no_target = parse_line(lines[1]), parse_line(lines[2])
+
+    assert (failed.target, failed.elb_status, failed.target_status) == ("10.10.12.7", 502, None)
+    assert failed.times == {"request": 0.0, "target": -1.0, "response": -1.0}
+    assert (no_target.target, no_target.elb_status) == ("-", 503)
+    assert all(value == -1 for value in no_target.times.values())
+
+
+def test_parse_quoted_fields_with_spaces(lines):
+    # the user agents and tls fields around the request are quoted with spaces
+    entry = parse_line(lines[3])
+
+    assert (entry.method, entry.path, entry.target) == ("GET", "/api/games/{id}/state", "10.10.12.7")
+    assert entry.times["target"] == 0.12
+
+
+def test_parse_malformed_request_and_garbage(lines):
+    malformed = parse_line(lines[5])
+
+    assert (malformed.method, malformed.elb_status) == ("-", 400)
+    assert parse_line(lines[6]) is None
+
+
+@pytest.mark.parametrize("url, path", [
+    ("http://alb:80/api/scores/12345", "/api/scores/{id}"),
+    ("https://host:443/api/games/3f2b8c1e-9d4a-4f6b-8a2e-1c5d7e9f0a3b/state?since=10", "/api/games/{id}/state"),
+    ("http://alb:80/sessions/0123456789abcdef0123", "/sessions/{id}"),
+    ("http://alb:80/static/app.js?v=2", "/static/app.js"),
+    ("http://alb:80", "/"),
+])
+def test_normalize_path(url, path):
+    assert normalize_path(url) == path
+
+
+def test_analyze_counts(lines):
+    report = analyze(lines)
+    overall = report.overall.to_dict()
+
+    assert (report.lines, report.skipped, report.overall.requests) == (7, 1, 6)
+    assert overall["elb_5xx_rate"] == pytest.approx(2 / 6)
+    assert overall["unreached_rate"] == pytest.approx(3 / 6)
+    assert overall["latency_s"]["target"]["count"] == 3
+    assert report.targets["10.10.12.7"].unreached == 1
+    assert sorted(report.paths) == ["- /", "GET /", "GET /api/games/{id}/state", "GET /api/scores/{id}",
+                                    "GET /static/app.js", "POST /api/scores"]
+
+
+def test_paths_over_the_limit_count_as_other(lines):
+    report = analyze(lines, max_paths=2)
+
+    assert sorted(report.paths) == sorted(["GET /api/scores/{id}", "POST /api/scores", OTHER_PATHS])
+    assert report.paths[OTHER_PATHS].requests == 4
+    assert sum(s.requests for s in report.paths.values()) == report.overall.requests
+
+
+def test_percentiles_are_bucket_upper_bounds():
+    histogram = Histogram()
+    values = [i / 1000 for i in range(1, 1001)]
+    for value in values:
+        histogram.record(value)
+
+    for q in (50, 95, 99):
+        exact = values[int(len(values) * q / 100) - 1]
+        assert exact <= histogram.percentile(q) <= exact * BUCKET_GROWTH
+    assert histogram.percentile(100) == max(values)
+    assert histogram.mean() == pytest.approx(sum(values) / len(values))
+    assert Histogram().percentile(50) is None
+
+
+def test_reads_gzipped_logs_from_directories(tmp_path, lines):
+    directory = tmp_path / "AWSLogs" / "eu-central-1"
+    directory.mkdir(parents=True)
+    shutil.copy(LOG, directory / "a.log")
+    with gzip.open(directory / "b.log.gz", "wt") as f:
+        f.writelines(lines)
+    (directory / "ignored.txt").write_text("x")
+
+    report = analyze(lines_of([str(tmp_path)]))
+
+    assert report_to_dict(report)["overall"]["requests"] == 12
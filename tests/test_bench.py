@@ -0,0 +1,36 @@
+from tools.bench import compare, graph_metrics, timing_metrics
+
+RESULT = {
+    "wall_s": 1.5,
+    "peak_mb": 140.0,
+    "resources": 91,
+    "dependencies": 168,
+    "critical_path_s": 1939.0,
+    "components": {"vpc": {"type": "Vpc", "construct_s": 0.4, "resolve_s": 1.0, "resources": 11}},
+}
+
+
+def test_graph_metrics_leave_out_timings():
+    metrics = graph_metrics(RESULT)
+
+    assert metrics == {
+        "resources": 91,
+        "dependencies": 168,
+        "critical_path_s": 1939.0,
+        "components": {"vpc": {"type": "Vpc", "resources": 11}},
+    }
+    assert "wall_s" not in metrics and "peak_mb" not in metrics
+
+
+def test_graph_growth_is_a_regression_on_any_machine():
+    baseline = {"az2": graph_metrics({**RESULT, "dependencies": 160})}
+
+    assert compare(baseline, {}, {"az2": RESULT}, 0.25) == ["az2: dependencies 168 > baseline 160"]
+
+
+def test_timings_are_only_compared_with_local_timings():
+    slow = {**RESULT, "wall_s": 10.0}
+
+    assert compare({"az2": graph_metrics(RESULT)}, {}, {"az2": slow}, 0.25) == []
+    assert compare({}, {"az2": timing_metrics(RESULT)}, {"az2": slow}, 0.25) == [
+        "az2: wall_s 10.0 > baseline 1.5 (+25%)"]
@@ -0,0 +1,74 @@
+import pytest
+
+from cdn import ALL_VIEWER_EXCEPT_HOST_HEADER_ORIGIN_REQUEST_POLICY_ID, ALL_VIEWER_ORIGIN_REQUEST_POLICY_ID
+from tools.mock_program import run_program
+
+CERTIFICATE_ARN = "arn:aws:acm:eu-central-1:123456789012:certificate/mock"
+ORIGIN_DOMAIN = "origin.zavrsni.example.com"
+
+
+def distribution(run):
+    return next(r.inputs for r in run.resources if r.typ == "aws:cloudfront/distribution:Distribution")
+
+
+def uploaded(run):
+    return {r.inputs["key"]: r.inputs["contentType"]
+            for r in run.resources if r.typ == "aws:s3/bucketObjectv2:BucketObjectv2"}
+
+
+def alb_origin(run):
+    origin = next(o for o in distribution(run)["origins"] if o["originId"] == "alb")
+    return origin["domainName"], origin["customOriginConfig"]["originProtocolPolicy"]
+
+
+def test_no_static_behavior_without_assets():
+    run = run_program()
+
+    assert uploaded(run) == {}
+    assert not distribution(run).get("orderedCacheBehaviors")
+    assert alb_origin(run) == (run.outputs["albDns"], "http-only")
+    assert distribution(run)["defaultCacheBehavior"]["originRequestPolicyId"] == ALL_VIEWER_ORIGIN_REQUEST_POLICY_ID
+
+
+def test_static_dir_is_uploaded_and_routed(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "app.css").write_text("body {}")
+    (tmp_path / "app.js").write_text("start()")
+
+    run = run_program(overrides={"cdnStaticDir": str(tmp_path)})
+
+    assert uploaded(run) == {"static/app.js": "text/javascript", "static/css/app.css": "text/css"}
+    assert [b["pathPattern"] for b in distribution(run)["orderedCacheBehaviors"]] == ["/static/*"]
+
+
+def test_alb_origin_uses_https_to_a_name_the_certificate_covers():
+    run = run_program(overrides={"albCertificateArn": CERTIFICATE_ARN, "cdnAlbOriginDomain": ORIGIN_DOMAIN})
+
+    assert alb_origin(run) == (ORIGIN_DOMAIN, "https-only")
+    # the certificate is checked against the host header sent to the origin
+    assert distribution(run)["defaultCacheBehavior"]["originRequestPolicyId"] == \
+        ALL_VIEWER_EXCEPT_HOST_HEADER_ORIGIN_REQUEST_POLICY_ID
+    assert not [r for r in run.resources if r.typ == "aws:route53/record:Record"]
+
+    run = run_program(overrides={"albCertificateArn": CERTIFICATE_ARN, "cdnAlbOriginDomain": ORIGIN_DOMAIN,
+                                 "cdnAlbOriginProtocolPolicy": "match-viewer"})
+    assert alb_origin(run) == (ORIGIN_DOMAIN, "match-viewer")
+
+
+def test_alb_origin_alias_record():
+    run = run_program(overrides={"albCertificateArn": CERTIFICATE_ARN, "cdnAlbOriginDomain": ORIGIN_DOMAIN,
+                                 "cdnAlbOriginZoneId": "Z0123456789"})
+
+    record = next(r.inputs for r in run.resources if r.typ == "aws:route53/record:Record")
+    assert record["zoneId"] == "Z0123456789"
+    assert record["name"] == ORIGIN_DOMAIN
+    assert record["aliases"][0]["name"] == run.outputs["albDns"]
+
+
+@pytest.mark.parametrize("overrides, match", [
+    ({}, "needs cdnAlbOriginDomain"),
+    ({"cdnAlbOriginDomain": ORIGIN_DOMAIN, "cdnAlbOriginProtocolPolicy": "http-only"}, "loops"),
+])
+def test_alb_origin_with_a_certificate_rejects_unverifiable_setups(overrides, match):
+    with pytest.raises(ValueError, match=match):
+        run_program(overrides={"albCertificateArn": CERTIFICATE_ARN, **overrides})
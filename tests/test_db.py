@@ -0,0 +1,33 @@
+from tools.mock_program import run_program
+
+
+def parameters(overrides=None):
+    run = run_program(overrides=overrides)
+    group = next(r.inputs for r in run.resources
+                 if r.typ in ("aws:rds/parameterGroup:ParameterGroup",
+                              "aws:rds/clusterParameterGroup:ClusterParameterGroup"))
+    return {p["name"]: (p["value"], p["applyMethod"]) for p in group["parameters"]}
+
+
+def test_mysql_parameters_differ_from_the_rds_defaults():
+    assert parameters() == {
+        "innodb_io_capacity": ("2000", "immediate"),
+        "innodb_io_capacity_max": ("3000", "immediate"),
+        "wait_timeout": ("300", "immediate"),
+    }
+
+
+def test_parameters_are_overridable():
+    assert parameters({"dbParameters": {"wait_timeout": "600", "innodb_read_io_threads": "8"}}) == {
+        "innodb_io_capacity": ("2000", "immediate"),
+        "innodb_io_capacity_max": ("3000", "immediate"),
+        "innodb_read_io_threads": ("8", "pending-reboot"),
+        "wait_timeout": ("600", "immediate"),
+    }
+
+
+def test_aurora_parameters():
+    assert parameters({"dbEngine": "aurora-mysql", "dbInstanceClass": "db.t3.medium"}) == {
+        "interactive_timeout": ("300", "immediate"),
+        "wait_timeout": ("300", "immediate"),
+    }
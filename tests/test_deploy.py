@@ -0,0 +1,101 @@
+import shutil
+
+import pytest
+import yaml
+
+from tools.deploy import Target, deploy, load_targets
+from tools.mock_program import project_name
+
+# the automation api drives the pulumi cli, even for a file backend
+needs_cli = pytest.mark.skipif(shutil.which("pulumi") is None, reason="needs the pulumi cli")
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("PULUMI_CONFIG_PASSPHRASE", "test")
+    monkeypatch.setenv("DB_PASSWORD", "db-password")
+    state = tmp_path / "state"
+    state.mkdir()
+    return f"file://{state}"
+
+
+def backend_config(backend, stack_name):
+    from pulumi import automation as auto
+
+    project = project_name()
+    stack = auto.select_stack(
+        stack_name=stack_name,
+        project_name=project,
+        program=lambda: None,
+        opts=auto.LocalWorkspaceOptions(
+            project_settings=auto.ProjectSettings(name=project, runtime="python",
+                                                  backend=auto.ProjectBackend(backend)),
+            env_vars={"PULUMI_CONFIG_PASSPHRASE": "test"},
+        ))
+    return stack.get_all_config()
+
+
+def test_load_targets(tmp_path):
+    path = tmp_path / "targets.yaml"
+    path.write_text(yaml.safe_dump([
+        {"stack": "prod-euc1", "region": "eu-central-1"},
+        {"stack": "prod-use1", "region": "us-east-1", "config": {"azCount": 3}},
+    ]))
+
+    targets = load_targets(str(path))
+
+    assert [t.stack for t in targets] == ["prod-euc1", "prod-use1"]
+    assert targets[1].overrides() == {"azCount": 3, "aws:region": "us-east-1", "awsRegion": "us-east-1"}
+    assert targets[0].base == "prod"
+
+
+def test_load_targets_rejects_duplicate_stacks(tmp_path):
+    path = tmp_path / "targets.yaml"
+    path.write_text(yaml.safe_dump([{"stack": "prod-euc1"}, {"stack": "prod-euc1"}]))
+
+    with pytest.raises(ValueError, match="duplicate stacks"):
+        load_targets(str(path))
+
+
+@needs_cli
+def test_mocked_deploy_sets_up_every_stack(backend):
+    project = project_name()
+    targets = [
+        Target("prod-use1", region="us-east-1", config={"azCount": 3}, secrets={"dbPassword": "DB_PASSWORD"}),
+        Target("prod-euc1", region="eu-central-1", secrets={"dbPassword": "DB_PASSWORD"}),
+    ]
+
+    results = deploy(targets, "preview", workers=2, backend=backend, mock=True)
+
+    assert [r["stack"] for r in results] == ["prod-use1", "prod-euc1"]
+    assert [r["status"] for r in results] == ["succeeded", "succeeded"]
+    for result in results:
+        assert result["changes"]["create"] > 0
+        assert result["outputs"]["albDns"]
+
+    use1 = backend_config(backend, "prod-use1")
+    assert use1["aws:region"].value == "us-east-1"
+    assert use1[f"{project}:azCount"].value == "3"
+    assert use1[f"{project}:dbPassword"].secret and use1[f"{project}:dbPassword"].value == "db-password"
+    euc1 = backend_config(backend, "prod-euc1")
+    assert euc1["aws:region"].value == "eu-central-1"
+    # the base stack file's value without an override
+    assert euc1[f"{project}:azCount"].value == "2"
+    assert euc1[f"{project}:dbPassword"].value == "db-password"
+
+
+@needs_cli
+def test_mocked_deploy_reports_failed_targets_in_order(backend):
+    targets = [
+        Target("bad-az", config={"azCount": 1}, secrets={"dbPassword": "DB_PASSWORD"}),
+        Target("no-secret", secrets={"dbPassword": "MISSING_DB_PASSWORD"}),
+        Target("good", secrets={"dbPassword": "DB_PASSWORD"}),
+    ]
+
+    results = deploy(targets, "preview", workers=3, backend=backend, mock=True)
+
+    assert [(r["stack"], r["status"]) for r in results] == [
+        ("bad-az", "failed"), ("no-secret", "failed"), ("good", "succeeded")]
+    assert "azCount" in results[0]["error"]
+    assert "MISSING_DB_PASSWORD" in results[1]["error"]
+    assert results[2]["outputs"]["albDns"]
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from tools.loadgen import LoadTest, Stage, concurrency_at, parse_stages, serve, stack_url
+
+
+def load(method="GET", url=None, seconds=0.5, users=2, **serve_args):
+    async def run():
+        server = await serve(**serve_args) if url is None else None
+        target = url or f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+        try:
+            return await asyncio.wait_for(
+                LoadTest(target, [Stage(users, users, seconds)], method=method, timeout_s=2).run(), 10)
+        finally:
+            if server:
+                server.close()
+                await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+def test_parse_stages_and_ramp():
+    stages = parse_stages("0-10:10,10:5")
+
+    assert [(s.start, s.end, s.duration_s) for s in stages] == [(0, 10, 10.0), (10, 10, 5.0)]
+    assert [concurrency_at(stages, t) for t in (0, 5, 12, 15)] == [0, 5, 10, 0]
+    with pytest.raises(ValueError):
+        parse_stages("10")
+
+
+def test_get_against_the_stand_in_server():
+    results = load()
+
+    assert results.statuses and set(results.statuses) == {200}
+    assert not results.errors
+    assert results.connections == 2
+
+
+def test_head_responses_have_no_body():
+    results = load("HEAD")
+
+    assert set(results.statuses) == {200}
+    assert not results.errors
+
+
+def test_oversized_response_head_is_an_error():
+    async def oversized(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nX-Padding: " + b"x" * 70000 + b"\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(oversized, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+        try:
+            return await asyncio.wait_for(LoadTest(url, [Stage(1, 1, 0.3)], timeout_s=2).run(), 10)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    results = asyncio.run(run())
+
+    assert not results.statuses
+    assert set(results.errors) == {"LimitOverrunError"}
+
+
+@pytest.mark.parametrize("outputs, url", [
+    ({"albDns": "alb.example.com", "albUrl": "https://alb.example.com/"}, "https://alb.example.com/"),
+    ({"albDns": "alb.example.com", "albUrl": "http://alb.example.com/"}, "http://alb.example.com/"),
+    ({"albDns": "alb.example.com"}, "http://alb.example.com/"),
+])
+def test_stack_url(outputs, url):
+    assert stack_url(outputs) == url
+
+
+@pytest.mark.parametrize("certificate, scheme", [(None, "http"), ("arn:aws:acm:eu-central-1:1:certificate/x", "https")])
+def test_program_exports_the_alb_url(certificate, scheme):
+    from tools.mock_program import run_program
+
+    # the cdn in front of a tls alb needs an origin name the certificate covers
+    outputs = run_program(overrides={"albCertificateArn": certificate,
+                                     "cdnAlbOriginDomain": "origin.example.com"}).outputs
+
+    assert outputs["albUrl"] == f"{scheme}://{outputs['albDns']}/"
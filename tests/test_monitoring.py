@@ -0,0 +1,45 @@
+import pytest
+
+from db import AURORA_MYSQL_PARAMETERS, MYSQL_PARAMETERS, max_connections
+from tools.mock_program import run_program
+
+
+def db_alarms(overrides=None):
+    run = run_program(overrides=overrides)
+    return {r.name: r.inputs for r in run.resources
+            if r.typ == "aws:cloudwatch/metricAlarm:MetricAlarm" and r.inputs["namespace"] == "AWS/RDS"}
+
+
+@pytest.mark.parametrize("instance_class, engine, parameters, expected", [
+    ("db.t3.micro", "mysql", MYSQL_PARAMETERS, 64),
+    ("db.r6g.large", "mysql", MYSQL_PARAMETERS, 1024),
+    ("db.t3.medium", "aurora-mysql", AURORA_MYSQL_PARAMETERS, 90),
+    ("db.serverless", "aurora-mysql-serverless", AURORA_MYSQL_PARAMETERS, 135),
+    ("db.t3.micro", "mysql", {"max_connections": "500"}, 500),
+    ("db.x2g.large", "mysql", MYSQL_PARAMETERS, None),
+])
+def test_max_connections(instance_class, engine, parameters, expected):
+    assert max_connections(instance_class, engine, parameters, 4) == expected
+
+
+def test_default_class_is_monitored_when_not_configured():
+    alarms = db_alarms({"dbInstanceClass": None})
+
+    assert alarms["monitoring-db_cpu_credits"]["dimensions"] == {"DBInstanceIdentifier": "zavrsni-db"}
+    assert alarms["monitoring-db_connections"]["threshold"] == int(64 * 0.8)
+
+
+def test_aurora_alarms_on_every_cluster_instance():
+    alarms = db_alarms({"dbEngine": "aurora-mysql", "dbInstanceClass": "db.t3.medium", "dbReplicaCount": 1})
+
+    assert sorted(alarms) == ["monitoring-db_connections", "monitoring-db_connections_replica_1",
+                              "monitoring-db_cpu_credits", "monitoring-db_cpu_credits_replica_1"]
+    assert alarms["monitoring-db_cpu_credits"]["dimensions"] == {"DBInstanceIdentifier": "zavrsni-db-writer"}
+    assert alarms["monitoring-db_cpu_credits_replica_1"]["dimensions"] == {
+        "DBInstanceIdentifier": "zavrsni-db-replica-1"}
+    assert alarms["monitoring-db_connections"]["threshold"] == 72
+
+
+def test_connections_threshold_is_a_fraction():
+    with pytest.raises(ValueError, match="fraction of max_connections"):
+        run_program(overrides={"monitoringDbConnectionsThreshold": 70})
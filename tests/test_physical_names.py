@@ -0,0 +1,52 @@
+import pytest
+
+from tools.mock_program import run_program
+
+# resource types whose names are unique across all regions of an account
+ACCOUNT_GLOBAL_TYPES = (
+    "aws:iam/role:Role",
+    "aws:iam/instanceProfile:InstanceProfile",
+    "aws:cloudfront/cachePolicy:CachePolicy",
+    "aws:cloudfront/originAccessControl:OriginAccessControl",
+)
+
+# longest iam role name prefix, aws appends a 26 character suffix
+MAX_ROLE_NAME_PREFIX = 38
+
+
+@pytest.fixture(scope="module")
+def global_resources():
+    run = run_program("prod", {
+        "appImageVersion": "1.0.0",
+        "dbProxyEnabled": True,
+        "cdnCacheBehaviors": [{"pathPattern": "/api/*", "origin": "alb"}],
+    })
+    return [r for r in run.resources if r.typ in ACCOUNT_GLOBAL_TYPES]
+
+
+def test_account_global_names_differ_per_stack(global_resources):
+    assert {r.typ for r in global_resources} == set(ACCOUNT_GLOBAL_TYPES)
+    for resource in global_resources:
+        if resource.typ.startswith("aws:iam/"):
+            assert "name" not in resource.inputs and resource.inputs["namePrefix"]
+        else:
+            assert resource.inputs["name"].startswith("ZavrsniRad-prod-")
+
+
+def test_role_name_prefixes_fit(global_resources):
+    roles = [r for r in global_resources if r.typ == "aws:iam/role:Role"]
+
+    assert all(len(r.inputs["namePrefix"]) <= MAX_ROLE_NAME_PREFIX for r in roles)
+
+
+def test_public_route_table_associations_keep_their_state():
+    run = run_program("prod", {"azCount": 3})
+    associations = {r.name: r for r in run.resources
+                    if r.typ == "aws:ec2/routeTableAssociation:RouteTableAssociation" and r.name.startswith("vpc-")}
+
+    assert sorted(associations) == ["vpc-pub_sub_nat_1_rt_connection", "vpc-pub_sub_nat_2_rt_connection",
+                                    "vpc-pub_sub_nat_3_rt_connection"]
+    for name, old_name in [("vpc-pub_sub_nat_1_rt_connection", "vpc-pb1a_rt_connection"),
+                           ("vpc-pub_sub_nat_2_rt_connection", "vpc-pb2b_rt_connection")]:
+        assert associations[name].aliases == [old_name]
+    assert associations["vpc-pub_sub_nat_3_rt_connection"].aliases == []
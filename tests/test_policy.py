@@ -0,0 +1,116 @@
+import pytest
+
+from policy.rules import Resource, evaluate, is_enforced
+from tools.perf_policy import check
+
+DB = "aws:rds/instance:Instance"
+ALARM = "aws:cloudwatch/metricAlarm:MetricAlarm"
+TEMPLATE = "aws:ec2/launchTemplate:LaunchTemplate"
+TARGET_GROUP = "aws:lb/targetGroup:TargetGroup"
+
+
+def resource(typ, name, **props):
+    return Resource(urn=f"urn:pulumi:prod::global::{typ}::{name}", type=typ, name=name, props=props)
+
+
+def credit_alarm(name, identifier):
+    return resource(ALARM, name, metricName="CPUCreditBalance", namespace="AWS/RDS",
+                    dimensions={"DBInstanceIdentifier": identifier})
+
+
+def fired(violations):
+    return sorted((v.rule, v.name) for v in violations)
+
+
+def test_prod_has_no_violations():
+    assert check("prod") == []
+
+
+def test_single_nat_routes_second_zone_across():
+    violations = check("prod", {"singleNat": True})
+
+    assert fired(violations) == [("cross-az-nat", "nat-priv_sub_db_2_rt"),
+                                 ("cross-az-nat", "nat-priv_sub_web_2_rt")]
+    assert {v.severity for v in violations} == {"high"}
+
+
+def test_web_without_cpu_credits():
+    assert fired(check("prod", {"webCpuCredits": None})) == [("burstable-without-credit-control", "web-web")]
+
+
+def test_slow_health_check_and_gp2_database():
+    violations = check("prod", {"albHealthCheckInterval": 30, "albHealthyThreshold": 5, "dbStorageType": "gp2"})
+
+    assert fired(violations) == [("gp2-storage", "db-db"), ("slow-health-check", "alb-alb_target")]
+
+
+def test_db_credit_alarm_matches_identifier_exactly():
+    writer = resource(DB, "writer", instanceClass="db.t3.micro", identifier="zavrsni-db")
+    replica = resource(DB, "replica", instanceClass="db.t3.micro", identifier="zavrsni-db-replica-1")
+
+    violations = evaluate([writer, replica, credit_alarm("alarm", "zavrsni-db-replica-1")])
+
+    assert fired(violations) == [("burstable-without-credit-control", "writer")]
+
+
+def test_db_credit_alarm_on_another_namespace_does_not_count():
+    db = resource(DB, "db", instanceClass="db.t3.micro", identifier="zavrsni-db")
+    alarm = resource(ALARM, "alarm", metricName="CPUCreditBalance", namespace="AWS/EC2",
+                     dimensions={"DBInstanceIdentifier": "zavrsni-db"})
+
+    assert fired(evaluate([db, alarm])) == [("burstable-without-credit-control", "db")]
+    assert evaluate([db, credit_alarm("alarm", "zavrsni-db")]) == []
+
+
+@pytest.mark.parametrize("instance_type, burstable", [
+    ("t3.micro", True),
+    ("t4g.small", True),
+    ("t3a.medium", True),
+    ("m5.large", False),
+    ("c7g.large", False),
+])
+def test_burstable_launch_template_families(instance_type, burstable):
+    template = resource(TEMPLATE, "template", instanceType=instance_type)
+
+    assert bool(evaluate([template])) == burstable
+    assert evaluate([resource(TEMPLATE, "template", instanceType=instance_type,
+                              creditSpecification={"cpuCredits": "unlimited"})]) == []
+
+
+@pytest.mark.parametrize("instance_class, burstable", [
+    ("db.t3.micro", True),
+    ("db.t4g.medium", True),
+    ("db.m5.large", False),
+    ("db.serverless", False),
+])
+def test_burstable_db_classes(instance_class, burstable):
+    db = resource(DB, "db", instanceClass=instance_class, identifier="zavrsni-db")
+
+    assert bool(evaluate([db])) == burstable
+
+
+@pytest.mark.parametrize("health_check, slow", [
+    ({}, True),
+    ({"interval": 10, "healthyThreshold": 3}, False),
+    ({"interval": 15, "healthyThreshold": 4}, False),
+    ({"interval": 20, "healthyThreshold": 4}, True),
+])
+def test_slow_health_check(health_check, slow):
+    violations = evaluate([resource(TARGET_GROUP, "target", healthCheck=health_check)])
+
+    assert fired(violations) == ([("slow-health-check", "target")] if slow else [])
+
+
+def test_unknown_values_never_fire():
+    assert evaluate([resource(TEMPLATE, "template"), resource(DB, "db"),
+                     resource(TARGET_GROUP, "target", healthCheck={"interval": None})]) == []
+
+
+@pytest.mark.parametrize("severity, min_severity, enforced", [
+    ("high", None, False),
+    ("low", "medium", False),
+    ("medium", "medium", True),
+    ("high", "low", True),
+])
+def test_is_enforced(severity, min_severity, enforced):
+    assert is_enforced(severity, min_severity) == enforced
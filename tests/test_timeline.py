@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+
+from tools.timeline import build_timeline, read_events, write_outputs
+
+EVENTS = os.path.join(os.path.dirname(__file__), "fixtures", "prod.up.events.jsonl")
+# an update in the engine's event log format: whole second timestamps, old
+# and new states, a replacement, policy, diagnostic, summary and cancel
+# events and gaps in the sequence
+UPDATE_EVENTS = os.path.join(os.path.dirname(__file__), "fixtures", "prod.update.events.jsonl")
+URN = "urn:pulumi:prod::global::"
+VPC = f"{URN}components:index:Vpc::vpc"
+ALB = f"{URN}components:index:Alb::alb"
+WEB = f"{URN}components:index:Web::web"
+TARGET_GROUP = f"{URN}components:index:Alb$aws:lb/targetGroup:TargetGroup::alb-alb_target"
+
+
+@pytest.fixture
+def timeline():
+    return build_timeline(read_events(EVENTS))
+
+
+def test_resource_spans(timeline):
+    spans = {span.name: span for span in timeline.resources.values()}
+
+    # the unchanged alb component has no step and the prelude no resource
+    assert sorted(spans) == ["alb-alb", "alb-alb_target", "global-prod", "vpc", "vpc-pub_sub_nat_1", "vpc-vpc"]
+    assert (spans["vpc-vpc"].start_s, spans["vpc-vpc"].duration_s) == (1.0, 3.0)
+    assert (spans["vpc-pub_sub_nat_1"].start_s, spans["vpc-pub_sub_nat_1"].duration_s) == (4.5, 5.0)
+    assert (spans["alb-alb"].start_s, spans["alb-alb"].duration_s) == (3.0, 180.0)
+    assert spans["alb-alb_target"].failed and spans["alb-alb_target"].duration_s == 2.0
+    assert spans["vpc-vpc"].component == VPC and spans["alb-alb"].component == ALB
+
+
+def test_component_spans(timeline):
+    vpc, alb = timeline.components[VPC], timeline.components[ALB]
+
+    assert (vpc.op, vpc.start_s, vpc.end_s, vpc.resources, vpc.failed) == ("create", 0.5, 10.0, 2, False)
+    assert (alb.op, alb.start_s, alb.end_s, alb.resources, alb.failed) == ("same", 3.0, 183.0, 2, True)
+
+
+def test_slowest_orders_resources_by_duration(timeline):
+    assert [span.name for span in timeline.slowest(3)] == ["alb-alb", "vpc-pub_sub_nat_1", "vpc-vpc"]
+
+
+def test_to_dict_orders_by_start(timeline):
+    data = timeline.to_dict()
+
+    assert [r["start_s"] for r in data["resources"]] == sorted(r["start_s"] for r in data["resources"])
+    assert [c["name"] for c in data["components"]] == ["vpc", "alb"]
+    assert data["components"][0]["duration_s"] == 9.5
+
+
+def test_chrome_trace(timeline, tmp_path):
+    write_outputs(timeline, trace_path=str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+
+    rows = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    assert rows == {0: "(stack)", 1: "Vpc vpc", 2: "Alb alb"}
+
+    spans = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert (spans["vpc"]["ts"], spans["vpc"]["dur"], spans["vpc"]["tid"]) == (500000, 9500000, 1)
+    assert (spans["alb-alb"]["ts"], spans["alb-alb"]["dur"], spans["alb-alb"]["tid"]) == (3000000, 180000000, 2)
+    assert spans["alb-alb_target"]["args"]["failed"] and spans["alb-alb_target"]["tid"] == 2
+    assert spans["vpc-pub_sub_nat_1"]["tid"] == 1 and spans["global-prod"]["tid"] == 0
+
+
+@pytest.fixture
+def update():
+    return build_timeline(read_events(UPDATE_EVENTS))
+
+
+def test_update_log_is_in_the_engine_format():
+    from pulumi.automation.events import EngineEvent
+
+    events = read_events(UPDATE_EVENTS)
+    parsed = [EngineEvent.from_json(event) for event in events]
+
+    assert parsed[0].prelude_event is not None and parsed[-1].cancel_event is not None
+    assert any(e.policy_event for e in parsed) and any(e.diagnostic_event for e in parsed)
+    assert parsed[-2].summary_event.resource_changes == {"create": 1, "replace": 1, "same": 8, "update": 3}
+    sequences = [e.sequence for e in parsed]
+    assert sequences == sorted(sequences) and sequences[-1] > len(sequences) - 1
+
+
+def test_update_spans(update):
+    spans = {(span.name, span.op): span for span in update.resources.values()}
+
+    # unchanged resources, the provider and the stack have no span
+    assert sorted(spans) == [
+        ("alb-alb_listener", "update"), ("alb-alb_target", "delete-replaced"), ("alb-alb_target", "replace"),
+        ("web-request_count_target", "create"), ("web-web", "update"), ("web-web_asg", "update")]
+    assert spans["web-web_asg", "update"].duration_s == 65.0
+    assert spans["web-web_asg", "update"].component == WEB
+
+
+def test_replacement_is_not_stretched_to_the_deferred_delete(update):
+    replaced = update.resources[TARGET_GROUP]
+    deleted = update.resources[f"{TARGET_GROUP}#delete-replaced"]
+
+    assert (replaced.op, replaced.start_s, replaced.end_s) == ("replace", 2.0, 5.0)
+    assert (deleted.op, deleted.start_s, deleted.end_s) == ("delete-replaced", 73.0, 75.0)
+    alb = update.components[ALB]
+    assert (alb.op, alb.start_s, alb.end_s, alb.resources) == ("same", 2.0, 6.0, 2)
+
+
+def test_update_slowest(update):
+    assert [(s.name, s.op) for s in update.slowest(3)] == [
+        ("web-web_asg", "update"), ("alb-alb_target", "replace"), ("web-web", "update")]
+
+
+def test_read_events_skips_a_cut_off_last_line(tmp_path):
+    with open(UPDATE_EVENTS) as f:
+        lines = f.readlines()
+    path = tmp_path / "events.jsonl"
+    path.write_text("".join(lines[:-1]) + lines[-1][:10])
+
+    assert read_events(str(path)) == read_events(UPDATE_EVENTS)[:-1]
+
+    path.write_text(lines[0][:10] + "\n" + "".join(lines[1:]))
+    with pytest.raises(json.JSONDecodeError):
+        read_events(str(path))
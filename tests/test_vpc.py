@@ -0,0 +1,86 @@
+import ipaddress
+from itertools import combinations
+
+import pytest
+
+from vpc import SUBNET_TIERS, subnet_ipv6_cidr, subnet_layout
+
+VPC_CIDR = "10.10.0.0/16"
+
+
+def subnets(layout):
+    return [ipaddress.ip_network(cidr) for tier in SUBNET_TIERS for cidr in layout[tier]]
+
+
+@pytest.mark.parametrize("az_count", [2, 3, 6])
+def test_layout_is_disjoint_and_within_the_vpc(az_count):
+    layout = subnet_layout(VPC_CIDR, az_count)
+
+    assert all(len(layout[tier]) == az_count for tier in SUBNET_TIERS)
+    assert all(subnet.subnet_of(ipaddress.ip_network(VPC_CIDR)) for subnet in subnets(layout))
+    assert not any(a.overlaps(b) for a, b in combinations(subnets(layout), 2))
+
+
+def test_two_zones_keep_the_existing_subnets():
+    assert subnet_layout(VPC_CIDR, 2) == {
+        "pub_sub_nat": ["10.10.1.0/24", "10.10.11.0/24"],
+        "priv_sub_web": ["10.10.2.0/24", "10.10.12.0/24"],
+        "priv_sub_db": ["10.10.3.0/24", "10.10.13.0/24"],
+    }
+
+
+def test_more_zones_never_renumber_existing_subnets():
+    two, six = subnet_layout(VPC_CIDR, 2), subnet_layout(VPC_CIDR, 6)
+
+    assert all(six[tier][:2] == two[tier] for tier in SUBNET_TIERS)
+    assert six["priv_sub_db"][-1] == "10.10.53.0/24"
+
+
+def test_smaller_vpc_gets_smaller_subnets():
+    layout = subnet_layout("10.20.0.0/20", 3)
+
+    assert layout["pub_sub_nat"] == ["10.20.0.16/28", "10.20.0.176/28", "10.20.1.80/28"]
+    assert not any(a.overlaps(b) for a, b in combinations(subnets(layout), 2))
+
+
+def test_overrides_replace_a_tier():
+    layout = subnet_layout(VPC_CIDR, 2, {"priv_sub_web": ["10.10.128.0/20", "10.10.144.0/20"]})
+
+    assert layout["priv_sub_web"] == ["10.10.128.0/20", "10.10.144.0/20"]
+    assert layout["pub_sub_nat"] == ["10.10.1.0/24", "10.10.11.0/24"]
+
+
+@pytest.mark.parametrize("vpc_cidr, az_count, overrides, error", [
+    (VPC_CIDR, 1, None, "azCount"),
+    (VPC_CIDR, 9, None, "azCount"),
+    ("10.10.0.0/24", 2, None, "too small"),
+    (VPC_CIDR, 2, {"web": ["10.10.1.0/24", "10.10.11.0/24"]}, "unknown subnet tiers"),
+    (VPC_CIDR, 3, {"priv_sub_db": ["10.10.3.0/24", "10.10.13.0/24"]}, "needs 3 cidrs"),
+    (VPC_CIDR, 2, {"priv_sub_db": ["10.10.3.0/29", "10.10.13.0/24"]}, "between /16 and /28"),
+    (VPC_CIDR, 2, {"priv_sub_db": ["10.11.3.0/24", "10.10.13.0/24"]}, "not within"),
+    (VPC_CIDR, 2, {"priv_sub_db": ["10.10.0.0/20", "10.10.33.0/24"]}, "overlaps"),
+])
+def test_invalid_layouts_are_rejected(vpc_cidr, az_count, overrides, error):
+    with pytest.raises(ValueError, match=error):
+        subnet_layout(vpc_cidr, az_count, overrides)
+
+
+def test_ipv6_subnets_are_distinct_64s_of_the_vpc():
+    vpc_ipv6 = "2001:db8:1200::/56"
+    cidrs = [subnet_ipv6_cidr(vpc_ipv6, tier, i) for tier in SUBNET_TIERS for i in range(6)]
+
+    assert len(set(cidrs)) == len(cidrs)
+    assert all(ipaddress.ip_network(cidr).subnet_of(ipaddress.ip_network(vpc_ipv6)) for cidr in cidrs)
+    assert all(ipaddress.ip_network(cidr).prefixlen == 64 for cidr in cidrs)
+
+
+@pytest.mark.parametrize("az_count", [3, 6])
+def test_program_spreads_every_tier_over_the_zones(az_count):
+    from tools.mock_program import run_program
+
+    run = run_program(overrides={"azCount": az_count})
+    created = [r.inputs for r in run.resources if r.typ == "aws:ec2/subnet:Subnet"]
+    layout = subnet_layout(VPC_CIDR, az_count)
+
+    assert sorted(s["cidrBlock"] for s in created) == sorted(str(s) for s in subnets(layout))
+    assert len({s["availabilityZone"] for s in created}) == az_count
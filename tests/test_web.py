@@ -0,0 +1,53 @@
+import pytest
+
+from tools.mock_program import run_program
+from web import instance_architecture
+
+MIXED = {
+    "appImageVersion": None,
+    "webWarmPoolState": None,
+    "webInstanceTypes": [{"instanceType": "t3.micro"}, {"instanceType": "t4g.micro"}],
+}
+
+
+def launch_templates(overrides):
+    run = run_program(overrides=overrides)
+    return {r.name: r.inputs for r in run.resources if r.typ == "aws:ec2/launchTemplate:LaunchTemplate"}
+
+
+@pytest.mark.parametrize("instance_type, architecture", [
+    ("t3.micro", "x86_64"),
+    ("t4g.micro", "arm64"),
+    ("m6g.large", "arm64"),
+    ("c7gn.xlarge", "arm64"),
+    ("a1.medium", "arm64"),
+    ("m5.large", "x86_64"),
+])
+def test_instance_architecture(instance_type, architecture):
+    assert instance_architecture(instance_type) == architecture
+
+
+def test_x86_ami_pin_is_not_used_for_arm64():
+    templates = launch_templates({**MIXED, "webAmiId": "ami-x86"})
+
+    assert templates["web-web"]["imageId"] == "ami-x86"
+    assert templates["web-web_arm64"]["imageId"] == "ami-mock"
+
+
+def test_ami_pins_per_architecture():
+    templates = launch_templates({**MIXED, "webAmiId": "ami-x86", "webArm64AmiId": "ami-arm64"})
+
+    assert templates["web-web"]["imageId"] == "ami-x86"
+    assert templates["web-web_arm64"]["imageId"] == "ami-arm64"
+
+
+@pytest.mark.parametrize("instance_type, credits", [
+    ("t3.micro", {"cpuCredits": "unlimited"}),
+    ("t3a.small", {"cpuCredits": "unlimited"}),
+    ("m5.large", None),
+    ("trn1.2xlarge", None),
+])
+def test_credit_specification_only_for_burstable_families(instance_type, credits):
+    templates = launch_templates({"webInstanceType": instance_type, "webCpuCredits": "unlimited"})
+
+    assert templates["web-web"].get("creditSpecification") == credits
@@ -0,0 +1,316 @@
+"""Latency percentiles and error rates per target and per path from ALB access logs.
+
+Reads access log files as the load balancer writes them (gzip, one request
+per line, see ``Alb`` with ``albAccessLogs``) or uncompressed, streaming them
+line by line. Every timing goes into a fixed log-scale histogram, so memory
+stays constant whatever the size of the logs; paths are normalized (ids
+become ``{id}``) and capped to ``--max-paths`` distinct keys. No AWS access
+is needed, copy the logs first:
+
+    aws s3 sync s3://$(pulumi stack output albAccessLogsBucket)/alb/AWSLogs/ logs/
+    python -m tools.alb_logs logs/
+    python -m tools.alb_logs logs/ --by path --top 20 --histogram --json report.json
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# histogram buckets grow by this factor, i.e. percentiles are within ~2.5%
+BUCKET_GROWTH = 1.05
+# timings below this many seconds all land in the first bucket
+MIN_SECONDS = 0.0001
+
+PERCENTILES = (50, 95, 99)
+
+# the three processing times of an access log entry, -1 when the request
+# never reached that stage (e.g. the target could not be connected)
+PHASES = ("request", "target", "response")
+
+OTHER_PATHS = "{other}"
+
+# quoted fields may contain spaces, everything else is space separated
+FIELD_PATTERN = re.compile(r'"[^"]*"|\S+')
+ID_SEGMENT_PATTERN = re.compile(
+    r"^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,})$", re.I)
+
+
+class Histogram:
+    """Counts of values in log-scale buckets."""
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket(value: float) -> int:
+        if value <= MIN_SECONDS:
+            return 0
+        return 1 + int(math.log(value / MIN_SECONDS, BUCKET_GROWTH))
+
+    @staticmethod
+    def upper_bound(bucket: int) -> float:
+        return MIN_SECONDS * BUCKET_GROWTH ** bucket
+
+    def record(self, value: float) -> None:
+        index = self.bucket(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q``th percentile."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+@dataclass
+class Stats:
+    requests: int = 0
+    elb_5xx: int = 0
+    target_5xx: int = 0
+    client_4xx: int = 0
+    # requests the load balancer could not hand to a target
+    unreached: int = 0
+    histograms: Dict[str, Histogram] = field(default_factory=lambda: {
+        phase: Histogram() for phase in (*PHASES, "total")})
+
+    def add(self, entry: "Entry") -> None:
+        self.requests += 1
+        if entry.elb_status >= 500:
+            self.elb_5xx += 1
+        elif 400 <= entry.elb_status < 500:
+            self.client_4xx += 1
+        if entry.target_status is not None and entry.target_status >= 500:
+            self.target_5xx += 1
+        if entry.times["target"] < 0:
+            self.unreached += 1
+        for phase in PHASES:
+            if entry.times[phase] >= 0:
+                self.histograms[phase].record(entry.times[phase])
+        if all(entry.times[phase] >= 0 for phase in PHASES):
+            self.histograms["total"].record(sum(entry.times.values()))
+
+    def to_dict(self) -> Dict[str, Any]:
+        rate = (lambda n: n / self.requests) if self.requests else (lambda n: 0.0)
+        return {
+            "requests": self.requests,
+            "elb_5xx_rate": rate(self.elb_5xx),
+            "target_5xx_rate": rate(self.target_5xx),
+            "client_4xx_rate": rate(self.client_4xx),
+            "unreached_rate": rate(self.unreached),
+            "latency_s": {
+                phase: {
+                    "count": histogram.count,
+                    "mean": histogram.mean(),
+                    "max": histogram.max if histogram.count else None,
+                    **{f"p{q}": histogram.percentile(q) for q in PERCENTILES},
+                }
+                for phase, histogram in self.histograms.items()
+            },
+        }
+
+
+@dataclass
+class Entry:
+    target: str
+    method: str
+    path: str
+    elb_status: int
+    target_status: Optional[int]
+    times: Dict[str, float]
+
+
+def normalize_path(url: str) -> str:
+    """Path of a request url without query string, id-like segments
+    replaced by ``{id}``."""
+    path = re.sub(r"^[a-z]+://[^/]*", "", url).split("?", 1)[0] or "/"
+    return "/".join("{id}" if ID_SEGMENT_PATTERN.match(segment) else segment
+                    for segment in path.split("/"))
+
+
+def parse_line(line: str) -> Optional[Entry]:
+    """One access log entry, None for lines that are not one."""
+    fields = FIELD_PATTERN.findall(line)
+    if len(fields) < 13:
+        return None
+    try:
+        times = {phase: float(value) for phase, value in zip(PHASES, fields[5:8])}
+        elb_status = int(fields[8]) if fields[8] != "-" else 0
+    except ValueError:
+        return None
+    target_status = int(fields[9]) if fields[9].isdigit() else None
+    request = fields[12].strip('"').split(" ")
+    method = request[0] if len(request) == 3 else "-"
+    url = request[1] if len(request) == 3 else "-"
+    return Entry(
+        target=fields[4].rsplit(":", 1)[0] if fields[4] != "-" else "-",
+        method=method,
+        path=normalize_path(url) if url != "-" else "-",
+        elb_status=elb_status,
+        target_status=target_status,
+        times=times,
+    )
+
+
+def log_files(paths: Iterable[str]) -> Iterator[str]:
+    """Log files named or found under the named directories, in name order."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith((".log", ".log.gz")):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def read_lines(path: str) -> Iterator[str]:
+    if path == "-":
+        yield from sys.stdin
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        yield from f
+
+
+@dataclass
+class Report:
+    overall: Stats = field(default_factory=Stats)
+    targets: Dict[str, Stats] = field(default_factory=dict)
+    paths: Dict[str, Stats] = field(default_factory=dict)
+    lines: int = 0
+    skipped: int = 0
+
+
+def analyze(lines: Iterable[str], max_paths: int = 1000) -> Report:
+    report = Report()
+    for line in lines:
+        report.lines += 1
+        entry = parse_line(line)
+        if entry is None:
+            report.skipped += 1
+            continue
+        report.overall.add(entry)
+        report.targets.setdefault(entry.target, Stats()).add(entry)
+        key = f"{entry.method} {entry.path}"
+        if key not in report.paths and len(report.paths) >= max_paths:
+            key = OTHER_PATHS
+        report.paths.setdefault(key, Stats()).add(entry)
+    return report
+
+
+def format_histogram(histogram: Histogram, width: int = 40, rows: int = 12) -> str:
+    """Ascii histogram of ``histogram`` regrouped into at most ``rows`` rows."""
+    if not histogram.count:
+        return "  (no requests)"
+    indexes = sorted(histogram.buckets)
+    per_row = max(1, math.ceil((indexes[-1] - indexes[0] + 1) / rows))
+    grouped: Dict[int, int] = {}
+    for index in indexes:
+        row = (index - indexes[0]) // per_row
+        grouped[row] = grouped.get(row, 0) + histogram.buckets[index]
+    peak = max(grouped.values())
+    lines = []
+    for row in range(max(grouped) + 1):
+        count = grouped.get(row, 0)
+        upper = Histogram.upper_bound(indexes[0] + (row + 1) * per_row - 1)
+        lines.append(f"  <= {upper * 1000:>9.1f}ms {'#' * round(width * count / peak):<{width}} {count}")
+    return "\n".join(lines)
+
+
+def format_table(title: str, stats: Dict[str, Stats], top: int, phase: str) -> str:
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.1f}"
+
+    rows = sorted(stats.items(), key=lambda item: -(item[1].histograms[phase].percentile(99) or 0))[:top]
+    lines = [f"{title} by p99 {phase} time (ms):",
+             f"  {'p50':>8} {'p95':>8} {'p99':>8} {'requests':>9} {'5xx':>7} {'tgt 5xx':>7} {'unreached':>9}  key"]
+    for key, s in rows:
+        histogram = s.histograms[phase]
+        lines.append(
+            f"  {ms(histogram.percentile(50)):>8} {ms(histogram.percentile(95)):>8} {ms(histogram.percentile(99)):>8}"
+            f" {s.requests:>9} {s.elb_5xx / s.requests:>7.2%} {s.target_5xx / s.requests:>7.2%}"
+            f" {s.unreached / s.requests:>9.2%}  {key}")
+    return "\n".join(lines)
+
+
+def format_report(report: Report, by: str = "both", top: int = 10, phase: str = "target",
+                  histogram: bool = False) -> str:
+    overall = report.overall.to_dict()
+    latency = overall["latency_s"][phase]
+    lines = [f"{report.overall.requests} requests in {report.lines} lines ({report.skipped} skipped)"]
+    if latency["count"]:
+        lines.append(f"{phase} time " + " ".join(
+            f"p{q} {latency[f'p{q}'] * 1000:.1f}ms" for q in PERCENTILES))
+    if report.overall.requests:
+        lines.append(f"elb 5xx {overall['elb_5xx_rate']:.2%}, target 5xx {overall['target_5xx_rate']:.2%}, "
+                     f"unreached {overall['unreached_rate']:.2%}")
+    if histogram:
+        lines.append(f"{phase} time distribution:")
+        lines.append(format_histogram(report.overall.histograms[phase]))
+    if by in ("target", "both"):
+        lines.append(format_table("targets", report.targets, top, phase))
+    if by in ("path", "both"):
+        lines.append(format_table("paths", report.paths, top, phase))
+    return "\n".join(lines)
+
+
+def report_to_dict(report: Report) -> Dict[str, Any]:
+    return {
+        "lines": report.lines,
+        "skipped": report.skipped,
+        "overall": report.overall.to_dict(),
+        "targets": {key: stats.to_dict() for key, stats in report.targets.items()},
+        "paths": {key: stats.to_dict() for key, stats in report.paths.items()},
+    }
+
+
+def lines_of(paths: Iterable[str]) -> Iterator[str]:
+    for path in log_files(paths):
+        yield from read_lines(path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="log files or directories, - for stdin")
+    parser.add_argument("--by", choices=("target", "path", "both"), default="both")
+    parser.add_argument("--phase", choices=(*PHASES, "total"), default="target",
+                        help="processing time to rank and print percentiles of")
+    parser.add_argument("--top", type=int, default=10, help="rows per table")
+    parser.add_argument("--max-paths", type=int, default=1000,
+                        help=f"distinct paths kept, the rest count as {OTHER_PATHS}")
+    parser.add_argument("--histogram", action="store_true", help="print the overall latency distribution")
+    parser.add_argument("--json", help="also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    report = analyze(lines_of(args.paths), args.max_paths)
+    print(format_report(report, args.by, args.top, args.phase, args.histogram))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report_to_dict(report), f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""Offline benchmark of program construction time under Pulumi mocks.
+
+Every scenario runs ``__main__.py`` in a fresh interpreter with its config
+overrides and reports wall time, peak memory, resource and dependency counts,
+the critical path of a new stack (see ``tools.critical_path``) and, per
+component, the time spent in its constructor and until its registered outputs
+resolved. Results can be stored as a baseline and later checked against it:
+
+    python -m tools.bench
+    python -m tools.bench --update-baseline
+    python -m tools.bench --check
+
+The committed baseline holds the metrics that do not depend on the machine,
+which ``--check`` always compares. Wall time and memory go to a local timings
+file that is not committed and are compared only where it was written.
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import resource
+import time
+from typing import Any, Dict, List
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+TIMINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_timings.json")
+
+# config overrides on top of Pulumi.<stack>.yaml, growing the resource graph
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "az2": {"azCount": 2},
+    "az3": {"azCount": 3},
+    "az6": {"azCount": 6},
+    "az6-scaled": {
+        "azCount": 6,
+        "dbReplicaCount": 5,
+        "dbProxyEnabled": True,
+        "cacheShardCount": 3,
+    },
+}
+
+# metrics of the resource graph, the same on every machine; any growth
+# fails the check until the baseline is updated
+GRAPH_METRICS = ("resources", "dependencies", "critical_path_s")
+
+# a timing only regresses when it is worse by both the relative tolerance
+# and this absolute amount, so noise on tiny numbers never fails the check
+ABSOLUTE_SLACK = {"wall_s": 0.05, "peak_mb": 1.0}
+
+
+def _instrument_components(timings: Dict[str, Dict[str, Any]]) -> None:
+    """Time the constructor and output resolution of every component class."""
+    import pulumi
+    from tools.mock_program import REPO_DIR
+
+    for path in glob.glob(os.path.join(REPO_DIR, "*.py")):
+        module = os.path.splitext(os.path.basename(path))[0]
+        if module != "__main__":
+            importlib.import_module(module)
+
+    def timed_init(init):
+        def wrapper(self, name, *args, **kwargs):
+            entry = timings.setdefault(name, {"type": type(self).__name__})
+            entry["started_at"] = time.perf_counter()
+            init(self, name, *args, **kwargs)
+            entry["construct_s"] = time.perf_counter() - entry["started_at"]
+        return wrapper
+
+    for cls in pulumi.ComponentResource.__subclasses__():
+        if cls.__module__.split(".")[0] not in ("pulumi", "pulumi_aws"):
+            cls.__init__ = timed_init(cls.__init__)
+
+    register_outputs = pulumi.ComponentResource.register_outputs
+
+    def timed_register_outputs(self, outputs):
+        entry = timings.get(self._name)
+        if entry is not None:
+            def resolved(_):
+                entry["resolve_s"] = time.perf_counter() - entry["started_at"]
+            pulumi.Output.from_input(outputs).apply(resolved)
+        return register_outputs(self, outputs)
+
+    pulumi.ComponentResource.register_outputs = timed_register_outputs
+
+
+def run_worker(stack: str, overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the program once in this process and measure it."""
+    from tools.critical_path import build_graph, critical_path, schedule
+    from tools.mock_program import run_program
+
+    timings: Dict[str, Dict[str, Any]] = {}
+    run = run_program(stack, overrides, before_run=lambda: _instrument_components(timings))
+    # peak resident set size of the worker, reported in bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak *= 1024
+
+    nodes = build_graph(run)
+    schedule(nodes)
+    path = critical_path(nodes)
+
+    components = {}
+    for name, entry in timings.items():
+        components[name] = {
+            "type": entry["type"],
+            "construct_s": round(entry.get("construct_s", 0.0), 4),
+            "resolve_s": round(entry["resolve_s"], 4) if "resolve_s" in entry else None,
+            "resources": sum(1 for r in run.custom_resources if r.name.startswith(f"{name}-")),
+        }
+    return {
+        "wall_s": round(run.finished_at - run.started_at, 4),
+        "peak_mb": round(peak / 2**20, 2),
+        "resources": len(run.custom_resources),
+        "dependencies": sum(len(r.dependencies) for r in run.custom_resources),
+        "critical_path_s": path[-1].finish_s if path else 0.0,
+        "components": components,
+    }
+
+
+def run_scenario(name: str, stack: str, repeat: int) -> Dict[str, Any]:
+    """Median of ``repeat`` isolated runs of one scenario."""
+    samples = []
+    for _ in range(repeat):
+        worker = json.dumps({"stack": stack, "overrides": SCENARIOS[name]})
+        proc = subprocess.run(
+            [sys.executable, "-m", "tools.bench", "--worker", worker],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"scenario {name} failed:\n{proc.stderr}")
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    result = min(samples, key=lambda s: abs(s["wall_s"] - statistics.median(x["wall_s"] for x in samples)))
+    result["wall_s"] = round(statistics.median(s["wall_s"] for s in samples), 4)
+    result["peak_mb"] = round(statistics.median(s["peak_mb"] for s in samples), 2)
+    return result
+
+
+def graph_metrics(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The machine independent part of a scenario result."""
+    return {
+        **{metric: result[metric] for metric in GRAPH_METRICS},
+        "components": {name: {"type": entry["type"], "resources": entry["resources"]}
+                       for name, entry in result["components"].items()},
+    }
+
+
+def timing_metrics(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The machine specific part of a scenario result."""
+    return {
+        "wall_s": result["wall_s"],
+        "peak_mb": result["peak_mb"],
+        "components": {name: {"construct_s": entry["construct_s"], "resolve_s": entry["resolve_s"]}
+                       for name, entry in result["components"].items()},
+    }
+
+
+def load(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path: str, data: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(baseline: Dict[str, Any], timings: Dict[str, Any], results: Dict[str, Any],
+            tolerance: float) -> List[str]:
+    """Regressions of ``results`` against the graph ``baseline`` and the
+    local ``timings``."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is not None:
+            for metric in GRAPH_METRICS:
+                if result[metric] > base[metric]:
+                    regressions.append(f"{name}: {metric} {result[metric]} > baseline {base[metric]}")
+        base = timings.get(name)
+        if base is None:
+            continue
+        for metric, slack in ABSOLUTE_SLACK.items():
+            limit = base[metric] * (1 + tolerance)
+            if result[metric] > limit and result[metric] - base[metric] > slack:
+                regressions.append(
+                    f"{name}: {metric} {result[metric]} > baseline {base[metric]} (+{tolerance:.0%})")
+    return regressions
+
+
+def print_report(results: Dict[str, Any], baseline: Dict[str, Any], timings: Dict[str, Any]) -> None:
+    for name, result in results.items():
+        base = {**baseline.get(name, {}), **timings.get(name, {})}
+        delta = ""
+        if base:
+            delta = " (baseline " + ", ".join(
+                f"{base[metric]}{unit}" for metric, unit in (
+                    ("wall_s", "s"), ("peak_mb", "MB"), ("resources", " resources"),
+                    ("dependencies", " dependencies"), ("critical_path_s", "s critical path"))
+                if metric in base) + ")"
+        print(f"{name}: {result['wall_s']}s, {result['peak_mb']}MB peak, "
+              f"{result['resources']} resources, {result['dependencies']} dependencies, "
+              f"{result['critical_path_s']:.0f}s critical path{delta}")
+        for component, entry in sorted(result["components"].items(), key=lambda c: -c[1]["construct_s"]):
+            print(f"  {component:<12} {entry['type']:<10} construct {entry['construct_s']:.4f}s"
+                  f"  resolve {entry['resolve_s']}s  {entry['resources']} resources")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stack", default="prod")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown against the local timings before --check fails")
+    parser.add_argument("--check", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker = json.loads(args.worker)
+        print(json.dumps(run_worker(worker["stack"], worker["overrides"])))
+        return 0
+
+    baseline = load(BASELINE_FILE)
+    timings = load(TIMINGS_FILE)
+
+    results = {name: run_scenario(name, args.stack, args.repeat)
+               for name in args.scenario or SCENARIOS}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results, baseline, timings)
+
+    if args.update_baseline:
+        baseline.update({name: graph_metrics(result) for name, result in results.items()})
+        timings.update({name: timing_metrics(result) for name, result in results.items()})
+        save(BASELINE_FILE, baseline)
+        save(TIMINGS_FILE, timings)
+        print(f"baseline written to {BASELINE_FILE}, timings to {TIMINGS_FILE}")
+
+    if args.check:
+        regressions = compare(baseline, timings, results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Critical path of a deployment from the program's resource graph.
+
+The program is run under mocks to capture every resource with its parent and
+dependencies. Each custom resource is weighted with a typical create time for
+its type (or the median measured in a recorded timeline, see
+``tools.timeline``), and the longest chain of resources that must be created
+one after another is reported, i.e. the shortest possible ``pulumi up`` of a
+new stack with unbounded parallelism:
+
+    python -m tools.critical_path
+    python -m tools.critical_path --set azCount=3 --set dbProxyEnabled=true
+    python -m tools.critical_path --timeline prod.up.timeline.json --json path.json
+"""
+import argparse
+import json
+import statistics
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+# typical create times in seconds of the resource types in this program;
+# anything else counts as DEFAULT_CREATE_S
+TYPICAL_CREATE_S: Dict[str, float] = {
+    "aws:ec2/vpc:Vpc": 3,
+    "aws:ec2/internetGateway:InternetGateway": 2,
+    "aws:ec2/subnet:Subnet": 5,
+    "aws:ec2/eip:Eip": 2,
+    "aws:ec2/egressOnlyInternetGateway:EgressOnlyInternetGateway": 2,
+    "aws:ec2/natGateway:NatGateway": 120,
+    "aws:ec2/routeTable:RouteTable": 3,
+    "aws:ec2/routeTableAssociation:RouteTableAssociation": 1,
+    "aws:ec2/securityGroup:SecurityGroup": 3,
+    "aws:ec2/vpcEndpoint:VpcEndpoint": 90,
+    "aws:ec2/launchTemplate:LaunchTemplate": 2,
+    "aws:vpc/securityGroupIngressRule:SecurityGroupIngressRule": 1,
+    "aws:vpc/securityGroupEgressRule:SecurityGroupEgressRule": 1,
+    "aws:lb/loadBalancer:LoadBalancer": 180,
+    "aws:lb/targetGroup:TargetGroup": 2,
+    "aws:lb/listener:Listener": 2,
+    "aws:lb/listenerRule:ListenerRule": 1,
+    "aws:autoscaling/group:Group": 300,
+    "aws:autoscaling/policy:Policy": 1,
+    "aws:autoscaling/schedule:Schedule": 1,
+    "aws:iam/role:Role": 2,
+    "aws:iam/rolePolicy:RolePolicy": 1,
+    "aws:iam/rolePolicyAttachment:RolePolicyAttachment": 1,
+    "aws:iam/instanceProfile:InstanceProfile": 8,
+    "aws:elasticache/subnetGroup:SubnetGroup": 2,
+    "aws:elasticache/replicationGroup:ReplicationGroup": 600,
+    "aws:rds/subnetGroup:SubnetGroup": 2,
+    "aws:rds/parameterGroup:ParameterGroup": 3,
+    "aws:rds/clusterParameterGroup:ClusterParameterGroup": 3,
+    "aws:rds/instance:Instance": 600,
+    "aws:rds/cluster:Cluster": 120,
+    "aws:rds/clusterInstance:ClusterInstance": 480,
+    "aws:rds/proxy:Proxy": 240,
+    "aws:rds/proxyDefaultTargetGroup:ProxyDefaultTargetGroup": 2,
+    "aws:rds/proxyTarget:ProxyTarget": 30,
+    "aws:rds/proxyEndpoint:ProxyEndpoint": 180,
+    "aws:secretsmanager/secret:Secret": 1,
+    "aws:secretsmanager/secretVersion:SecretVersion": 1,
+    "aws:s3/bucket:Bucket": 3,
+    "aws:s3/bucketPolicy:BucketPolicy": 1,
+    "aws:s3/bucketPublicAccessBlock:BucketPublicAccessBlock": 1,
+    "aws:s3/bucketLifecycleConfiguration:BucketLifecycleConfiguration": 2,
+    "aws:cloudfront/cachePolicy:CachePolicy": 2,
+    "aws:cloudfront/originAccessControl:OriginAccessControl": 2,
+    "aws:cloudfront/distribution:Distribution": 60,
+    "aws:imagebuilder/component:Component": 3,
+    "aws:imagebuilder/imageRecipe:ImageRecipe": 3,
+    "aws:imagebuilder/infrastructureConfiguration:InfrastructureConfiguration": 3,
+    "aws:imagebuilder/distributionConfiguration:DistributionConfiguration": 3,
+    "aws:imagebuilder/image:Image": 1500,
+}
+DEFAULT_CREATE_S = 5.0
+
+
+@dataclass
+class Node:
+    urn: str
+    type: str
+    name: str
+    weight_s: float
+    dependencies: List[str] = field(default_factory=list)
+    start_s: float = 0.0
+    finish_s: float = 0.0
+    critical_dependency: Optional[str] = None
+
+
+def measured_durations(timeline_path: str) -> Dict[str, float]:
+    """Median create time per resource type in a recorded timeline."""
+    with open(timeline_path) as f:
+        resources = json.load(f)["resources"]
+    durations: Dict[str, List[float]] = {}
+    for resource in resources:
+        if resource.get("op") == "create" and resource.get("duration_s") is not None:
+            durations.setdefault(resource["type"], []).append(resource["duration_s"])
+    return {typ: statistics.median(values) for typ, values in durations.items()}
+
+
+def build_graph(run, durations: Optional[Dict[str, float]] = None) -> Dict[str, Node]:
+    """Nodes of a mocked ``ProgramRun``; every resource waits for its
+    dependencies and for its parent, and components take no time."""
+    weights = {**TYPICAL_CREATE_S, **(durations or {})}
+    nodes = {}
+    for resource in run.resources:
+        dependencies = set(resource.dependencies)
+        if resource.parent:
+            dependencies.add(resource.parent)
+        nodes[resource.urn] = Node(
+            urn=resource.urn,
+            type=resource.typ,
+            name=resource.name,
+            weight_s=weights.get(resource.typ, DEFAULT_CREATE_S) if resource.custom else 0.0,
+            dependencies=sorted(dependencies),
+        )
+    return nodes
+
+
+def schedule(nodes: Dict[str, Node]) -> None:
+    """Earliest start and finish of every node, dependencies outside the
+    graph (the stack itself) counting as done at zero."""
+    done = set()
+
+    def visit(urn: str, path: tuple) -> None:
+        if urn in done:
+            return
+        if urn in path:
+            raise ValueError(f"dependency cycle through {urn}")
+        node = nodes[urn]
+        dependencies = [nodes[d] for d in node.dependencies if d in nodes]
+        for dependency in dependencies:
+            visit(dependency.urn, path + (urn,))
+        if dependencies:
+            critical = max(dependencies, key=lambda d: d.finish_s)
+            node.start_s = critical.finish_s
+            node.critical_dependency = critical.urn
+        node.finish_s = node.start_s + node.weight_s
+        done.add(urn)
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * len(nodes)))
+    for urn in nodes:
+        visit(urn, ())
+
+
+def critical_path(nodes: Dict[str, Node]) -> List[Node]:
+    """The chain of nodes ending at the last finish, first node first."""
+    if not nodes:
+        return []
+    node = max(nodes.values(), key=lambda n: n.finish_s)
+    path = [node]
+    while node.critical_dependency is not None:
+        node = nodes[node.critical_dependency]
+        path.append(node)
+    return path[::-1]
+
+
+def component_finish(nodes: Dict[str, Node]) -> Dict[str, float]:
+    """Finish time of every top-level component, i.e. of its last resource."""
+    finish: Dict[str, float] = {}
+    for node in nodes.values():
+        top = node.urn.split("::")[-2].split("$")[0]
+        if top.startswith("components:"):
+            key = f"{top} {node.name.split('-')[0]}"
+            finish[key] = max(finish.get(key, 0.0), node.finish_s)
+    return finish
+
+
+def analyze(stack: str = "prod", overrides: Optional[Dict[str, Any]] = None,
+            durations: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    from tools.mock_program import run_program
+
+    nodes = build_graph(run_program(stack, overrides), durations)
+    schedule(nodes)
+    path = critical_path(nodes)
+    return {
+        "total_s": path[-1].finish_s if path else 0.0,
+        "serial_s": sum(node.weight_s for node in nodes.values()),
+        "resources": sum(1 for node in nodes.values() if node.weight_s),
+        "path": [asdict(node) for node in path if node.weight_s or node is path[-1]],
+        "components": component_finish(nodes),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"critical path {report['total_s']:.0f}s for {report['resources']} resources "
+          f"({report['serial_s']:.0f}s if created one by one)")
+    for node in report["path"]:
+        print(f"  {node['start_s']:>6.0f}s +{node['weight_s']:>5.0f}s  {node['type']:<55} {node['name']}")
+    print("components done at:")
+    for component, finish in sorted(report["components"].items(), key=lambda c: c[1]):
+        print(f"  {finish:>6.0f}s  {component}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stack", default="prod")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="config override, value parsed as yaml, repeatable")
+    parser.add_argument("--timeline", help="recorded timeline json with measured durations")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key] = yaml.safe_load(value)
+    durations = measured_durations(args.timeline) if args.timeline else None
+
+    report = analyze(args.stack, overrides, durations)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""Preview or deploy the program to several stacks in parallel.
+
+Targets are listed in a YAML or JSON file. Each target names a stack and
+optionally a region, the stack file its config starts from, config overrides
+and secrets read from environment variables:
+
+    - stack: prod-euc1
+      region: eu-central-1
+      secrets: {dbPassword: DB_PASSWORD}
+    - stack: prod-use1
+      region: us-east-1
+      base: prod
+      config: {azCount: 3}
+      secrets: {dbPassword: DB_PASSWORD}
+
+Every target runs in its own worker process through the Automation API with
+``__main__.py`` as the inline program, at most ``--workers`` at a time,
+against one backend (``$PULUMI_BACKEND_URL`` or the local file backend).
+Engine events are streamed prefixed with the stack name and a summary of
+durations, changes and outputs is printed at the end:
+
+    python -m tools.deploy targets.yaml
+    python -m tools.deploy targets.yaml --up --workers 4
+    python -m tools.deploy targets.yaml --backend file://./state --mock
+
+With ``--mock`` the stacks are still created or selected on the backend and
+get their config, but the program runs under mocks instead of the engine,
+so targets can be checked locally against a file backend without any cloud
+access.
+
+With ``--events-dir`` the engine events of every stack are also recorded
+there, and a timeline, Chrome trace and slowest resources report is written
+per stack (see ``tools.timeline``).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+from tools.mock_program import REPO_DIR, project_name, stack_config
+
+
+@dataclass
+class Target:
+    stack: str
+    region: Optional[str] = None
+    base: str = "prod"
+    config: Dict[str, Any] = field(default_factory=dict)
+    secrets: Dict[str, str] = field(default_factory=dict)
+
+    def overrides(self) -> Dict[str, Any]:
+        """Config overrides on top of the base stack file."""
+        overrides = dict(self.config)
+        if self.region:
+            overrides["aws:region"] = self.region
+            overrides["awsRegion"] = self.region
+        return overrides
+
+
+def load_targets(path: str) -> List[Target]:
+    with open(path) as f:
+        entries = yaml.safe_load(f)
+    targets = [Target(**entry) for entry in entries]
+    stacks = [target.stack for target in targets]
+    if len(set(stacks)) != len(stacks):
+        raise ValueError(f"duplicate stacks in {path}")
+    return targets
+
+
+def inline_program() -> None:
+    """The project's ``__main__.py`` as an Automation API inline program."""
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    runpy.run_path(os.path.join(REPO_DIR, "__main__.py"), run_name="__main__")
+
+
+def _log(stack: str, message: str) -> None:
+    print(f"[{stack}] {message}", flush=True)
+
+
+def event_printer(stack: str) -> Callable[[Any], None]:
+    """``on_event`` callback printing one line per resource step and diagnostic."""
+    def on_event(event) -> None:
+        if event.resource_pre_event is not None:
+            metadata = event.resource_pre_event.metadata
+            if metadata.op != "same":
+                _log(stack, f"{metadata.op.value} {metadata.type} {metadata.urn.split('::')[-1]}")
+        elif event.res_outputs_event is not None:
+            metadata = event.res_outputs_event.metadata
+            if metadata.op != "same":
+                _log(stack, f"{metadata.op.value} done {metadata.urn.split('::')[-1]}")
+        elif event.res_op_failed_event is not None:
+            _log(stack, f"failed {event.res_op_failed_event.metadata.urn}")
+        elif event.diagnostic_event is not None and event.diagnostic_event.severity in ("warning", "error"):
+            _log(stack, f"{event.diagnostic_event.severity}: {event.diagnostic_event.message.strip()}")
+    return on_event
+
+
+def select_stack(target: Target, backend: str):
+    """Create or select the stack of ``target`` on ``backend`` with the
+    project's program and set its config: the base stack file with the
+    target's overrides, and its secrets from the environment."""
+    from pulumi import automation as auto
+
+    project = project_name()
+    stack = auto.create_or_select_stack(
+        stack_name=target.stack,
+        project_name=project,
+        program=inline_program,
+        opts=auto.LocalWorkspaceOptions(
+            project_settings=auto.ProjectSettings(
+                name=project,
+                runtime="python",
+                backend=auto.ProjectBackend(backend),
+            ),
+            env_vars={
+                "PULUMI_CONFIG_PASSPHRASE": os.environ.get("PULUMI_CONFIG_PASSPHRASE", ""),
+            },
+        ))
+    config = {key: auto.ConfigValue(value)
+              for key, value in stack_config(target.base, target.overrides(), secret_placeholder=None).items()}
+    for key, env_var in target.secrets.items():
+        config[key if ":" in key else f"{project}:{key}"] = auto.ConfigValue(os.environ[env_var], secret=True)
+    stack.set_all_config(config)
+    return stack
+
+
+def run_target(target: Target, action: str, backend: str, parallel: Optional[int],
+               events_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Preview or update one stack; runs in a worker process."""
+    from tools.timeline import EventRecorder, format_report, write_outputs
+
+    result: Dict[str, Any] = {"stack": target.stack, "region": target.region, "action": action,
+                              "status": "failed", "changes": {}, "outputs": {}}
+    recorder = None
+    started = time.perf_counter()
+    try:
+        stack = select_stack(target, backend)
+        on_event = event_printer(target.stack)
+        if events_dir:
+            prefix = os.path.join(events_dir, f"{target.stack}.{action}")
+            recorder = EventRecorder(open(f"{prefix}.events.jsonl", "w"))
+            printer = on_event
+
+            def on_event(event):
+                recorder(event)
+                printer(event)
+
+        if action == "preview":
+            preview = stack.preview(on_event=on_event, parallel=parallel)
+            changes = preview.change_summary
+        else:
+            up = stack.up(on_event=on_event, parallel=parallel)
+            changes = up.summary.resource_changes or {}
+            result["outputs"] = {key: "[secret]" if output.secret else output.value
+                                 for key, output in up.outputs.items()}
+        result["changes"] = {getattr(op, "value", op): count for op, count in changes.items()}
+        result["status"] = "succeeded"
+    except Exception as e:
+        _log(target.stack, "".join(traceback.format_exception_only(type(e), e)).strip())
+        result["error"] = str(e)
+    result["duration_s"] = round(time.perf_counter() - started, 2)
+
+    if recorder is not None:
+        recorder.out.close()
+        timeline = recorder.timeline()
+        write_outputs(timeline, f"{prefix}.timeline.json", f"{prefix}.trace.json")
+        for line in format_report(timeline).splitlines():
+            _log(target.stack, line)
+    return result
+
+
+def run_target_mocked(target: Target, action: str, backend: str, parallel: Optional[int],
+                      events_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Create or select the stack of ``target`` on ``backend`` like
+    ``run_target``, then run the program with the stack's config under mocks
+    instead of the engine; nothing is deployed and the stack keeps no state."""
+    from tools.mock_program import run_program
+
+    result: Dict[str, Any] = {"stack": target.stack, "region": target.region, "action": action,
+                              "status": "failed", "changes": {}, "outputs": {}}
+    started = time.perf_counter()
+    try:
+        stack = select_stack(target, backend)
+        config = {key: value.value for key, value in stack.get_all_config().items()}
+        run = run_program(target.stack, config=config,
+                          on_resource=lambda r: _log(target.stack, f"create {r.typ} {r.name}"))
+        result["changes"] = {"create": len(run.resources)}
+        result["outputs"] = run.outputs
+        result["status"] = "succeeded"
+    except Exception as e:
+        _log(target.stack, "".join(traceback.format_exception_only(type(e), e)).strip())
+        result["error"] = str(e)
+    result["duration_s"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def deploy(targets: List[Target], action: str = "preview", workers: int = 4,
+           backend: Optional[str] = None, parallel: Optional[int] = None,
+           mock: bool = False, events_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Fan ``action`` out over ``targets`` with at most ``workers`` processes,
+    returning one summary per target in target order."""
+    backend = backend or os.environ.get("PULUMI_BACKEND_URL") or "file://~"
+    run = run_target_mocked if mock else run_target
+    if events_dir:
+        os.makedirs(events_dir, exist_ok=True)
+    results = {}
+    # spawn keeps grpc and event loop state out of the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(run, target, action, backend, parallel, events_dir): target for target in targets}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["stack"]] = result
+            _log(result["stack"], f"{action} {result['status']} in {result['duration_s']}s")
+    return [results[target.stack] for target in targets]
+
+
+def print_summary(results: List[Dict[str, Any]]) -> None:
+    for result in results:
+        changes = ", ".join(f"{op} {count}" for op, count in sorted(result["changes"].items())) or "no changes"
+        print(f"{result['stack']:<16} {result['region'] or '-':<14} {result['status']:<10} "
+              f"{result['duration_s']:>8.2f}s  {changes}")
+        for key, value in sorted(result["outputs"].items()):
+            print(f"  {key} = {value}")
+        if "error" in result:
+            print(f"  error: {result['error'].splitlines()[0] if result['error'] else ''}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", help="yaml or json file with the stacks to run")
+    parser.add_argument("--up", action="store_true", help="deploy instead of preview")
+    parser.add_argument("--workers", type=int, default=4, help="stacks run at the same time")
+    parser.add_argument("--parallel", type=int, help="resource operations per stack at the same time")
+    parser.add_argument("--backend", help="state backend url (default: $PULUMI_BACKEND_URL or file://~)")
+    parser.add_argument("--stack", action="append", help="only run this stack, repeatable")
+    parser.add_argument("--mock", action="store_true",
+                        help="set up the stacks on the backend, run the program under mocks, no cloud access")
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--events-dir", help="record engine events and per stack timelines here")
+    args = parser.parse_args(argv)
+
+    targets = load_targets(args.targets)
+    if args.stack:
+        targets = [target for target in targets if target.stack in args.stack]
+
+    started = time.perf_counter()
+    results = deploy(targets, "up" if args.up else "preview", args.workers,
+                     args.backend, args.parallel, args.mock, args.events_dir)
+    print_summary(results)
+    print(f"{len(results)} stacks in {time.perf_counter() - started:.2f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"targets": [asdict(t) for t in targets], "results": results}, f, indent=2, default=str)
+            f.write("\n")
+    return 0 if all(result["status"] == "succeeded" for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,477 @@
+"""Load test the deployed app through its ALB, or a local stand-in server.
+
+Virtual users each keep one keep-alive HTTP/1.1 connection open and send
+requests back to back; how many of them are active follows a ramp profile
+of stages, ``N:SECONDS`` holding N users and ``A-B:SECONDS`` moving linearly
+from A to B users. The target is a URL or the ``albUrl`` output of a stack,
+https when the ALB has a certificate (``--insecure`` when that certificate is
+for the app's domain rather than the ALB's own DNS name).
+Requests per second, latency percentiles (see ``tools.alb_logs.Histogram``),
+status codes and errors are reported, per second too, and written as JSON;
+with ``--watch-asg`` the desired and in service capacity of the web
+autoscaling group is sampled alongside through the AWS CLI:
+
+    python -m tools.loadgen --local --stages 0-20:10,20:20
+    python -m tools.loadgen --stack prod --stages 0-100:60,100:300 --json prod.load.json
+    python -m tools.loadgen --url http://localhost:8000/ --concurrency 50 --duration 30
+    python -m tools.loadgen --stack prod --stages 200:600 --watch-asg
+    python -m tools.loadgen --serve 8000 --serve-latency 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import ssl
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from tools.alb_logs import Histogram
+
+REPORT_PERCENTILES = (50, 90, 95, 99)
+
+# inactive users check this often whether the ramp needs them
+IDLE_POLL_S = 0.05
+
+
+@dataclass
+class Stage:
+    start: int
+    end: int
+    duration_s: float
+
+
+def parse_stages(spec: str) -> List[Stage]:
+    """``"0-50:60,50:120"`` into a 60s ramp from 0 to 50 users held for 120s."""
+    stages = []
+    for item in spec.split(","):
+        users, _, seconds = item.strip().partition(":")
+        start, _, end = users.partition("-")
+        if not seconds:
+            raise ValueError(f"stage {item!r} is not USERS:SECONDS or FROM-TO:SECONDS")
+        stages.append(Stage(int(start), int(end or start), float(seconds)))
+    return stages
+
+
+def concurrency_at(stages: List[Stage], elapsed_s: float) -> int:
+    """Active users ``elapsed_s`` into the test, 0 once every stage is over."""
+    for stage in stages:
+        if elapsed_s < stage.duration_s:
+            return round(stage.start + (stage.end - stage.start) * elapsed_s / stage.duration_s)
+        elapsed_s -= stage.duration_s
+    return 0
+
+
+@dataclass
+class Second:
+    users: int = 0
+    requests: int = 0
+    errors: int = 0
+    latency: Histogram = field(default_factory=Histogram)
+
+
+@dataclass
+class Results:
+    latency: Histogram = field(default_factory=Histogram)
+    statuses: Dict[int, int] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    connections: int = 0
+    seconds: Dict[int, Second] = field(default_factory=dict)
+    capacity: List[Dict[str, Any]] = field(default_factory=list)
+
+    def second(self, elapsed_s: float) -> Second:
+        return self.seconds.setdefault(int(elapsed_s), Second())
+
+    def record(self, elapsed_s: float, latency_s: float, status: Optional[int], error: Optional[str]) -> None:
+        second = self.second(elapsed_s)
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+            second.errors += 1
+            return
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latency.record(latency_s)
+        second.requests += 1
+        second.latency.record(latency_s)
+        if status >= 500:
+            second.errors += 1
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.open = True
+
+    @classmethod
+    async def connect(cls, host: str, port: int, tls: bool, verify: bool = True) -> "Connection":
+        context = None
+        if tls:
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+        reader, writer = await asyncio.open_connection(host, port, ssl=context, server_hostname=host if tls else None)
+        return cls(reader, writer)
+
+    async def request(self, request: bytes, head: bool = False) -> Tuple[int, int]:
+        """Send a prepared request, read the response and return its status
+        and body size; responses to a ``head`` request have no body."""
+        self.writer.write(request)
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if head or status in (204, 304) or 100 <= status < 200:
+            size = 0
+        elif "content-length" in headers:
+            size = int(headers["content-length"])
+            await self.reader.readexactly(size)
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            size = 0
+            while True:
+                chunk = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await self.reader.readexactly(chunk + 2)
+                size += chunk
+                if chunk == 0:
+                    break
+        else:
+            size = len(await self.reader.read())
+            self.open = False
+        if headers.get("connection", "").lower() == "close":
+            self.open = False
+        return status, size
+
+    def close(self) -> None:
+        self.open = False
+        self.writer.close()
+
+
+def build_request(method: str, host: str, path: str) -> bytes:
+    return (f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            "User-Agent: snakegame-loadgen\r\n"
+            "Accept: */*\r\n"
+            "Connection: keep-alive\r\n\r\n").encode()
+
+
+class LoadTest:
+    def __init__(self, url: str, stages: List[Stage], paths: Optional[List[str]] = None,
+                 method: str = "GET", timeout_s: float = 10.0, verify: bool = True):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"only http and https urls are supported, got {url}")
+        self.url = url
+        self.tls = parts.scheme == "https"
+        self.verify = verify
+        self.head = method.upper() == "HEAD"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.tls else 80)
+        host_header = parts.netloc.rsplit("@", 1)[-1]
+        self.requests = [build_request(method, host_header, path)
+                         for path in paths or [(parts.path or "/") + (f"?{parts.query}" if parts.query else "")]]
+        self.stages = stages
+        self.timeout_s = timeout_s
+        self.results = Results()
+        self.started = 0.0
+        self.users = 0
+        self.done = False
+
+    def elapsed_s(self) -> float:
+        return time.perf_counter() - self.started
+
+    async def user(self, index: int) -> None:
+        connection: Optional[Connection] = None
+        request_index = index
+        while not self.done:
+            if index >= self.users:
+                # ramped down: give the connection back
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                await asyncio.sleep(IDLE_POLL_S)
+                continue
+
+            request = self.requests[request_index % len(self.requests)]
+            request_index += 1
+            started = time.perf_counter()
+            status, error = None, None
+            try:
+                if connection is None or not connection.open:
+                    connection = await asyncio.wait_for(
+                        Connection.connect(self.host, self.port, self.tls, self.verify), self.timeout_s)
+                    self.results.connections += 1
+                status, _ = await asyncio.wait_for(connection.request(request, self.head), self.timeout_s)
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except asyncio.IncompleteReadError:
+                error = "connection closed"
+            except (OSError, ValueError, asyncio.LimitOverrunError) as e:
+                error = type(e).__name__
+            if error is not None and connection is not None:
+                connection.close()
+                connection = None
+            self.results.record(started - self.started, time.perf_counter() - started, status, error)
+            if error is not None:
+                # do not spin on a refused connection
+                await asyncio.sleep(0.1)
+
+        if connection is not None:
+            connection.close()
+
+    async def run(self, watch=None) -> Results:
+        max_users = max(max(stage.start, stage.end) for stage in self.stages)
+        total_s = sum(stage.duration_s for stage in self.stages)
+        self.started = time.perf_counter()
+        users = [asyncio.create_task(self.user(i)) for i in range(max_users)]
+        watcher = asyncio.create_task(watch(self)) if watch else None
+        while (elapsed := self.elapsed_s()) < total_s:
+            self.users = concurrency_at(self.stages, elapsed)
+            self.results.second(elapsed).users = max(self.results.second(elapsed).users, self.users)
+            await asyncio.sleep(min(0.1, total_s - elapsed))
+        self.done = True
+        await asyncio.gather(*users)
+        if watcher:
+            watcher.cancel()
+        return self.results
+
+
+def asg_watcher(asg_name: str, interval_s: float = 10.0, region: Optional[str] = None):
+    """Coroutine sampling the capacity of ``asg_name`` into the results."""
+    command = ["aws", "autoscaling", "describe-auto-scaling-groups",
+               "--auto-scaling-group-names", asg_name,
+               "--query", "AutoScalingGroups[0].[DesiredCapacity,length(Instances[?LifecycleState=='InService'])]",
+               "--output", "json"]
+    if region:
+        command += ["--region", region]
+
+    async def watch(test: LoadTest) -> None:
+        while True:
+            sample = {"t": round(test.elapsed_s(), 1)}
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                stdout, stderr = await process.communicate()
+                if process.returncode == 0:
+                    sample["desired"], sample["in_service"] = json.loads(stdout)
+                else:
+                    sample["error"] = stderr.decode().strip().splitlines()[-1:]
+            except OSError as e:
+                sample["error"] = str(e)
+            test.results.capacity.append(sample)
+            print(f"  {sample['t']:>7.1f}s asg " + (
+                f"desired {sample['desired']} in service {sample['in_service']}"
+                if "desired" in sample else f"unavailable: {sample['error']}"), file=sys.stderr)
+            await asyncio.sleep(interval_s)
+
+    return watch
+
+
+async def serve(host: str = "127.0.0.1", port: int = 0, latency_s: float = 0.0,
+                error_rate: float = 0.0, body: bytes = b"ok\n") -> asyncio.Server:
+    """Stand-in for the app: answers every request after ``latency_s`` with
+    ``body``, or a 500 for ``error_rate`` of them, keeping connections alive."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get("content-length", 0)):
+                    await reader.readexactly(int(headers["content-length"]))
+                if latency_s:
+                    await asyncio.sleep(latency_s)
+                failed = error_rate and random.random() < error_rate
+                payload = b"error\n" if failed else body
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(
+                    f"HTTP/1.1 {'500 Internal Server Error' if failed else '200 OK'}\r\n"
+                    f"Content-Type: text/plain\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode()
+                    + (b"" if lines[0].startswith("HEAD ") else payload))
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port, backlog=1024)
+
+
+def stack_outputs(stack: str, backend: Optional[str] = None) -> Dict[str, Any]:
+    """Outputs of a deployed stack of this project."""
+    from pulumi import automation as auto
+    from tools.deploy import inline_program
+    from tools.mock_program import project_name
+
+    project = project_name()
+    selected = auto.select_stack(
+        stack_name=stack,
+        project_name=project,
+        program=inline_program,
+        opts=auto.LocalWorkspaceOptions(
+            project_settings=auto.ProjectSettings(
+                name=project,
+                runtime="python",
+                backend=auto.ProjectBackend(backend or os.environ.get("PULUMI_BACKEND_URL") or "file://~"),
+            ),
+            env_vars={
+                "PULUMI_CONFIG_PASSPHRASE": os.environ.get("PULUMI_CONFIG_PASSPHRASE", ""),
+            },
+        ))
+    return {key: output.value for key, output in selected.outputs().items()}
+
+
+def stack_url(outputs: Dict[str, Any]) -> str:
+    """Url of the app behind the alb of a stack; stacks deployed before
+    albUrl was exported only have albDns and no certificate."""
+    return outputs.get("albUrl") or f"http://{outputs['albDns']}/"
+
+
+def report(test: LoadTest, results: Results, duration_s: float) -> Dict[str, Any]:
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 2)
+
+    def latency(histogram: Histogram) -> Dict[str, Optional[float]]:
+        return {
+            **{f"p{q}": ms(histogram.percentile(q)) for q in REPORT_PERCENTILES},
+            "mean": ms(histogram.mean()),
+            "max": ms(histogram.max if histogram.count else None),
+        }
+
+    responses = sum(results.statuses.values())
+    failed = sum(results.errors.values()) + sum(count for status, count in results.statuses.items() if status >= 500)
+    attempts = responses + sum(results.errors.values())
+    return {
+        "url": test.url,
+        "stages": [vars(stage) for stage in test.stages],
+        "duration_s": round(duration_s, 2),
+        "requests": attempts,
+        "responses": responses,
+        "rps": round(responses / duration_s, 1) if duration_s else 0.0,
+        "error_rate": round(failed / attempts, 4) if attempts else 0.0,
+        "statuses": {str(status): count for status, count in sorted(results.statuses.items())},
+        "errors": results.errors,
+        "connections_opened": results.connections,
+        "latency_ms": latency(results.latency),
+        "timeline": [
+            {"t": t, "users": second.users, "rps": second.requests, "errors": second.errors,
+             "p50_ms": ms(second.latency.percentile(50)), "p99_ms": ms(second.latency.percentile(99))}
+            for t, second in sorted(results.seconds.items())
+        ],
+        "capacity": results.capacity,
+    }
+
+
+def print_report(data: Dict[str, Any]) -> None:
+    latency = data["latency_ms"]
+    print(f"{data['url']}: {data['responses']} responses in {data['duration_s']}s, {data['rps']} req/s, "
+          f"{data['error_rate']:.2%} errors over {data['connections_opened']} connections")
+    print("latency " + " ".join(f"{key} {value}ms" for key, value in latency.items() if value is not None))
+    print("statuses " + (", ".join(f"{status}: {count}" for status, count in data["statuses"].items()) or "none"))
+    if data["errors"]:
+        print("errors " + ", ".join(f"{error}: {count}" for error, count in data["errors"].items()))
+
+
+async def run(args) -> Dict[str, Any]:
+    server = None
+    outputs: Dict[str, Any] = {}
+    if args.local:
+        server = await serve(latency_s=args.serve_latency / 1000, error_rate=args.serve_error_rate)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+    elif args.url:
+        url = args.url
+    else:
+        outputs = stack_outputs(args.stack, args.backend)
+        url = stack_url(outputs)
+
+    if args.stages:
+        stages = parse_stages(args.stages)
+    else:
+        stages = [Stage(args.concurrency, args.concurrency, args.duration)]
+        if args.ramp_up:
+            stages.insert(0, Stage(0, args.concurrency, args.ramp_up))
+    watch = None
+    if args.watch_asg:
+        asg_name = args.asg or outputs.get("webAutoscalingGroupName")
+        if not asg_name:
+            raise SystemExit("--watch-asg needs --asg or a stack exporting webAutoscalingGroupName")
+        watch = asg_watcher(asg_name, args.watch_interval, args.region)
+
+    test = LoadTest(url, stages, args.path, args.method, args.timeout, verify=not args.insecure)
+    started = time.perf_counter()
+    results = await test.run(watch)
+    data = report(test, results, time.perf_counter() - started)
+    if server:
+        server.close()
+        await server.wait_closed()
+    return data
+
+
+async def serve_forever(port: int, latency_ms: float, error_rate: float) -> None:
+    server = await serve("0.0.0.0", port, latency_ms / 1000, error_rate)
+    print(f"serving on port {port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="url to load, instead of the albUrl output of --stack")
+    target.add_argument("--local", action="store_true", help="load a local stand-in server")
+    target.add_argument("--serve", type=int, metavar="PORT", help="only run the stand-in server")
+    parser.add_argument("--stack", default="prod", help="stack whose albUrl output is loaded")
+    parser.add_argument("--backend", help="state backend url (default: $PULUMI_BACKEND_URL or file://~)")
+    parser.add_argument("--stages", help="ramp profile, e.g. 0-50:60,50:120 (users:seconds)")
+    parser.add_argument("--concurrency", type=int, default=10, help="users without --stages")
+    parser.add_argument("--duration", type=float, default=30, help="seconds without --stages")
+    parser.add_argument("--ramp-up", type=float, default=0, help="seconds to reach --concurrency")
+    parser.add_argument("--path", action="append", help="request paths, repeatable, used round robin")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds per request")
+    parser.add_argument("--insecure", action="store_true",
+                        help="do not verify the tls certificate, e.g. one for the app domain on the alb dns name")
+    parser.add_argument("--watch-asg", action="store_true", help="sample the web autoscaling group capacity")
+    parser.add_argument("--asg", help="autoscaling group to watch (default: webAutoscalingGroupName output)")
+    parser.add_argument("--watch-interval", type=float, default=10)
+    parser.add_argument("--region", help="aws region of the autoscaling group")
+    parser.add_argument("--serve-latency", type=float, default=0, help="stand-in server latency in ms")
+    parser.add_argument("--serve-error-rate", type=float, default=0, help="stand-in server share of 500s")
+    parser.add_argument("--json", help="write the report to this file, - for stdout")
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        asyncio.run(serve_forever(args.serve, args.serve_latency, args.serve_error_rate))
+        return 0
+
+    data = asyncio.run(run(args))
+    if args.json == "-":
+        json.dump(data, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(data)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(data, f, indent=2)
+                f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
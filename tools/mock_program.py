@@ -0,0 +1,210 @@
+"""Run the Pulumi program offline under ``pulumi.runtime.set_mocks``.
+
+The stack configuration is read from ``Pulumi.<stack>.yaml`` (secrets are
+replaced with placeholders) and can be overridden per run, so tools can build
+the resource graph at different sizes without any cloud or network access.
+The program's lookup cache is disabled unless ``LOOKUP_CACHE_FILE`` is set,
+so mocked lookups never end up in the stack's cache file.
+"""
+import asyncio
+import json
+import os
+import runpy
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import pulumi
+import yaml
+from pulumi.runtime.stack import run_pulumi_func
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# zones returned by the mocked availability zone lookup
+MOCK_ZONE_COUNT = 8
+
+
+@dataclass
+class MockResource:
+    typ: str
+    name: str
+    inputs: Dict[str, Any]
+    custom: bool
+    registered_at: float
+    urn: str = ""
+    parent: str = ""
+    dependencies: List[str] = field(default_factory=list)
+    aliases: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ProgramRun:
+    resources: List[MockResource] = field(default_factory=list)
+    invokes: List[str] = field(default_factory=list)
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def custom_resources(self) -> List[MockResource]:
+        return [r for r in self.resources if r.custom]
+
+
+def project_name() -> str:
+    with open(os.path.join(REPO_DIR, "Pulumi.yaml")) as f:
+        return yaml.safe_load(f)["name"]
+
+
+def stack_config(stack: str = "prod", overrides: Optional[Dict[str, Any]] = None,
+                 secret_placeholder: Optional[str] = "mock-secret") -> Dict[str, str]:
+    """Fully qualified config of ``stack`` with ``overrides`` applied.
+
+    Override keys without a namespace are put in the project namespace.
+    Encrypted values are replaced with ``secret_placeholder``, or left out
+    when it is None.
+    """
+    with open(os.path.join(REPO_DIR, f"Pulumi.{stack}.yaml")) as f:
+        values = dict(yaml.safe_load(f).get("config") or {})
+    project = project_name()
+    for key, value in (overrides or {}).items():
+        values[key if ":" in key else f"{project}:{key}"] = value
+
+    config = {}
+    for key, value in values.items():
+        if isinstance(value, dict) and "secure" in value:
+            if secret_placeholder is None:
+                continue
+            value = secret_placeholder
+        elif value is None:
+            value = ""
+        if isinstance(value, (dict, list, bool)):
+            value = json.dumps(value)
+        config[key] = str(value)
+    return config
+
+
+class ProgramMocks(pulumi.runtime.Mocks):
+    """Echo inputs back as outputs, filling in the attributes the program reads."""
+
+    def __init__(self, run: ProgramRun, on_resource: Optional[Callable[[MockResource], None]] = None):
+        self.run = run
+        self.on_resource = on_resource
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        resource = MockResource(
+            typ=args.typ,
+            name=args.name,
+            inputs=dict(args.inputs),
+            custom=args.custom,
+            registered_at=time.perf_counter(),
+        )
+        self.run.resources.append(resource)
+        if self.on_resource is not None:
+            self.on_resource(resource)
+        outputs = dict(args.inputs)
+        outputs.setdefault("arn", f"arn:aws:mock:::{args.name}")
+        outputs.setdefault("arnSuffix", f"mock/{args.name}")
+        outputs.setdefault("name", args.name)
+        outputs.setdefault("identifier", args.name)
+        outputs.setdefault("dnsName", f"{args.name}.mock.internal")
+        outputs.setdefault("endpoint", f"{args.name}.mock.internal")
+        outputs.setdefault("address", f"{args.name}.mock.internal")
+        outputs.setdefault("readerEndpoint", f"{args.name}-ro.mock.internal")
+        outputs.setdefault("port", 3306)
+        outputs.setdefault("latestVersion", 1)
+        if args.typ == "aws:ec2/vpc:Vpc" and args.inputs.get("assignGeneratedIpv6CidrBlock"):
+            outputs["ipv6CidrBlock"] = "2001:db8:1200::/56"
+        if args.typ == "aws:imagebuilder/image:Image":
+            outputs["outputResources"] = [{"amis": [{"image": "ami-mock"}]}]
+        return [f"{args.name}-id", outputs]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        self.run.invokes.append(args.token)
+        if args.token == "aws:index/getAvailabilityZones:getAvailabilityZones":
+            names = [f"mock-1{chr(ord('a') + i)}" for i in range(MOCK_ZONE_COUNT)]
+            return {"names": names, "zoneIds": names}
+        if args.token == "aws:ec2/getAmi:getAmi":
+            return {"id": "ami-mock", "architecture": "x86_64"}
+        if args.token == "aws:elb/getServiceAccount:getServiceAccount":
+            return {"id": "000000000000", "arn": "arn:aws:iam::000000000000:root"}
+        if args.token == "aws:iam/getPolicyDocument:getPolicyDocument":
+            return {"json": "{}"}
+        return {}
+
+
+def _record_dependencies(run: ProgramRun) -> None:
+    """Fill in the urn, parent, dependencies and aliases (names, or urns
+    when given as such) of every registered resource, which the mocks do not
+    get to see."""
+    monitor = pulumi.runtime.settings.get_monitor()
+    register_resource = monitor.RegisterResource
+
+    def recording_register_resource(request):
+        response = register_resource(request)
+        if request.type != "pulumi:pulumi:Stack":
+            dependencies = set(request.dependencies)
+            for property_dependencies in request.propertyDependencies.values():
+                dependencies.update(property_dependencies.urns)
+            for resource in reversed(run.resources):
+                if resource.typ == request.type and resource.name == request.name:
+                    resource.urn = response.urn
+                    resource.parent = request.parent
+                    resource.dependencies = sorted(dependencies)
+                    resource.aliases = [alias.spec.name if alias.HasField("spec") else alias.urn
+                                        for alias in request.aliases]
+                    break
+        return response
+
+    monitor.RegisterResource = recording_register_resource
+
+
+def run_program(stack: str = "prod", overrides: Optional[Dict[str, Any]] = None,
+                before_run=None, on_resource=None, config: Optional[Dict[str, str]] = None) -> ProgramRun:
+    """Run ``__main__.py`` to completion under mocks and return what it
+    registered and exported.
+
+    ``config`` is the fully qualified config to run with, as a stack in a
+    backend has it; by default it is read from ``Pulumi.<stack>.yaml`` with
+    ``overrides`` applied. ``before_run`` is called after the mocks are installed and the program's
+    modules are importable, right before the program starts. ``on_resource``
+    is called with every resource as it is registered.
+    """
+    run = ProgramRun()
+    # reuse the thread's loop: the pulumi runtime may already have bound one
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    pulumi.runtime.set_all_config(config if config is not None else stack_config(stack, overrides))
+    pulumi.runtime.set_mocks(ProgramMocks(run, on_resource), project=project_name(), stack=stack, preview=False)
+    _record_dependencies(run)
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    if before_run is not None:
+        before_run()
+
+    # record stack exports once their values resolve
+    export = pulumi.export
+
+    def record_export(name: str, value: Any) -> None:
+        pulumi.Output.from_input(value).apply(lambda v: run.outputs.__setitem__(name, v))
+        export(name, value)
+
+    os.environ.setdefault("LOOKUP_CACHE_FILE", "")
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)
+    pulumi.export = record_export
+    try:
+        run.started_at = time.perf_counter()
+        loop.run_until_complete(run_pulumi_func(
+            lambda: runpy.run_path(os.path.join(REPO_DIR, "__main__.py"), run_name="__main__")))
+        run.finished_at = time.perf_counter()
+    finally:
+        pulumi.export = export
+        os.chdir(cwd)
+    return run
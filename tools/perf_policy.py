@@ -0,0 +1,85 @@
+"""Run the performance policy pack offline against the program under mocks.
+
+The rules are those of ``policy/rules.py``, which the policy pack in
+``policy/`` runs during ``pulumi preview --policy-pack policy``; here they get
+the resources the program registers under mocks instead, with their inputs
+as properties, so no cloud access or Pulumi CLI is needed:
+
+    python -m tools.perf_policy
+    python -m tools.perf_policy --set singleNat=true --set albHealthCheckInterval=30
+    python -m tools.perf_policy --enforce high --json policy.json
+
+With ``--enforce`` the exit status is 1 if any violation of that severity or
+above is found, as the policy pack would block the deployment.
+"""
+import argparse
+import json
+import sys
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from policy.rules import SEVERITIES, Resource, Violation, evaluate, is_enforced
+
+
+def mock_resources(run) -> List[Resource]:
+    """Policy resources of a mocked ``ProgramRun``."""
+    return [
+        Resource(
+            urn=resource.urn,
+            type=resource.typ,
+            name=resource.name,
+            props=resource.inputs,
+            parent=resource.parent,
+            dependencies=list(resource.dependencies),
+        )
+        for resource in run.resources
+    ]
+
+
+def check(stack: str = "prod", overrides: Optional[Dict[str, Any]] = None) -> List[Violation]:
+    from tools.mock_program import run_program
+
+    return evaluate(mock_resources(run_program(stack, overrides)))
+
+
+def print_report(violations: List[Violation], min_severity: Optional[str]) -> None:
+    if not violations:
+        print("no performance violations")
+        return
+    ordered = sorted(violations, key=lambda v: (-SEVERITIES.index(v.severity), v.rule, v.name))
+    for violation in ordered:
+        level = "mandatory" if is_enforced(violation.severity, min_severity) else "advisory"
+        print(f"[{violation.severity}] {violation.rule} ({level}) {violation.name}: {violation.message}")
+    counts = {severity: sum(1 for v in violations if v.severity == severity) for severity in SEVERITIES}
+    print(", ".join(f"{count} {severity}" for severity, count in reversed(counts.items())))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stack", default="prod")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="config override, value parsed as yaml, repeatable")
+    parser.add_argument("--enforce", choices=SEVERITIES, metavar="SEVERITY",
+                        help="fail on violations of this severity and above")
+    parser.add_argument("--json", help="also write the violations to this file")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key] = yaml.safe_load(value)
+
+    violations = check(args.stack, overrides)
+    print_report(violations, args.enforce)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(v) for v in violations], f, indent=2)
+            f.write("\n")
+    blocking = [v for v in violations if is_enforced(v.severity, args.enforce)]
+    return 1 if blocking else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
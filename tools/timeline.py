@@ -0,0 +1,289 @@
+"""Per-resource and per-component deployment timings from engine events.
+
+Events are recorded through the Automation API ``on_event`` callback (see
+``python -m tools.deploy --events-dir``) as JSON lines in the engine's own
+event log format, so logs written by ``pulumi up --event-log`` can be read
+too. A log is turned into a timeline of when every resource step started and
+finished, rolled up per component, and written as JSON or as a Chrome trace
+(open in chrome://tracing or https://ui.perfetto.dev):
+
+    python -m tools.timeline prod.up.events.jsonl
+    python -m tools.timeline prod.up.events.jsonl --top 20 --trace prod.trace.json
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+COMPONENT_PREFIX = "components:index:"
+STACK_TYPE = "pulumi:pulumi:Stack"
+
+# engine event kinds carrying a resource step
+STEP_EVENTS = ("resourcePreEvent", "resOutputsEvent", "resOpFailedEvent")
+
+# steps on the old state of a resource the engine runs apart from its main
+# step, delete-replaced only once the rest of the update is done; they get
+# spans of their own so a replacement is not stretched until then
+SEPARATE_OPS = ("refresh", "delete-replaced", "discard-replaced")
+
+
+@dataclass
+class Span:
+    urn: str
+    type: str
+    name: str
+    op: str = ""
+    start_s: float = 0.0
+    end_s: Optional[float] = None
+    failed: bool = False
+    component: Optional[str] = None
+    resources: int = 0
+
+    @property
+    def duration_s(self) -> Optional[float]:
+        return None if self.end_s is None else self.end_s - self.start_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["duration_s"] = self.duration_s
+        return data
+
+
+@dataclass
+class Timeline:
+    resources: Dict[str, Span] = field(default_factory=dict)
+    components: Dict[str, Span] = field(default_factory=dict)
+
+    def slowest(self, top: int = 10) -> List[Span]:
+        """The ``top`` longest finished resource steps, components and the
+        stack excluded."""
+        spans = [s for s in self.resources.values()
+                 if s.duration_s is not None and not s.type.startswith(COMPONENT_PREFIX) and s.type != STACK_TYPE]
+        return sorted(spans, key=lambda s: -s.duration_s)[:top]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "resources": [s.to_dict() for s in sorted(self.resources.values(), key=lambda s: s.start_s)],
+            "components": [s.to_dict() for s in sorted(self.components.values(), key=lambda s: s.start_s)],
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace events with one row per component and its resources below it."""
+        rows = {urn: i + 1 for i, urn in enumerate(sorted(self.components, key=lambda u: self.components[u].start_s))}
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "(stack)"}}]
+        for urn, row in rows.items():
+            span = self.components[urn]
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": row,
+                           "args": {"name": f"{span.type[len(COMPONENT_PREFIX):]} {span.name}"}})
+        resources = [s for s in self.resources.values() if not s.type.startswith(COMPONENT_PREFIX)]
+        for span in list(self.components.values()) + resources:
+            if span.end_s is None:
+                continue
+            row = rows[span.urn] if span.urn in self.components else rows.get(span.component, 0)
+            events.append({
+                "name": span.name,
+                "cat": span.type,
+                "ph": "X",
+                "ts": round(span.start_s * 1e6),
+                "dur": round(span.duration_s * 1e6),
+                "pid": 1,
+                "tid": row,
+                "args": {"urn": span.urn, "op": span.op, "failed": span.failed},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _urn_type(urn: str) -> str:
+    return urn.split("::")[-2].split("$")[-1]
+
+
+def _metadata_parent(metadata: Dict[str, Any]) -> str:
+    for state in ("new", "old"):
+        if (metadata.get(state) or {}).get("parent"):
+            return metadata[state]["parent"]
+    return ""
+
+
+def build_timeline(events: Iterable[Dict[str, Any]]) -> Timeline:
+    """Timeline from engine events as JSON objects.
+
+    Times are seconds from the first step event, taken from ``receivedAt``
+    when the event was recorded by ``EventRecorder`` and from the engine's
+    whole second ``timestamp`` otherwise. Resources are keyed by urn, steps
+    of ``SEPARATE_OPS`` by urn and op.
+    """
+    timeline = Timeline()
+    parents: Dict[str, str] = {}
+    origin = None
+    for event in events:
+        kind = next((k for k in STEP_EVENTS if event.get(k)), None)
+        if kind is None:
+            continue
+        at = float(event.get("receivedAt", event.get("timestamp", 0)))
+        if origin is None:
+            origin = at
+        metadata = event[kind].get("metadata") or {}
+        urn = metadata.get("urn", "")
+        op = metadata.get("op", "")
+        parents.setdefault(urn, _metadata_parent(metadata))
+        if op == "same" or not urn:
+            continue
+
+        key = f"{urn}#{op}" if op in SEPARATE_OPS else urn
+        span = timeline.resources.get(key)
+        if span is None:
+            span = timeline.resources[key] = Span(
+                urn=urn,
+                type=metadata.get("type") or _urn_type(urn),
+                name=urn.split("::")[-1],
+                op=op,
+                start_s=at - origin,
+            )
+        elif op == "replace":
+            # the logical step after create-replacement
+            span.op = op
+        if kind != "resourcePreEvent":
+            span.end_s = at - origin
+            span.failed = kind == "resOpFailedEvent"
+
+    # roll every resource up into its closest enclosing component
+    for span in timeline.resources.values():
+        parent = parents.get(span.urn, "")
+        while parent and not _urn_type(parent).startswith(COMPONENT_PREFIX):
+            parent = parents.get(parent, "")
+        span.component = parent or None
+    for span in timeline.resources.values():
+        if span.type.startswith(COMPONENT_PREFIX) and span.op not in SEPARATE_OPS:
+            timeline.components.setdefault(span.urn, Span(
+                urn=span.urn, type=span.type, name=span.name, op=span.op, start_s=span.start_s,
+                end_s=span.end_s, failed=span.failed))
+    for span in timeline.resources.values():
+        if span.component is None or span.type.startswith(COMPONENT_PREFIX):
+            continue
+        # unchanged components have no step of their own
+        component = timeline.components.setdefault(span.component, Span(
+            urn=span.component, type=_urn_type(span.component),
+            name=span.component.split("::")[-1], op="same", start_s=span.start_s))
+        component.failed = component.failed or span.failed
+        # deferred steps on old state do not keep the component busy
+        if span.op in SEPARATE_OPS:
+            continue
+        component.resources += 1
+        component.start_s = min(component.start_s, span.start_s)
+        if span.end_s is not None:
+            component.end_s = max(component.end_s or span.end_s, span.end_s)
+    return timeline
+
+
+def read_events(path: str) -> List[Dict[str, Any]]:
+    """Events of a log; a last line cut off by an update still writing the
+    log is left out."""
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    events = []
+    for i, line in enumerate(lines):
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            if i < len(lines) - 1:
+                raise
+    return events
+
+
+def _state_to_json(state) -> Optional[Dict[str, Any]]:
+    if state is None:
+        return None
+    return {"type": state.type, "urn": state.urn, "id": state.id, "parent": state.parent}
+
+
+def event_to_json(event) -> Dict[str, Any]:
+    """The step related fields of an automation ``EngineEvent`` in the
+    engine's event log format."""
+    data: Dict[str, Any] = {"sequence": event.sequence, "timestamp": event.timestamp}
+    for kind, step in (("resourcePreEvent", event.resource_pre_event),
+                       ("resOutputsEvent", event.res_outputs_event),
+                       ("resOpFailedEvent", event.res_op_failed_event)):
+        if step is not None:
+            metadata = step.metadata
+            data[kind] = {"metadata": {
+                "op": getattr(metadata.op, "value", metadata.op),
+                "urn": metadata.urn,
+                "type": metadata.type,
+                "provider": metadata.provider,
+                "old": _state_to_json(metadata.old),
+                "new": _state_to_json(metadata.new),
+            }}
+    if event.summary_event is not None:
+        data["summaryEvent"] = {
+            "durationSeconds": event.summary_event.duration_seconds,
+            "resourceChanges": {getattr(op, "value", op): count
+                                for op, count in (event.summary_event.resource_changes or {}).items()},
+        }
+    return data
+
+
+class EventRecorder:
+    """``on_event`` callback appending every event to ``out`` as a JSON line
+    stamped with its receive time."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.events: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event) -> None:
+        data = event_to_json(event)
+        data["receivedAt"] = time.time()
+        with self.lock:
+            self.events.append(data)
+            self.out.write(json.dumps(data) + "\n")
+            self.out.flush()
+
+    def timeline(self) -> Timeline:
+        with self.lock:
+            return build_timeline(list(self.events))
+
+
+def format_report(timeline: Timeline, top: int = 10) -> str:
+    lines = ["components:"]
+    for span in sorted(timeline.components.values(), key=lambda s: -(s.duration_s or 0)):
+        duration = "-" if span.duration_s is None else f"{span.duration_s:.1f}s"
+        lines.append(f"  {span.type[len(COMPONENT_PREFIX):]:<10} {span.name:<12} {duration:>9}"
+                     f"  {span.resources} resources{'  FAILED' if span.failed else ''}")
+    lines.append(f"slowest {top} resources:")
+    for span in timeline.slowest(top):
+        lines.append(f"  {span.duration_s:>8.1f}s  {span.op:<18} {span.type:<45} {span.name}"
+                     f"{'  FAILED' if span.failed else ''}")
+    unfinished = [s for s in timeline.resources.values() if s.end_s is None]
+    if unfinished:
+        lines.append(f"unfinished: {', '.join(s.name for s in unfinished)}")
+    return "\n".join(lines)
+
+
+def write_outputs(timeline: Timeline, json_path: Optional[str] = None, trace_path: Optional[str] = None) -> None:
+    for path, data in ((json_path, timeline.to_dict()), (trace_path, timeline.to_chrome_trace())):
+        if path:
+            with open(path, "w") as f:
+                json.dump(data, f, indent=2)
+                f.write("\n")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("events", help="recorded event log, one json event per line")
+    parser.add_argument("--top", type=int, default=10, help="slowest resources to report")
+    parser.add_argument("--json", help="write the timeline as json to this file")
+    parser.add_argument("--trace", help="write a chrome trace to this file")
+    args = parser.parse_args(argv)
+
+    timeline = build_timeline(read_events(args.events))
+    print(format_report(timeline, args.top))
+    write_outputs(timeline, args.json, args.trace)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
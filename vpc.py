@@ -1,26 +1,102 @@
+import ipaddress
 import pulumi
 from pulumi import Input
-from typing import Optional, Dict, TypedDict, Any
+from typing import Optional, Dict, List, TypedDict, Any
 import pulumi_aws as aws
+from lookups import LookupCache
+
+# subnet tiers, numbered 1 to 3 in the slots of the vpc cidr
+SUBNET_TIERS = ("pub_sub_nat", "priv_sub_web", "priv_sub_db")
+
+# most availability zones the layout numbers subnets for
+MAX_AZ_COUNT = 8
+
+# subnets are this many bits longer than the vpc cidr, a /24 in a /16
+SUBNET_PREFIX_DIFF = 8
+
+# names of the public route table associations of the first two zones from
+# before the n-az layout
+PUBLIC_RT_CONNECTION_NAMES = ("pb1a_rt_connection", "pb2b_rt_connection")
+
+# smallest and largest subnets aws accepts
+MIN_SUBNET_PREFIX = 16
+MAX_SUBNET_PREFIX = 28
+
+def subnet_layout(vpc_cidr: str, az_count: int,
+                  overrides: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """One subnet per tier and availability zone out of ``vpc_cidr``.
+
+    Subnets keep the numbering the stack was created with: tier ``t`` (1 to 3)
+    in zone ``i`` (0 up) is slot ``10 * i + t``, so a 10.10.0.0/16 vpc gets
+    10.10.1.0/24, 10.10.11.0/24, 10.10.21.0/24 for the nat tier, and raising
+    azCount never renumbers existing subnets. ``overrides`` gives the cidrs of
+    a tier explicitly, one per zone.
+    """
+    if not 2 <= az_count <= MAX_AZ_COUNT:
+        raise ValueError(f"azCount must be between 2 and {MAX_AZ_COUNT}, got {az_count}")
+    overrides = overrides or {}
+    unknown = set(overrides) - set(SUBNET_TIERS)
+    if unknown:
+        raise ValueError(f"unknown subnet tiers {', '.join(sorted(unknown))}, expected {', '.join(SUBNET_TIERS)}")
+
+    network = ipaddress.ip_network(vpc_cidr)
+    prefixlen = network.prefixlen + SUBNET_PREFIX_DIFF
+    layout = {}
+    for t, tier in enumerate(SUBNET_TIERS, start=1):
+        if tier in overrides:
+            layout[tier] = list(overrides[tier])
+            if len(layout[tier]) != az_count:
+                raise ValueError(f"subnetCidrs {tier} needs {az_count} cidrs, one per zone, got {len(layout[tier])}")
+        elif prefixlen > MAX_SUBNET_PREFIX:
+            raise ValueError(f"vpc cidr {vpc_cidr} is too small for /{prefixlen} subnets, set subnetCidrs {tier}")
+        else:
+            layout[tier] = [
+                str(ipaddress.ip_network((int(network.network_address) + ((10 * i + t) << (32 - prefixlen)), prefixlen)))
+                for i in range(az_count)
+            ]
+
+    subnets = []
+    for cidr in (cidr for cidrs in layout.values() for cidr in cidrs):
+        subnet = ipaddress.ip_network(cidr)
+        if not MIN_SUBNET_PREFIX <= subnet.prefixlen <= MAX_SUBNET_PREFIX:
+            raise ValueError(f"subnet {cidr} must be between /{MIN_SUBNET_PREFIX} and /{MAX_SUBNET_PREFIX}")
+        if not subnet.subnet_of(network):
+            raise ValueError(f"subnet {cidr} is not within the vpc cidr {vpc_cidr}")
+        overlapping = [other for other in subnets if subnet.overlaps(other)]
+        if overlapping:
+            raise ValueError(f"subnet {cidr} overlaps {overlapping[0]}")
+        subnets.append(subnet)
+    return layout
+
+def subnet_ipv6_cidr(vpc_ipv6_cidr: str, tier: str, az_index: int) -> str:
+    """The /64 of a subnet within the /56 of the vpc, numbered by tier and zone
+    so more zones never renumber existing subnets."""
+    network = ipaddress.ip_network(vpc_ipv6_cidr)
+    index = SUBNET_TIERS.index(tier) * MAX_AZ_COUNT + az_index
+    return str(ipaddress.ip_network((int(network.network_address) + (index << 64), 64)))
 
 class VpcArgs(TypedDict, total=False):
-    vpcCidr: Input[Any]
-    pubSubNat1: Input[Any]
-    pubSubNat2: Input[Any]
-    privSubWeb1: Input[Any]
-    privSubWeb2: Input[Any]
-    privSubDb1: Input[Any]
-    privSubDb2: Input[Any]
+    vpcCidr: str
+    azCount: int
+    subnetCidrs: Dict[str, List[str]]
+    ipv6: bool
     projectName: Input[Any]
     awsRegion: Input[Any]
+    lookupCache: LookupCache
 
 class Vpc(pulumi.ComponentResource):
     def __init__(self, name: str, args: VpcArgs, opts:Optional[pulumi.ResourceOptions] = None):
-        super().__init__("components:index:Vpc", name, args, opts)
+        super().__init__("components:index:Vpc", name, None, opts)
+
+        az_count = args.get("azCount", 2)
+        layout = subnet_layout(args["vpcCidr"], az_count, args.get("subnetCidrs"))
+        # dual stack with an amazon provided /56 and a /64 per subnet
+        ipv6 = args.get("ipv6", False)
 
         #vpc
         vpc = aws.ec2.Vpc(f"{name}-vpc",
             cidr_block=args["vpcCidr"],
+            assign_generated_ipv6_cidr_block=ipv6,
             instance_tenancy="default",
             enable_dns_hostnames=True,
             enable_dns_support=True,
@@ -40,117 +116,82 @@ class Vpc(pulumi.ComponentResource):
         )
 
         #available zones
-        available_zones = aws.get_availability_zones_output()
-
-        #public subnet pub_sub_nat_1
-        pub_sub_nat1_subnet = aws.ec2.Subnet(f"{name}-pub_sub_nat_1",
-            vpc_id=vpc.id,
-            cidr_block=args["pubSubNat1"],
-            availability_zone=available_zones.names[0],
-            map_public_ip_on_launch=True,
-            tags={
-                "Name": "pub_sub_nat_1",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
-
-        #public subnet pub_sub_nat_2
-        pub_sub_nat2_subnet = aws.ec2.Subnet(f"{name}-pub_sub_nat_2",
-            vpc_id=vpc.id,
-            cidr_block=args["pubSubNat2"],
-            availability_zone=available_zones.names[1],
-            map_public_ip_on_launch=True,
-            tags={
-                "Name": "pub_sub_nat_2",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
+        lookups = args.get("lookupCache") or LookupCache(None, args["awsRegion"])
+        available_zones = lookups.availability_zones()
+        if len(available_zones) < az_count:
+            raise ValueError(f"azCount is {az_count} but the region has {len(available_zones)} zones")
+        zones = available_zones[:az_count]
 
         #route table and public route
+        public_routes = [{
+            "cidr_block": "0.0.0.0/0",
+            "gateway_id": internet_gateway.id,
+        }]
+        if ipv6:
+            public_routes.append({
+                "ipv6_cidr_block": "::/0",
+                "gateway_id": internet_gateway.id,
+            })
         public_route_table = aws.ec2.RouteTable(f"{name}-public_route_table",
             vpc_id=vpc.id,
-            routes=[{
-                "cidr_block": "0.0.0.0/0",
-                "gateway_id": internet_gateway.id,
-            }],
+            routes=public_routes,
             tags={
                 "Name": "public_route_table",
             },
             opts = pulumi.ResourceOptions(parent=self))
 
-        # connect public subnet pub_sub_nat_1 to public route table
-        pb1a_rt_connection = aws.ec2.RouteTableAssociation(f"{name}-pb1a_rt_connection",
-            subnet_id=pub_sub_nat1_subnet.id,
-            route_table_id=public_route_table.id,
-            opts = pulumi.ResourceOptions(parent=self))
-
-        # connect public subnet pub_sub_nat_2 to public route table
-        pb2b_rt_connection = aws.ec2.RouteTableAssociation(f"{name}-pb2b_rt_connection",
-            subnet_id=pub_sub_nat2_subnet.id,
-            route_table_id=public_route_table.id,
-            opts = pulumi.ResourceOptions(parent=self))
-
-        # private subnet priv_sub_web_1
-        priv_sub_web1_subnet = aws.ec2.Subnet(f"{name}-priv_sub_web_1",
-            vpc_id=vpc.id,
-            cidr_block=args["privSubWeb1"],
-            availability_zone=available_zones.names[0],
-            map_public_ip_on_launch=False,
-            tags={
-                "Name": "priv_sub_web_1",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
-
-        # private subnet priv_sub_web_2
-        priv_sub_web2_subnet = aws.ec2.Subnet(f"{name}-priv_sub_web_2",
-            vpc_id=vpc.id,
-            cidr_block=args["privSubWeb2"],
-            availability_zone=available_zones.names[1],
-            map_public_ip_on_launch=False,
-            tags={
-                "Name": "priv_sub_web_2",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
+        # one subnet per tier in every availability zone
+        subnets = {tier: [] for tier in SUBNET_TIERS}
+        for tier in SUBNET_TIERS:
+            public = tier == "pub_sub_nat"
+            for i, cidr in enumerate(layout[tier]):
+                ipv6_cidr = None
+                if ipv6:
+                    ipv6_cidr = vpc.ipv6_cidr_block.apply(
+                        lambda block, tier=tier, i=i: subnet_ipv6_cidr(block, tier, i))
+                subnet = aws.ec2.Subnet(f"{name}-{tier}_{i + 1}",
+                    vpc_id=vpc.id,
+                    cidr_block=cidr,
+                    ipv6_cidr_block=ipv6_cidr,
+                    # the alb and web instances get an address of both families
+                    assign_ipv6_address_on_creation=ipv6 and tier != "priv_sub_db",
+                    availability_zone=zones[i],
+                    map_public_ip_on_launch=public,
+                    tags={
+                        "Name": f"{tier}_{i + 1}",
+                    },
+                    opts = pulumi.ResourceOptions(parent=self))
+                subnets[tier].append(subnet)
 
-        # private subnet priv_sub_db_1
-        priv_sub_db1_subnet = aws.ec2.Subnet(f"{name}-priv_sub_db_1",
-            vpc_id=vpc.id,
-            cidr_block=args["privSubDb1"],
-            availability_zone=available_zones.names[0],
-            map_public_ip_on_launch=False,
-            tags={
-                "Name": "priv_sub_db_1",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
-
-        # private subnet priv_sub_db_2
-        priv_sub_db2_subnet = aws.ec2.Subnet(f"{name}-priv_sub_db_2",
-            vpc_id=vpc.id,
-            cidr_block=args["privSubDb2"],
-            availability_zone=available_zones.names[1],
-            map_public_ip_on_launch=False,
-            tags={
-                "Name": "priv_sub_db_2",
-            },
-            opts = pulumi.ResourceOptions(parent=self))
+        # connect public subnets to public route table, the associations of
+        # the first two zones keep their state under their original names
+        for i, subnet in enumerate(subnets["pub_sub_nat"]):
+            aliases = [pulumi.Alias(name=f"{name}-{PUBLIC_RT_CONNECTION_NAMES[i]}")] \
+                if i < len(PUBLIC_RT_CONNECTION_NAMES) else None
+            aws.ec2.RouteTableAssociation(f"{name}-pub_sub_nat_{i + 1}_rt_connection",
+                subnet_id=subnet.id,
+                route_table_id=public_route_table.id,
+                opts = pulumi.ResourceOptions(parent=self, aliases=aliases))
 
         self.projectName = args["projectName"]
         self.awsRegion = args["awsRegion"]
+        self.azCount = az_count
+        self.availabilityZones = zones
         self.internetGateway = internet_gateway
         self.vpcId = vpc.id
-        self.pubSubNat1Id = pub_sub_nat1_subnet.id
-        self.pubSubNat2Id = pub_sub_nat2_subnet.id
-        self.privSubWeb1Id = priv_sub_web1_subnet.id
-        self.privSubWeb2Id = priv_sub_web2_subnet.id
-        self.privSubDb1Id = priv_sub_db1_subnet.id
-        self.privSubDb2Id = priv_sub_db2_subnet.id
+        self.ipv6 = ipv6
+        self.vpcIpv6Cidr = vpc.ipv6_cidr_block if ipv6 else None
+        self.pubSubNatIds = [subnet.id for subnet in subnets["pub_sub_nat"]]
+        self.privSubWebIds = [subnet.id for subnet in subnets["priv_sub_web"]]
+        self.privSubDbIds = [subnet.id for subnet in subnets["priv_sub_db"]]
         self.register_outputs({
             'projectName': args["projectName"], 
             'awsRegion': args["awsRegion"], 
             'igwId': internet_gateway.id, 
             'vpcId': vpc.id, 
-            'pubSubNat1Id': pub_sub_nat1_subnet.id, 
-            'pubSubNat2Id': pub_sub_nat2_subnet.id, 
-            'privSubWeb1Id': priv_sub_web1_subnet.id, 
-            'privSubWeb2Id': priv_sub_web2_subnet.id, 
-            'privSubDb1Id': priv_sub_db1_subnet.id, 
-            'privSubDb2Id': priv_sub_db2_subnet.id
-        })
\ No newline at end of file
+            'vpcIpv6Cidr': self.vpcIpv6Cidr,
+            'availabilityZones': zones,
+            'pubSubNatIds': self.pubSubNatIds,
+            'privSubWebIds': self.privSubWebIds,
+            'privSubDbIds': self.privSubDbIds,
+        })
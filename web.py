@@ -1,35 +1,148 @@
+import base64
+import json
+import os
+import re
 import pulumi
 from pulumi import Input
-from typing import Optional, Dict, TypedDict, Any
+from typing import Optional, Dict, List, TypedDict, Any
 import pulumi_aws as aws
+from instance_types import is_burstable
+from lookups import LookupCache
+
+# environment file shared by the bootstrap scripts and the app service
+BOOTSTRAP_ENV_FILE = "/etc/snakegame.env"
+
+# "<phase> <uptime>" line appended at the start of every bootstrap phase
+BOOT_PHASES_FILE = "/var/log/snakegame-boot-phases"
+
+# custom metric namespace of the boot phase durations
+BOOT_METRICS_NAMESPACE = "SnakeGame/Boot"
+
+# group metrics published every minute with detailed monitoring
+GROUP_METRICS = [
+    "GroupDesiredCapacity",
+    "GroupInServiceInstances",
+    "GroupPendingInstances",
+    "GroupTerminatingInstances",
+    "GroupTotalInstances",
+    "WarmPoolWarmedCapacity",
+]
+
+# launch lifecycle hook completed by the instance once the app answers
+LAUNCH_HOOK_NAME = "snakegame-ready"
+
+def render_user_data(scripts: List[str], env: Dict[str, Input[Any]]) -> pulumi.Output:
+    """Base64 user data writing ``env`` to the app environment file and then
+    running the bodies of ``scripts`` in order, each one marked as a boot
+    phase named after its file."""
+    bodies = []
+    for script_file in scripts:
+        phase = os.path.splitext(os.path.basename(script_file))[0]
+        with open(script_file) as f:
+            bodies.append(f"boot_phase {phase}\n" + f.read().partition("\n")[2])
+
+    def render(values: Dict[str, Any]) -> str:
+        env_lines = "".join(f"{key}={value}\n" for key, value in values.items() if value is not None)
+        script = (
+            "#!/bin/bash\n"
+            f"cat > {BOOTSTRAP_ENV_FILE} <<'ENV'\n{env_lines}ENV\n"
+            f"set -a; . {BOOTSTRAP_ENV_FILE}; set +a\n"
+            f"boot_phase() {{ echo \"$1 $(cut -d' ' -f1 /proc/uptime)\" >> {BOOT_PHASES_FILE}; }}\n"
+            + "".join(bodies)
+        )
+        return base64.b64encode(script.encode()).decode()
+
+    return pulumi.Output.all(**env).apply(render)
+
+def instance_architecture(instance_type: str) -> str:
+    """Cpu architecture of an ec2 instance type, arm64 for the graviton
+    families (a1, t4g, m6g, c7gn, ...) and x86_64 for everything else."""
+    family = instance_type.split(".")[0]
+    match = re.fullmatch(r"[a-z]+\d+([a-z-]*)", family)
+    if family == "a1" or (match and "g" in match.group(1)):
+        return "arm64"
+    return "x86_64"
+
+# stock amazon linux 2 images per architecture, when no image is baked
+AMAZON_LINUX_AMIS = {
+    "x86_64": "amzn2-ami-hvm-*-x86_64-gp2",
+    "arm64": "amzn2-ami-hvm-*-arm64-gp2",
+}
 
 class WebArgs(TypedDict, total=False):
     projectName: Input[Any]
     webSecGroupId: Input[Any]
-    privSubWeb1: Input[Any]
-    privSubWeb2: Input[Any]
+    privSubWebs: List[Input[Any]]
     targetGroupArn: Input[Any]
+    targetGroupArnSuffix: Input[Any]
+    albArnSuffix: Input[Any]
     instanceType: Input[Any]
+    instanceTypes: List[Dict[str, Any]]
+    onDemandBaseCapacity: int
+    onDemandPercentageAboveBase: int
+    spotAllocationStrategy: str
+    imageId: Input[Any]
+    arm64ImageId: Input[Any]
     keyName: Input[Any]
-    userData: Input[Any]
+    rootVolumeSize: int
+    rootVolumeIops: int
+    rootVolumeThroughput: int
+    ebsOptimized: bool
+    detailedMonitoring: bool
+    cpuCredits: str
+    metadataHopLimit: int
+    bootstrapScripts: List[str]
+    bootstrapEnv: Dict[str, Input[Any]]
+    appModule: str
+    workersPerCpu: int
+    workerThreads: int
+    workerTimeout: int
+    keepaliveTimeout: int
     minSize: Input[float]
     maxSize: Input[float]
     desiredCapacity: Input[float]
     cpuTarget: Input[float]
+    requestCountTarget: Input[float]
+    predictiveScalingMode: Input[str]
+    predictiveScalingTarget: Input[float]
+    predictiveSchedulingBufferTime: int
+    scheduledActions: List[Dict[str, Any]]
+    warmPoolState: Input[str]
+    warmPoolMinSize: Input[float]
+    warmPoolMaxPreparedCapacity: Input[float]
+    refreshMinHealthyPercentage: int
+    refreshCheckpoints: List[int]
+    refreshCheckpointDelay: int
+    refreshInstanceWarmup: int
+    instanceWarmup: int
+    launchHookTimeout: int
+    egressDependencies: List[pulumi.Resource]
+    lookupCache: LookupCache
 
 class Web(pulumi.ComponentResource):
     def __init__(self, name: str, args: WebArgs, opts: Optional[pulumi.ResourceOptions] = None):
-        super().__init__("components:index:Web", name, args, opts)
+        super().__init__("components:index:Web", name, None, opts)
+
+        lookups = args.get("lookupCache") or LookupCache(None, "")
+
+        # instance types of a mixed instances group, the single instance type
+        # otherwise
+        instance_types = args.get("instanceTypes") or []
+        architectures = {"x86_64"} | {instance_architecture(t["instanceType"]) for t in instance_types}
+        if instance_types and args.get("warmPoolState"):
+            raise ValueError("warm pools cannot be used with a mixed instances policy, unset webWarmPoolState")
 
-        # fetch latest amazon linux ami
-        amazon_linux = aws.ec2.get_ami_output(most_recent=True,
-            owners=["amazon"],
-            filters=[{
-                "name": "name",
-                "values": ["amzn2-ami-hvm-*-x86_64-gp2"],
-            }])
+        # pre-baked application image or pinned ami per architecture, the
+        # latest amazon linux ami otherwise when the app is installed at boot
+        image_ids = {
+            "x86_64": args.get("imageId"),
+            "arm64": args.get("arm64ImageId"),
+        }
+        for architecture in architectures:
+            if image_ids.get(architecture) is None:
+                image_ids[architecture] = lookups.ami(["amazon"], AMAZON_LINUX_AMIS[architecture])
 
-        assume_role = aws.iam.get_policy_document_output(statements=[{
+        assume_role = lookups.policy_document([{
             "effect": "Allow",
             "actions": ["sts:AssumeRole"],
             "principals": [{
@@ -38,9 +151,11 @@ class Web(pulumi.ComponentResource):
             }],
         }])
 
+        # iam names are global to the account, prefixed so stacks in other
+        # regions get their own
         ssm_role = aws.iam.Role(f"{name}-ssm_role",
-            name=f"{args["projectName"]}-ssm-role",
-            assume_role_policy=assume_role.json,
+            name_prefix=f"{args["projectName"]}-ssm-",
+            assume_role_policy=assume_role,
             opts = pulumi.ResourceOptions(parent=self))
 
         ssm_core = aws.iam.RolePolicyAttachment(f"{name}-ssm_core",
@@ -48,50 +163,211 @@ class Web(pulumi.ComponentResource):
             policy_arn="arn:aws:iam::aws:policy/AmazonSSMManagedInstanceCore",
             opts = pulumi.ResourceOptions(parent=self))
 
+        # the instance completes its own launch hook and publishes how long
+        # each boot phase took
+        launch_hook_timeout = args.get("launchHookTimeout", 600)
+        if launch_hook_timeout:
+            boot_policy = aws.iam.RolePolicy(f"{name}-boot_policy",
+                role=ssm_role.id,
+                policy=json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": [
+                                "autoscaling:CompleteLifecycleAction",
+                                "autoscaling:DescribeAutoScalingInstances",
+                            ],
+                            "Resource": "*",
+                        },
+                        {
+                            "Effect": "Allow",
+                            "Action": "cloudwatch:PutMetricData",
+                            "Resource": "*",
+                            "Condition": {
+                                "StringEquals": {"cloudwatch:namespace": BOOT_METRICS_NAMESPACE},
+                            },
+                        },
+                    ],
+                }),
+                opts = pulumi.ResourceOptions(parent=self))
+
         ssm_instance_profile = aws.iam.InstanceProfile(f"{name}-ssm_instance_profile",
-            name=f"{args["projectName"]}-ssm-instance-profile",
+            name_prefix=f"{args["projectName"]}-ssm-profile-",
             role=ssm_role.name,
             opts = pulumi.ResourceOptions(parent=self))
 
-        # launch template for autoscaling group
-        web = aws.ec2.LaunchTemplate(f"{name}-web",
-            name_prefix=f"{args["projectName"]}-launch-template",
-            image_id=amazon_linux.id,
-            instance_type=args["instanceType"],
-            key_name=args["keyName"],
-            vpc_security_group_ids=[args["webSecGroupId"]],
-            user_data=args["userData"],
-            iam_instance_profile={
-                "name": ssm_instance_profile.name,
+        # bootstrap with app server tuning; gunicorn runs
+        # nproc * workersPerCpu + 1 workers behind nginx
+        user_data = render_user_data(args["bootstrapScripts"], {
+            **args.get("bootstrapEnv", {}),
+            "APP_MODULE": args.get("appModule", "app:app"),
+            "WORKERS_PER_CPU": args.get("workersPerCpu", 2),
+            "WORKER_THREADS": args.get("workerThreads", 1),
+            "WORKER_TIMEOUT": args.get("workerTimeout", 30),
+            "KEEPALIVE_TIMEOUT": args.get("keepaliveTimeout", 75),
+            "BOOT_PHASES_FILE": BOOT_PHASES_FILE,
+            "BOOT_METRICS_NAMESPACE": BOOT_METRICS_NAMESPACE,
+            "LAUNCH_HOOK_NAME": LAUNCH_HOOK_NAME if launch_hook_timeout else None,
+        })
+
+        # gp3 root volume with provisioned iops and throughput, 1 minute
+        # metrics for target tracking and imdsv2 only; the hop limit of 2
+        # lets containers on the instance reach the metadata service
+        block_device_mappings = [{
+            "device_name": "/dev/xvda",
+            "ebs": {
+                "volume_type": "gp3",
+                "volume_size": args.get("rootVolumeSize", 8),
+                "iops": args.get("rootVolumeIops", 3000),
+                "throughput": args.get("rootVolumeThroughput", 125),
+                "delete_on_termination": "true",
             },
-            opts = pulumi.ResourceOptions(parent=self))
+        }]
+        metadata_options = {
+            "http_endpoint": "enabled",
+            "http_tokens": "required",
+            "http_put_response_hop_limit": args.get("metadataHopLimit", 2),
+        }
+        detailed_monitoring = args.get("detailedMonitoring", True)
+        ebs_optimized = args.get("ebsOptimized")
+
+        # launch template for autoscaling group, plus one per additional
+        # architecture of the mixed instance types
+        launch_templates = {}
+        for architecture in sorted(architectures, key=lambda a: a != "x86_64"):
+            suffix = "" if architecture == "x86_64" else f"_{architecture}"
+            instance_type = args["instanceType"] if architecture == "x86_64" else next(
+                t["instanceType"] for t in instance_types if instance_architecture(t["instanceType"]) == architecture)
+            # credit mode of burstable t instances, unset keeps the family default
+            credit_specification = None
+            if args.get("cpuCredits") and isinstance(instance_type, str) and is_burstable(instance_type):
+                credit_specification = {
+                    "cpu_credits": args["cpuCredits"],
+                }
+            launch_templates[architecture] = aws.ec2.LaunchTemplate(f"{name}-web{suffix}",
+                name_prefix=f"{args["projectName"]}-launch-template{suffix.replace("_", "-")}",
+                image_id=image_ids[architecture],
+                instance_type=instance_type,
+                key_name=args["keyName"],
+                vpc_security_group_ids=[args["webSecGroupId"]],
+                user_data=user_data,
+                iam_instance_profile={
+                    "name": ssm_instance_profile.name,
+                },
+                block_device_mappings=block_device_mappings,
+                ebs_optimized=None if ebs_optimized is None else str(ebs_optimized).lower(),
+                monitoring={
+                    "enabled": detailed_monitoring,
+                },
+                credit_specification=credit_specification,
+                metadata_options=metadata_options,
+                opts = pulumi.ResourceOptions(parent=self))
+        web = launch_templates["x86_64"]
+
+        # on-demand base plus a spot share across weighted instance types,
+        # each type launched from the template of its architecture
+        mixed_instances_policy = None
+        launch_template = {
+            "id": web.id,
+            "version": web.latest_version,
+        }
+        if instance_types:
+            overrides = []
+            for instance_type in instance_types:
+                override = {
+                    "instance_type": instance_type["instanceType"],
+                    "weighted_capacity": str(instance_type.get("weight", 1)),
+                }
+                architecture = instance_architecture(instance_type["instanceType"])
+                if architecture != "x86_64":
+                    override["launch_template_specification"] = {
+                        "launch_template_id": launch_templates[architecture].id,
+                        "version": launch_templates[architecture].latest_version,
+                    }
+                overrides.append(override)
+            mixed_instances_policy = {
+                "launch_template": {
+                    "launch_template_specification": {
+                        "launch_template_id": web.id,
+                        "version": web.latest_version,
+                    },
+                    "overrides": overrides,
+                },
+                "instances_distribution": {
+                    "on_demand_allocation_strategy": "prioritized",
+                    "on_demand_base_capacity": args.get("onDemandBaseCapacity", 0),
+                    "on_demand_percentage_above_base_capacity": args.get("onDemandPercentageAboveBase", 100),
+                    "spot_allocation_strategy": args.get("spotAllocationStrategy", "capacity-optimized"),
+                },
+            }
+            launch_template = None
         # Determine autoscaling configuration with sane defaults if values are
         # not provided via the component arguments.
         desired_capacity = args.get("desiredCapacity", 2)
         min_size = args.get("minSize", desired_capacity)
         max_size = args.get("maxSize", max(desired_capacity * 2, min_size))
 
+        # warm pool of pre-initialized instances, enabled by choosing a pool
+        # state (Stopped, Running or Hibernated)
+        warm_pool = None
+        if args.get("warmPoolState"):
+            warm_pool = {
+                "pool_state": args["warmPoolState"],
+                "min_size": args.get("warmPoolMinSize", 0),
+                "max_group_prepared_capacity": args.get("warmPoolMaxPreparedCapacity"),
+                "instance_reuse_policy": {
+                    "reuse_on_scale_in": True,
+                },
+            }
+
+        # rolling refresh whenever the launch template gets a new version
+        refresh_preferences = {
+            "min_healthy_percentage": args.get("refreshMinHealthyPercentage", 90),
+        }
+        if args.get("refreshInstanceWarmup") is not None:
+            refresh_preferences["instance_warmup"] = str(args["refreshInstanceWarmup"])
+        if args.get("refreshCheckpoints"):
+            refresh_preferences["checkpoint_percentages"] = args["refreshCheckpoints"]
+            refresh_preferences["checkpoint_delay"] = str(args.get("refreshCheckpointDelay", 300))
+
+        # new instances wait in Pending:Wait until the app answers locally, so
+        # they are only counted as capacity once they can serve
+        initial_lifecycle_hooks = None
+        if launch_hook_timeout:
+            initial_lifecycle_hooks = [{
+                "name": LAUNCH_HOOK_NAME,
+                "lifecycle_transition": "autoscaling:EC2_INSTANCE_LAUNCHING",
+                "heartbeat_timeout": launch_hook_timeout,
+                "default_result": "ABANDON",
+            }]
+
         # autoscaling group for web instances
         web_asg = aws.autoscaling.Group(f"{name}-web_asg",
             name_prefix=f"{args["projectName"]}-asg",
             desired_capacity=desired_capacity,
             min_size=min_size,
             max_size=max_size,
-            vpc_zone_identifiers=[
-                args["privSubWeb1"],
-                args["privSubWeb2"],
-            ],
+            vpc_zone_identifiers=args["privSubWebs"],
             target_group_arns=[args["targetGroupArn"]],
-            launch_template={
-                "id": web.id,
-                "version": "$Latest",
+            launch_template=launch_template,
+            mixed_instances_policy=mixed_instances_policy,
+            warm_pool=warm_pool,
+            initial_lifecycle_hooks=initial_lifecycle_hooks,
+            default_instance_warmup=args.get("instanceWarmup"),
+            enabled_metrics=GROUP_METRICS if detailed_monitoring else None,
+            metrics_granularity="1Minute",
+            instance_refresh={
+                "strategy": "Rolling",
+                "preferences": refresh_preferences,
             },
             tags=[{
                 "key": "Name",
                 "value": f"{args["projectName"]}-web",
                 "propagate_at_launch": True,
             }],
-            opts = pulumi.ResourceOptions(parent=self))
+            # instances need egress to bootstrap before they turn healthy
+            opts = pulumi.ResourceOptions(parent=self, depends_on=args.get("egressDependencies")))
 
         # tracking policy based on average CPU utilization
         cpu_target = args.get("cpuTarget", 50)
@@ -107,6 +383,67 @@ class Web(pulumi.ComponentResource):
             },
             opts = pulumi.ResourceOptions(parent=self))
 
+        # alb target group label used by the request count metrics
+        alb_resource_label = None
+        if args.get("albArnSuffix") is not None and args.get("targetGroupArnSuffix") is not None:
+            alb_resource_label = pulumi.Output.concat(
+                args["albArnSuffix"], "/", args["targetGroupArnSuffix"])
+
+        # tracking policy based on ALB requests per target
+        if args.get("requestCountTarget") and alb_resource_label is not None:
+            request_count_policy = aws.autoscaling.Policy(f"{name}-request_count_target",
+                name=f"{args["projectName"]}-request-count-policy",
+                autoscaling_group_name=web_asg.name,
+                policy_type="TargetTrackingScaling",
+                target_tracking_configuration={
+                    "predefined_metric_specification": {
+                        "predefined_metric_type": "ALBRequestCountPerTarget",
+                        "resource_label": alb_resource_label,
+                    },
+                    "target_value": args["requestCountTarget"],
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+
+        # predictive policy forecasting the daily load pattern, on request
+        # count when the ALB is known, otherwise on CPU
+        if args.get("predictiveScalingMode"):
+            if alb_resource_label is not None and args.get("requestCountTarget"):
+                metric_pair = {
+                    "predefined_metric_type": "ALBRequestCount",
+                    "resource_label": alb_resource_label,
+                }
+                predictive_target = args.get("predictiveScalingTarget") or args["requestCountTarget"]
+            else:
+                metric_pair = {
+                    "predefined_metric_type": "ASGCPUUtilization",
+                }
+                predictive_target = args.get("predictiveScalingTarget") or cpu_target
+            predictive_policy = aws.autoscaling.Policy(f"{name}-predictive",
+                name=f"{args["projectName"]}-predictive-policy",
+                autoscaling_group_name=web_asg.name,
+                policy_type="PredictiveScaling",
+                predictive_scaling_configuration={
+                    "mode": args["predictiveScalingMode"],
+                    "scheduling_buffer_time": str(args.get("predictiveSchedulingBufferTime", 300)),
+                    "metric_specification": {
+                        "target_value": predictive_target,
+                        "predefined_metric_pair_specification": metric_pair,
+                    },
+                },
+                opts = pulumi.ResourceOptions(parent=self))
+
+        # scheduled capacity changes, e.g. ahead of the daily peak
+        for action in args.get("scheduledActions") or []:
+            aws.autoscaling.Schedule(f"{name}-schedule_{action["name"]}",
+                scheduled_action_name=f"{args["projectName"]}-{action["name"]}",
+                autoscaling_group_name=web_asg.name,
+                recurrence=action["recurrence"],
+                time_zone=action.get("timeZone"),
+                min_size=action.get("minSize"),
+                max_size=action.get("maxSize"),
+                desired_capacity=action.get("desiredCapacity"),
+                opts = pulumi.ResourceOptions(parent=self))
+
         self.autoscalingGroupName = web_asg.name
         self.register_outputs({
             'autoscalingGroupName': web_asg.name